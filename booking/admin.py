@@ -1,7 +1,175 @@
+import json
+
+from django import forms
 from django.contrib import admin
-from django.db.models import Exists, OuterRef
-from django.utils import timezone
-from .models import Room, Booking, ContactMessage, Payment
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from . import exports, inventory, occupancy, status_changes
+from .imports import iter_records, run_import, text_stream
+from .invoice_export import iter_invoice_zip
+from .models import ArchivedBooking, ArchivedPayment, RateRule, Room, RoomUnit, Booking, ContactMessage, Payment
+
+
+# Below this many rows (by the planner's estimate) an exact COUNT(*) is cheap enough.
+EXACT_COUNT_THRESHOLD = 10000
+
+
+def _planner_estimate(queryset):
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes PostgreSQL's row estimate instead of COUNT(*) on big tables.
+
+    The page links for the last pages may be off by a few; every other database, and
+    small result sets, get the exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = _planner_estimate(queryset)
+            if estimate >= EXACT_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class ScalableChangeList(ChangeList):
+    def get_results(self, request):
+        # Only the rows shown are trimmed; admin actions still get full instances.
+        if self.model_admin.changelist_only:
+            self.queryset = self.queryset.only(*self.model_admin.changelist_only)
+        super().get_results(request)
+
+
+class ScalableAdminMixin:
+    """Changelist settings for tables with millions of rows.
+
+    No full-table COUNT(*) next to the filtered one, estimated counts on PostgreSQL,
+    no per-filter facet counts, and ``changelist_only`` columns loaded per row.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    changelist_only = None
+
+    def get_changelist(self, request, **kwargs):
+        return ScalableChangeList
+
+    @property
+    def media(self):
+        media = super().media
+        if any(isinstance(f, type) and issubclass(f, AutocompleteListFilter) for f in self.list_filter):
+            media += AutocompleteSelect(None, self.admin_site).media
+            media += forms.Media(js=['js/admin-autocomplete-filter.js'])
+        return media
+
+
+class AutocompleteListFilter(admin.SimpleListFilter):
+    """Filter on a foreign key through the admin's select2 autocomplete, not a full list.
+
+    The related model's admin must define ``search_fields``.
+    """
+
+    template = 'admin/booking/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.field = model._meta.get_field(self.field_name)
+        self.parameter_name = self.field.attname
+        super().__init__(request, params, model, model_admin)
+        self.admin_site = model_admin.admin_site
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+    def choices(self, changelist):
+        # The widget navigates itself; the template only needs the other parameters.
+        yield {'query_string': changelist.get_query_string(remove=[self.parameter_name, 'p'])}
+
+    def widget(self):
+        field = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(self.field, self.admin_site),
+            required=False,
+        )
+        value = self.value() if (self.value() or '').isdigit() else None
+        return field.widget.render(self.parameter_name, value, attrs={'id': f'filter_{self.parameter_name}'})
+
+
+class RoomAutocompleteFilter(AutocompleteListFilter):
+    title = "room"
+    field_name = "room"
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV with a header row, or one JSON object per line.")
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON lines')])
+    dry_run = forms.BooleanField(required=False, initial=True, help_text="Validate every row without saving.")
+
+
+class ImportMixin:
+    """Adds an "Import" page to the changelist for bulk uploads through booking.imports."""
+
+    import_kind = None
+    change_list_template = 'admin/booking/change_list_import.html'
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_view),
+                name=f'{opts.app_label}_{opts.model_name}_import',
+            ),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        result = None
+        form = ImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            result = run_import(
+                self.import_kind,
+                iter_records(text_stream(form.cleaned_data['file']), form.cleaned_data['format']),
+                dry_run=form.cleaned_data['dry_run'],
+            )
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f"Import {self.model._meta.verbose_name_plural}",
+            'form': form,
+            'result': result,
+            'dry_run': form.is_bound and form.cleaned_data.get('dry_run'),
+            # Listing half a million errors helps nobody; the count says the rest.
+            'errors': result.errors[:500] if result else [],
+        }
+        return TemplateResponse(request, 'admin/booking/import.html', context)
 
 
 class RoomOccupancyFilter(admin.SimpleListFilter):
@@ -15,35 +183,30 @@ class RoomOccupancyFilter(admin.SimpleListFilter):
         )
 
     def queryset(self, request, queryset):
-        today = timezone.localdate()
-        booked_room_ids = Booking.objects.filter(
-            status="CONFIRMED",
-            check_out__gt=today,
-            room__isnull=False,
-        ).values_list("room_id", flat=True)
-
+        # Reads the daily stats table: one indexed probe per room instead of scanning bookings.
         if self.value() == "booked":
-            return queryset.filter(id__in=booked_room_ids)
+            return queryset.filter(occupancy.booked_now())
         if self.value() == "available":
-            return queryset.exclude(id__in=booked_room_ids)
+            return queryset.exclude(occupancy.booked_now())
         return queryset
 
 
+class RoomUnitInline(admin.TabularInline):
+    model = RoomUnit
+    extra = 0
+
+
 @admin.register(Room)
-class RoomAdmin(admin.ModelAdmin):
-    list_display = ['title', 'category', 'price', 'size', 'beds', 'booking_status', 'available']
+class RoomAdmin(ImportMixin, admin.ModelAdmin):
+    list_display = ['title', 'category', 'price', 'size', 'beds', 'units', 'booking_status', 'available']
     list_filter = ['category', RoomOccupancyFilter, 'available']
     search_fields = ['title', 'description']
+    inlines = [RoomUnitInline]
+    import_kind = 'rooms'
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        today = timezone.localdate()
-        active_confirmed = Booking.objects.filter(
-            room=OuterRef("pk"),
-            status="CONFIRMED",
-            check_out__gt=today,
-        )
-        return qs.annotate(is_booked=Exists(active_confirmed))
+        return qs.annotate(is_booked=occupancy.booked_now())
 
     @admin.display(description="Status", ordering="is_booked")
     def booking_status(self, obj):
@@ -51,14 +214,94 @@ class RoomAdmin(admin.ModelAdmin):
             return "Booked"
         return "Available"
 
+@admin.register(RateRule)
+class RateRuleAdmin(admin.ModelAdmin):
+    list_display = ['name', 'room', 'category', 'start', 'end', 'weekdays', 'price', 'percent', 'priority']
+    list_filter = ['category']
+    search_fields = ['name']
+    autocomplete_fields = ['room']
+
 @admin.register(Booking)
-class BookingAdmin(admin.ModelAdmin):
-    list_display = ['id', 'first_name', 'last_name', 'room', 'check_in', 'check_out', 'status', 'total_price']
-    list_filter = ['status', 'check_in', 'check_out', 'room']
-    search_fields = ['first_name', 'last_name', 'email']
-    date_hierarchy = 'check_in'
-    list_editable = ['status']
+class BookingAdmin(ScalableAdminMixin, ImportMixin, admin.ModelAdmin):
+    list_display = [
+        'id', 'first_name', 'last_name', 'room', 'unit_number', 'check_in', 'check_out', 'status', 'total_price',
+    ]
+    list_filter = ['status', 'check_in', 'check_out', RoomAutocompleteFilter]
+    list_select_related = ['room', 'unit']
+    changelist_only = [
+        'id', 'first_name', 'last_name', 'room__title', 'room__price', 'unit__number', 'check_in', 'check_out',
+        'status', 'total_price',
+    ]
+    # Exact, case-insensitive matches use the upper() indexes; "Jane Doe" matches both names.
+    search_fields = ['=id', '=email', '=first_name', '=last_name']
+    search_help_text = "Booking number, email, or first and/or last name (whole words)."
+    autocomplete_fields = ['user', 'room']
     readonly_fields = ['created_at', 'updated_at', 'total_price']
+    # Status changes go through the bulk actions so the transition rules always apply.
+    actions = [
+        'confirm_bookings', 'cancel_bookings', 'complete_bookings', 'check_in_bookings', 'export_invoices',
+        'export_csv', 'export_jsonl',
+    ]
+    import_kind = 'bookings'
+
+    @admin.display(description="Unit", ordering="unit__number")
+    def unit_number(self, obj):
+        return obj.unit.number if obj.unit_id else "-"
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'unit':
+            kwargs['queryset'] = RoomUnit.objects.select_related('room')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def _set_status(self, request, queryset, status):
+        selected = queryset.count()
+        moved = status_changes.set_booking_status(queryset, status)
+        message = f"{moved} bookings marked {status.lower()}."
+        if selected > moved:
+            message += f" {selected - moved} skipped: their status does not allow it."
+        self.message_user(request, message)
+
+    @admin.action(description="Confirm selected pending bookings", permissions=['change'])
+    def confirm_bookings(self, request, queryset):
+        self._set_status(request, queryset, 'CONFIRMED')
+
+    @admin.action(description="Cancel selected bookings", permissions=['change'])
+    def cancel_bookings(self, request, queryset):
+        self._set_status(request, queryset, 'CANCELLED')
+
+    @admin.action(description="Complete selected confirmed bookings", permissions=['change'])
+    def complete_bookings(self, request, queryset):
+        self._set_status(request, queryset, 'COMPLETED')
+
+    @admin.action(description="Check in: assign a room unit to selected confirmed bookings", permissions=['change'])
+    def check_in_bookings(self, request, queryset):
+        assigned = full = 0
+        for booking in queryset.filter(status='CONFIRMED', unit__isnull=True, room__isnull=False):
+            if inventory.assign_unit(booking) is None:
+                full += 1
+            else:
+                assigned += 1
+        self.message_user(request, f"{assigned} bookings given a unit; {full} had no free unit of their room.")
+
+    @admin.action(description="Download invoices (ZIP)")
+    def export_invoices(self, request, queryset):
+        # Filter the changelist by check-in date and status first, then select all.
+        # Rendered in this worker: forking a process pool from a web request is left to
+        # the export_invoices command.
+        response = StreamingHttpResponse(
+            iter_invoice_zip(queryset, workers=1),
+            content_type='application/zip',
+        )
+        response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
+        return response
+
+    @admin.action(description="Export selected bookings (CSV)")
+    def export_csv(self, request, queryset):
+        return exports.export_response('bookings', queryset, exports.resolve_columns('bookings'), 'csv')
+
+    @admin.action(description="Export selected bookings (JSON lines)")
+    def export_jsonl(self, request, queryset):
+        return exports.export_response('bookings', queryset, exports.resolve_columns('bookings'), 'jsonl')
 
 @admin.register(ContactMessage)
 class ContactMessageAdmin(admin.ModelAdmin):
@@ -67,7 +310,70 @@ class ContactMessageAdmin(admin.ModelAdmin):
     search_fields = ['full_name', 'email', 'subject']
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ['id', 'provider', 'amount', 'currency', 'status', 'booking', 'created_at']
-    list_filter = ['provider', 'status', 'currency', 'created_at']
-    search_fields = ['reference', 'booking__email', 'booking__first_name', 'booking__last_name']
+    # currency has no choices, so filtering on it would run SELECT DISTINCT over the table.
+    list_filter = ['provider', 'status', 'created_at']
+    list_select_related = ['booking']
+    changelist_only = [
+        'id', 'provider', 'amount', 'currency', 'status', 'created_at',
+        'booking__first_name', 'booking__last_name',
+    ]
+    search_fields = ['=id', '=reference', '=booking__id', '=booking__email', '=booking__last_name']
+    search_help_text = "Payment number, provider reference, booking number, guest email or last name."
+    autocomplete_fields = ['booking']
+    readonly_fields = ['raw_compacted_at', 'full_payload']
+    actions = ['mark_succeeded', 'mark_refunded', 'export_csv', 'export_jsonl']
+
+    @admin.display(description="Full provider payload")
+    def full_payload(self, obj):
+        if not obj.raw_payload:
+            return "-"
+        return format_html('<pre>{}</pre>', json.dumps(obj.full_raw_response(), indent=2))
+
+    def _set_status(self, request, queryset, status):
+        updated, moved = status_changes.set_payment_status(queryset, status, request)
+        self.message_user(request, f"{updated} payments marked {status.lower()}; {moved} bookings changed.")
+
+    @admin.action(description="Mark selected payments succeeded", permissions=['change'])
+    def mark_succeeded(self, request, queryset):
+        self._set_status(request, queryset, 'SUCCEEDED')
+
+    @admin.action(description="Mark selected payments refunded", permissions=['change'])
+    def mark_refunded(self, request, queryset):
+        self._set_status(request, queryset, 'REFUNDED')
+
+    @admin.action(description="Export selected payments (CSV)")
+    def export_csv(self, request, queryset):
+        return exports.export_response('payments', queryset, exports.resolve_columns('payments'), 'csv')
+
+    @admin.action(description="Export selected payments (JSON lines)")
+    def export_jsonl(self, request, queryset):
+        return exports.export_response('payments', queryset, exports.resolve_columns('payments'), 'jsonl')
+
+
+class ArchiveAdmin(admin.ModelAdmin):
+    """Read-only: archived rows are history, changed only by archive_history."""
+
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(ArchiveAdmin):
+    list_display = ['id', 'first_name', 'last_name', 'room', 'check_in', 'check_out', 'status', 'total_price']
+    list_filter = ['status']
+    list_select_related = ['room']
+    search_fields = ['=id', '=email', '=last_name']
+
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(ArchiveAdmin):
+    list_display = ['id', 'provider', 'amount', 'currency', 'status', 'booking_id', 'created_at']
+    list_filter = ['provider', 'status']
+    search_fields = ['=id', '=reference', '=booking__id']
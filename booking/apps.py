@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class BookingConfig(AppConfig):
     name = 'booking'
+
+    def ready(self):
+        from . import signals
+
+        post_migrate.connect(signals.backfill_room_stats, sender=self)
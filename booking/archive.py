@@ -0,0 +1,74 @@
+"""Moving finished bookings and their payments out of the live tables.
+
+COMPLETED and CANCELLED bookings that checked out more than ARCHIVE_AFTER_DAYS ago and
+have no pending payment are copied, with their payments and original ids, into
+ArchivedBooking / ArchivedPayment and deleted from Booking / Payment. Each batch is
+its own short transaction, so the live tables are never locked for long and the
+command can be stopped and resumed at any point.
+
+The live-table sweeps, availability checks and admin listings then only see recent
+rows; the guest's booking history, invoices, exports and the occupancy stats read
+the archive tables as well.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedPayment, Booking, Payment
+
+ARCHIVABLE_STATUSES = ('COMPLETED', 'CANCELLED')
+
+
+def archivable(cutoff):
+    return Booking.objects.filter(
+        status__in=ARCHIVABLE_STATUSES, check_out__lt=cutoff,
+    ).exclude(payments__status='PENDING')
+
+
+def cutoff_for(days, today=None):
+    return (today or timezone.localdate()) - timedelta(days=days)
+
+
+def archive_batch(cutoff, batch_size=500):
+    """Archive up to ``batch_size`` of the oldest archivable bookings; return how many."""
+    booking_columns = [field.attname for field in Booking._meta.concrete_fields]
+    payment_columns = [field.attname for field in Payment._meta.concrete_fields]
+    with transaction.atomic():
+        booking_ids = list(
+            archivable(cutoff).order_by('pk').select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size]
+        )
+        if not booking_ids:
+            return 0
+        ArchivedBooking.objects.bulk_create(
+            ArchivedBooking(**row) for row in Booking.objects.filter(pk__in=booking_ids).values(*booking_columns)
+        )
+        payments = Payment.objects.filter(booking_id__in=booking_ids)
+        ArchivedPayment.objects.bulk_create(ArchivedPayment(**row) for row in payments.values(*payment_columns))
+        # Raw deletes skip the per-row post_delete signals: the rows still exist, just
+        # in the archive, so there are no stats or invoices to clean up.
+        payments._raw_delete(payments.db)
+        bookings = Booking.objects.filter(pk__in=booking_ids)
+        bookings._raw_delete(bookings.db)
+    return len(booking_ids)
+
+
+def archive(cutoff, batch_size=500, progress=None, pause=None):
+    """Archive everything that checked out before ``cutoff``, a batch at a time."""
+    total = 0
+    while True:
+        archived = archive_batch(cutoff, batch_size)
+        if not archived:
+            return total
+        total += archived
+        if progress is not None:
+            progress(total)
+        if pause:
+            pause()
+
+
+def bookings_for_user(user):
+    """Live and archived bookings of ``user``, newest first."""
+    live = Booking.objects.filter(user=user).select_related('room').order_by('-created_at')
+    archived = ArchivedBooking.objects.filter(user=user).select_related('room').order_by('-created_at')
+    return sorted([*live, *archived], key=lambda booking: booking.created_at, reverse=True)
@@ -0,0 +1,206 @@
+"""CSS/JS bundles for base.html and the static storage that fingerprints them.
+
+``base.html`` needs a dozen vendor files plus the site's own CSS and JS. With
+ASSET_BUNDLES on (the default when DEBUG is off) the ``asset_bundle`` template tag
+links one stylesheet and one script per bundle instead; with it off, it links the
+source files one by one as before, so they stay easy to debug.
+
+Bundles are built by ``BundleFinder``, so ``collectstatic`` (and ``runserver``) pick
+them up with no extra step. CSS ``url()``s are rewritten relative to ``bundles/``
+and the result is stripped of comments and redundant whitespace; hand-written JS
+loses its indentation and comment lines, the vendor ``.min.js`` files are used as
+shipped. ``ManifestStorage`` then gives every file a content hash in its name,
+which lets WhiteNoise serve it ``immutable`` with a far-future max-age next to its
+gzip (and, with the brotli package installed, brotli) variant.
+"""
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.files.storage import FileSystemStorage
+
+try:
+    from whitenoise.storage import CompressedManifestStaticFilesStorage as _BaseManifestStorage
+except ImportError:
+    from django.contrib.staticfiles.storage import ManifestStaticFilesStorage as _BaseManifestStorage
+
+BUNDLE_DIR = 'bundles'
+
+# Bundle -> source files, in the order base.html loaded them.
+BUNDLES = {
+    'site.css': [
+        'vendor/bootstrap/css/bootstrap.min.css',
+        'vendor/font-awesome/css/font-awesome.min.css',
+        'vendor/animate/animate.min.css',
+        'vendor/slick/slick.css',
+        'vendor/slick/slick-theme.css',
+        'vendor/tempusdominus/css/tempusdominus-bootstrap-4.min.css',
+        'css/hover-style.css',
+        'css/style.css',
+    ],
+    'site.js': [
+        'vendor/jquery/jquery.min.js',
+        'vendor/jquery/jquery-migrate.min.js',
+        'vendor/bootstrap/js/bootstrap.bundle.min.js',
+        'vendor/easing/easing.min.js',
+        'vendor/stickyjs/sticky.js',
+        'vendor/superfish/hoverIntent.js',
+        'vendor/superfish/superfish.min.js',
+        'vendor/wow/wow.min.js',
+        'vendor/slick/slick.min.js',
+        'vendor/tempusdominus/js/moment.min.js',
+        'vendor/tempusdominus/js/moment-timezone.min.js',
+        'vendor/tempusdominus/js/tempusdominus-bootstrap-4.min.js',
+        'js/main.js',
+    ],
+}
+
+# Files every page needs before first paint: (static path, preload "as", type). The
+# query string must be the one the CSS uses, or the browser downloads the file twice.
+PRELOADS = [
+    ('bundles/site.css', 'style', 'text/css'),
+    ('vendor/font-awesome/fonts/fontawesome-webfont.woff2?v=4.7.0', 'font', 'font/woff2'),
+]
+
+CSS_URL = re.compile(r"""url\(\s*(['"]?)(?P<url>[^'")]*)\1\s*\)""")
+CSS_TOKEN = re.compile(r"""/\*.*?\*/|"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'""", re.S)
+SOURCE_MAP = re.compile(r'^\s*//# sourceMappingURL=.*$', re.M)
+
+
+def bundle_path(bundle):
+    return f"{BUNDLE_DIR}/{bundle}"
+
+
+def sources(bundle):
+    """The static paths a page links for ``bundle``."""
+    return [bundle_path(bundle)] if settings.ASSET_BUNDLES else BUNDLES[bundle]
+
+
+def _read(name):
+    path = finders.find(name)
+    if path is None:
+        raise FileNotFoundError(f"Bundle source {name!r} is not in any static directory.")
+    with open(path, encoding='utf-8') as handle:
+        return handle.read()
+
+
+def _rebase_css(css, name):
+    """Point relative ``url()``s of ``name`` at the same files from ``bundles/``."""
+    source_dir = posixpath.dirname(name)
+
+    def rebase(match):
+        url = match.group('url').strip()
+        if not url or url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(source_dir, path))
+        return f'url("{posixpath.relpath(target, BUNDLE_DIR)}{suffix}")'
+
+    return CSS_URL.sub(rebase, css)
+
+
+def _outside_strings(css, squeeze):
+    """Apply ``squeeze`` outside quoted strings; drop comments but keep ``/*!`` licence notices."""
+    parts = []
+    position = 0
+    for match in CSS_TOKEN.finditer(css):
+        parts.append(squeeze(css[position:match.start()]))
+        token = match.group()
+        parts.append(' ' if token.startswith('/*') and not token.startswith('/*!') else token)
+        position = match.end()
+    parts.append(squeeze(css[position:]))
+    return ''.join(parts)
+
+
+def _squeeze_css(css):
+    css = re.sub(r'\s+', ' ', css)
+    # Only around braces, semicolons and commas: a space before ':' can be a descendant selector.
+    css = re.sub(r' ?([{};,]) ?', r'\1', css)
+    return css.replace(';}', '}')
+
+
+def minify_css(css):
+    # Twice: the first pass turns comments into spaces that the second one squeezes.
+    return _outside_strings(_outside_strings(css, lambda text: text), _squeeze_css).strip()
+
+
+def minify_js(js):
+    # Line-based only, and not at all for files with template literals, whose
+    # whitespace is significant.
+    if '`' in js:
+        return js
+    lines = (line.strip() for line in js.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def build(bundle):
+    """Return the text of ``bundle``."""
+    parts = []
+    for name in BUNDLES[bundle]:
+        text = _read(name)
+        if bundle.endswith('.css'):
+            parts.append(minify_css(_rebase_css(text, name)))
+        else:
+            # Vendor source maps are not shipped, and would point at the wrong file anyway.
+            text = SOURCE_MAP.sub('', text)
+            parts.append(text.strip() if name.endswith('.min.js') else minify_js(text))
+    # A leading ';' guards against a source that ends without one.
+    return ('\n' if bundle.endswith('.css') else '\n;').join(parts) + '\n'
+
+
+class BundleFinder(finders.BaseFinder):
+    """Serve and collect the BUNDLES, rebuilt into ASSET_BUILD_DIR when asked for."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.storage = FileSystemStorage(location=settings.ASSET_BUILD_DIR)
+
+    def check(self, **kwargs):
+        return []
+
+    def write(self, bundle):
+        content = build(bundle).encode('utf-8')
+        path = self.storage.path(bundle_path(bundle))
+        try:
+            with open(path, 'rb') as handle:
+                unchanged = handle.read() == content
+        except FileNotFoundError:
+            unchanged = False
+        if not unchanged:
+            # Leaving an identical file alone keeps its mtime, and so runserver's caching.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as handle:
+                handle.write(content)
+        return path
+
+    def find(self, path, find_all=False, **kwargs):
+        find_all = find_all or kwargs.get('all', False)
+        bundle = path[len(BUNDLE_DIR) + 1:] if path.startswith(f"{BUNDLE_DIR}/") else None
+        if bundle not in BUNDLES:
+            return [] if find_all else None
+        full_path = self.write(bundle)
+        return [full_path] if find_all else full_path
+
+    def list(self, ignore_patterns):
+        for bundle in BUNDLES:
+            self.write(bundle)
+            yield bundle_path(bundle), self.storage
+
+
+def _without_source_maps(patterns):
+    return tuple(
+        (extension, tuple(pattern for pattern in rules if 'sourceMappingURL' not in str(pattern)))
+        for extension, rules in patterns
+    )
+
+
+class ManifestStorage(_BaseManifestStorage):
+    """Content-hashed static files, compressed as well when WhiteNoise is installed.
+
+    The vendored libraries ship without their ``.map`` files, so source map
+    comments are left as they are instead of failing ``collectstatic``.
+    """
+
+    patterns = _without_source_maps(_BaseManifestStorage.patterns)
@@ -0,0 +1,493 @@
+"""Async variants of the payment views for the ASGI deployment mode.
+
+Each view mirrors the sync view of the same name in views.py and shares its payload
+building and result handling, so the two modes differ only in how they wait: provider
+calls go through one shared httpx.AsyncClient and the ORM is used through its async
+API. Under uvicorn a single worker can then keep hundreds of provider round trips in
+flight instead of parking one thread per request. Selected with ASYNC_PAYMENT_VIEWS.
+"""
+import asyncio
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import aget_object_or_404, redirect
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import payment_status
+from .models import Booking, Payment
+from .ratelimit import concurrency_limit
+from .views import (
+    MPESA_ACCEPTED,
+    _apply_mpesa_callback,
+    _apply_stripe_intent,
+    _get_booking_amount,
+    _mpesa_error_message,
+    _mpesa_settings_complete,
+    _mpesa_stk_payload,
+    _normalize_mpesa_phone,
+    _parse_mpesa_callback,
+    _paypal_approve_url,
+    _paypal_failure_redirect,
+    _paypal_order_payload,
+    _payment_status_data,
+    _payment_status_response,
+    _payment_status_settled,
+    _payment_status_wait,
+    _send_receipt_email,
+    _stripe_confirm_result,
+    _stripe_intent_payload,
+)
+
+try:
+    import httpx
+except Exception:
+    httpx = None
+
+
+_client = None
+_client_loop = None
+# Tasks that close each client when its loop shuts down; asyncio only keeps weak references.
+_client_closers = set()
+
+
+def _http_client():
+    # One pooled client per event loop, so provider connections are reused across
+    # requests; a uvicorn worker runs a single loop for its whole lifetime.
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client_loop = loop
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(20, connect=5),
+            limits=httpx.Limits(
+                max_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ASYNC_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+        # Under WSGI every async view runs in a loop of its own, which asyncio.run()
+        # ends by cancelling what is left in it: the client is closed with its loop.
+        closer = loop.create_task(_close_with_loop(_client))
+        _client_closers.add(closer)
+        closer.add_done_callback(_client_closers.discard)
+    return _client
+
+
+async def _close_with_loop(client):
+    try:
+        await asyncio.Future()
+    finally:
+        await client.aclose()
+
+
+async def aclose_http_client():
+    global _client, _client_loop
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+_asend_receipt_email = sync_to_async(_send_receipt_email)
+_apayment_status_data = sync_to_async(_payment_status_data)
+# Quoting a booking without a stored total reads the rate calendar.
+_aget_booking_amount = sync_to_async(_get_booking_amount)
+
+
+# Stripe: create payment intent
+@concurrency_limit('payments')
+async def stripe_create_intent(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("Invalid method")
+
+    booking_id = request.POST.get('booking_id')
+    if not booking_id:
+        return JsonResponse({'error': 'Missing booking_id'}, status=400)
+
+    booking = await aget_object_or_404(Booking.objects.select_related('room'), id=booking_id)
+    if not settings.STRIPE_SECRET_KEY:
+        return JsonResponse({'error': 'Stripe not configured'}, status=400)
+    if httpx is None:
+        return JsonResponse({'error': 'Payment dependency not installed'}, status=500)
+
+    amount = await _aget_booking_amount(booking)
+    try:
+        amount_cents = int(Decimal(amount) * 100)
+    except (InvalidOperation, TypeError):
+        return JsonResponse({'error': 'Invalid amount'}, status=400)
+
+    try:
+        response = await _http_client().post(
+            f"{settings.STRIPE_API_BASE}/v1/payment_intents",
+            data=_stripe_intent_payload(booking, amount_cents),
+            auth=(settings.STRIPE_SECRET_KEY, ''),
+            timeout=15,
+        )
+    except Exception:
+        return JsonResponse({'error': 'Unable to reach Stripe'}, status=502)
+
+    if response.status_code >= 300:
+        return JsonResponse({'error': 'Stripe error', 'details': response.text}, status=400)
+
+    intent = response.json()
+    payment = await Payment.objects.acreate(
+        booking=booking,
+        provider='STRIPE',
+        status='PENDING',
+        amount=amount,
+        currency=getattr(settings, 'DEFAULT_CURRENCY', 'KES'),
+        reference=intent.get('id'),
+        raw_response=intent,
+    )
+
+    return JsonResponse({'client_secret': intent.get('client_secret'), 'payment_id': payment.id})
+
+
+# Stripe: confirm intent server-side
+@concurrency_limit('payments')
+async def stripe_confirm(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("Invalid method")
+
+    payment_id = request.POST.get('payment_id')
+    intent_id = request.POST.get('payment_intent_id')
+    if not payment_id or not intent_id:
+        return JsonResponse({'error': 'Missing payment_id or payment_intent_id'}, status=400)
+
+    payment = await aget_object_or_404(
+        Payment.objects.select_related('booking__room'), id=payment_id, provider='STRIPE'
+    )
+    if not settings.STRIPE_SECRET_KEY:
+        return JsonResponse({'error': 'Stripe not configured'}, status=400)
+    if httpx is None:
+        return JsonResponse({'error': 'Payment dependency not installed'}, status=500)
+
+    try:
+        response = await _http_client().get(
+            f"{settings.STRIPE_API_BASE}/v1/payment_intents/{intent_id}",
+            auth=(settings.STRIPE_SECRET_KEY, ''),
+            timeout=15,
+        )
+    except Exception:
+        return JsonResponse({'error': 'Unable to reach Stripe'}, status=502)
+
+    if response.status_code >= 300:
+        return JsonResponse({'error': 'Stripe error', 'details': response.text}, status=400)
+
+    intent = response.json()
+    if _apply_stripe_intent(payment, intent):
+        await payment.booking.asave()
+        await _asend_receipt_email(request, payment.booking)
+    await payment.asave()
+    return JsonResponse(_stripe_confirm_result(payment, intent))
+
+
+@csrf_exempt
+async def stripe_webhook(request):
+    try:
+        event = json.loads(request.body or '{}')
+    except json.JSONDecodeError:
+        return HttpResponseBadRequest("Invalid payload")
+
+    data = event.get('data', {}).get('object', {})
+    if event.get('type') == 'payment_intent.succeeded':
+        payment = await Payment.objects.select_related('booking__room').filter(
+            reference=data.get('id'), provider='STRIPE'
+        ).afirst()
+        if payment:
+            payment.status = 'SUCCEEDED'
+            payment.raw_response = data
+            payment.booking.status = 'CONFIRMED'
+            await payment.booking.asave()
+            await payment.asave()
+            try:
+                await _asend_receipt_email(request, payment.booking)
+            except Exception:
+                pass
+
+    return JsonResponse({'received': True})
+
+
+# PayPal
+async def _paypal_get_access_token():
+    if not settings.PAYPAL_CLIENT_ID or not settings.PAYPAL_CLIENT_SECRET:
+        return None
+    if httpx is None:
+        return None
+
+    try:
+        response = await _http_client().post(
+            f"{settings.PAYPAL_BASE_URL}/v1/oauth2/token",
+            data={'grant_type': 'client_credentials'},
+            auth=(settings.PAYPAL_CLIENT_ID, settings.PAYPAL_CLIENT_SECRET),
+            timeout=15,
+        )
+    except Exception:
+        return None
+    if response.status_code >= 300:
+        return None
+    return response.json().get('access_token')
+
+
+@concurrency_limit('payments')
+async def paypal_create_order(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("Invalid method")
+
+    booking_id = request.POST.get('booking_id')
+    if not booking_id:
+        return HttpResponseBadRequest("Missing booking_id")
+
+    booking = await aget_object_or_404(Booking.objects.select_related('room'), id=booking_id)
+    if httpx is None:
+        messages.error(request, "Payment dependency is not installed.")
+        return redirect('payment_page', booking_id=booking.id)
+    access_token = await _paypal_get_access_token()
+    if not access_token:
+        messages.error(request, "PayPal is not configured.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    amount = await _aget_booking_amount(booking)
+    return_url = request.build_absolute_uri(reverse('paypal_return')) + f"?booking_id={booking.id}"
+    cancel_url = request.build_absolute_uri(reverse('paypal_cancel')) + f"?booking_id={booking.id}"
+
+    try:
+        response = await _http_client().post(
+            f"{settings.PAYPAL_BASE_URL}/v2/checkout/orders",
+            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
+            content=json.dumps(_paypal_order_payload(amount, return_url, cancel_url)),
+            timeout=15,
+        )
+    except Exception:
+        messages.error(request, "PayPal service is unavailable. Please try again.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    if response.status_code >= 300:
+        messages.error(request, "PayPal error. Please try again.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    order = response.json()
+    await Payment.objects.acreate(
+        booking=booking,
+        provider='PAYPAL',
+        status='PENDING',
+        amount=amount,
+        currency=getattr(settings, 'DEFAULT_CURRENCY', 'KES'),
+        reference=order.get('id'),
+        raw_response=order,
+    )
+
+    approve_url = _paypal_approve_url(order)
+    if not approve_url:
+        messages.error(request, "PayPal approval link not found.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    return redirect(approve_url)
+
+
+@concurrency_limit('payments')
+async def paypal_return(request):
+    order_id = request.GET.get('token')
+    booking_id = request.GET.get('booking_id')
+    if not order_id:
+        messages.error(request, "Missing PayPal token.")
+        return _paypal_failure_redirect(booking_id, 'missing_paypal_token')
+
+    if httpx is None:
+        messages.error(request, "Payment dependency is not installed.")
+        return _paypal_failure_redirect(booking_id, 'payment_dependency_missing')
+    access_token = await _paypal_get_access_token()
+    if not access_token:
+        messages.error(request, "PayPal is not configured.")
+        return _paypal_failure_redirect(booking_id, 'paypal_not_configured')
+
+    try:
+        response = await _http_client().post(
+            f"{settings.PAYPAL_BASE_URL}/v2/checkout/orders/{order_id}/capture",
+            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"},
+            timeout=15,
+        )
+    except Exception:
+        messages.error(request, "PayPal service is unavailable. Please try again.")
+        return _paypal_failure_redirect(booking_id, 'paypal_service_unavailable')
+
+    payment = await Payment.objects.select_related('booking__room').filter(
+        reference=order_id, provider='PAYPAL'
+    ).afirst()
+    if response.status_code >= 300:
+        if payment:
+            payment.status = 'FAILED'
+            payment.raw_response = response.text
+            await payment.asave()
+        messages.error(request, "PayPal capture failed.")
+        return _paypal_failure_redirect(payment.booking.id if payment else booking_id, 'paypal_capture_failed')
+
+    if not payment:
+        return redirect('index')
+
+    payment.raw_response = response.json()
+    payment.status = 'SUCCEEDED'
+    payment.booking.status = 'CONFIRMED'
+    await payment.booking.asave()
+    await payment.asave()
+    await _asend_receipt_email(request, payment.booking)
+    return redirect('payment_success', booking_id=payment.booking.id)
+
+
+# M-Pesa
+async def _mpesa_get_access_token():
+    if httpx is None:
+        return None
+    if not settings.MPESA_CONSUMER_KEY or not settings.MPESA_CONSUMER_SECRET:
+        return None
+    auth_url = getattr(settings, "MPESA_AUTH_URL", "")
+    if not auth_url:
+        return None
+
+    try:
+        response = await _http_client().get(
+            auth_url,
+            auth=(settings.MPESA_CONSUMER_KEY, settings.MPESA_CONSUMER_SECRET),
+            timeout=15,
+        )
+    except Exception:
+        return None
+
+    if response.status_code >= 300:
+        return None
+    return (response.json() or {}).get("access_token")
+
+
+@concurrency_limit('payments')
+async def mpesa_stk_push(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("Invalid method")
+
+    booking_id = request.POST.get('booking_id')
+    phone = request.POST.get('phone')
+    if not booking_id or not phone:
+        messages.error(request, "Missing booking or phone number.")
+        return redirect('index')
+
+    booking = await aget_object_or_404(Booking.objects.select_related('room'), id=booking_id)
+    normalized_phone = _normalize_mpesa_phone(phone)
+    if not normalized_phone:
+        messages.error(request, "Invalid phone number. Use format 07XXXXXXXX or 2547XXXXXXXX.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    if httpx is None:
+        messages.error(request, "Payment dependency is not installed.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    if not _mpesa_settings_complete():
+        messages.error(request, "M-Pesa is not configured.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    access_token = await _mpesa_get_access_token()
+    if not access_token:
+        messages.error(request, "Unable to authenticate with M-Pesa.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    amount = await _aget_booking_amount(booking)
+    try:
+        amount_int = max(1, int(Decimal(amount)))
+    except (InvalidOperation, TypeError, ValueError):
+        messages.error(request, "Invalid booking amount for M-Pesa payment.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    payload = _mpesa_stk_payload(booking, normalized_phone, amount_int, timestamp)
+
+    try:
+        response = await _http_client().post(
+            settings.MPESA_STK_URL,
+            headers={
+                "Authorization": f"Bearer {access_token}",
+                "Content-Type": "application/json",
+            },
+            content=json.dumps(payload),
+            timeout=20,
+        )
+    except Exception:
+        messages.error(request, "M-Pesa service is unavailable. Please try again.")
+        return redirect('payment_page', booking_id=booking.id)
+
+    try:
+        response_data = response.json() or {}
+    except Exception:
+        response_data = {"raw_text": response.text}
+
+    if response.status_code >= 300 or response_data.get("ResponseCode") != "0":
+        await Payment.objects.acreate(
+            booking=booking,
+            provider='MPESA',
+            status='FAILED',
+            amount=amount,
+            currency=getattr(settings, 'DEFAULT_CURRENCY', 'KES'),
+            reference=response_data.get("CheckoutRequestID"),
+            raw_response={"request": payload, "response": response_data},
+        )
+        messages.error(request, _mpesa_error_message(response_data, "M-Pesa STK Push failed."))
+        return redirect('payment_page', booking_id=booking.id)
+
+    await Payment.objects.acreate(
+        booking=booking,
+        provider='MPESA',
+        status='PENDING',
+        amount=amount,
+        currency=getattr(settings, 'DEFAULT_CURRENCY', 'KES'),
+        reference=response_data.get("CheckoutRequestID"),
+        raw_response={
+            "request": payload,
+            "response": response_data,
+            "phone": normalized_phone,
+            "merchant_request_id": response_data.get("MerchantRequestID"),
+        },
+    )
+
+    messages.info(
+        request,
+        "STK Push sent to your phone. Complete payment to confirm booking. "
+        "You will be notified once payment is verified.",
+    )
+    return redirect('booking_confirmation', booking_id=booking.id)
+
+
+@csrf_exempt
+async def mpesa_callback(request):
+    callback = _parse_mpesa_callback(request.body)
+    if callback is None:
+        return JsonResponse(MPESA_ACCEPTED)
+
+    payment = await Payment.objects.select_related('booking').filter(
+        provider='MPESA',
+        reference=callback.get("CheckoutRequestID"),
+    ).order_by("-id").afirst()
+
+    if not payment:
+        return JsonResponse(MPESA_ACCEPTED)
+
+    if _apply_mpesa_callback(payment, callback):
+        await payment.booking.asave(update_fields=['status', 'updated_at'])
+    await payment.asave(update_fields=['status', 'raw_response', 'updated_at'])
+
+    return JsonResponse(MPESA_ACCEPTED)
+
+
+async def payment_status_view(request, booking_id):
+    # Same contract as views.payment_status_view, but a held long-poll costs a
+    # suspended coroutine instead of a worker thread.
+    wait = _payment_status_wait(request)
+    since = request.GET.get('since')
+    version = await payment_status.acurrent_version(booking_id)
+    data = await _apayment_status_data(booking_id, version)
+    if wait and since == str(version) and not _payment_status_settled(data):
+        if await payment_status.await_change(booking_id, version, wait):
+            version = await payment_status.acurrent_version(booking_id)
+            data = await _apayment_status_data(booking_id, version)
+    return _payment_status_response(data)
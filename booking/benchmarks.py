@@ -0,0 +1,568 @@
+import json
+import platform
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import rates
+from .models import Booking, Payment, Room
+
+
+BENCHMARK_STAFF_EMAIL = "bench-staff@example.com"
+BENCHMARK_PASSWORD = "bench-password-123"
+
+# Maximum number of SQL queries each route may issue for a single request.
+# Raise a budget only together with the change that needs it.
+QUERY_BUDGETS = {
+    'index': 4,
+    'room_list': 4,
+    # Availability and the stay quotes read the bookings and the rate calendar for the dates.
+    'room_list_dates': 5,
+    'room_detail': 4,
+    'booking_get': 3,
+    'booking_post': 6,
+    'payment_page': 1,
+    'invoice_pdf': 1,
+    'admin_users': 3,
+    'admin_payments': 3,
+    'admin_booked_rooms': 4,
+    'stripe_webhook': 5,
+    'mpesa_callback': 4,
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * (pct / 100)
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def latency_summary(samples_ms):
+    if not samples_ms:
+        return {}
+    return {
+        'min': round(min(samples_ms), 3),
+        'p50': round(percentile(samples_ms, 50), 3),
+        'p90': round(percentile(samples_ms, 90), 3),
+        'p95': round(percentile(samples_ms, 95), 3),
+        'p99': round(percentile(samples_ms, 99), 3),
+        'max': round(max(samples_ms), 3),
+        'mean': round(sum(samples_ms) / len(samples_ms), 3),
+    }
+
+
+def seed_benchmark_data(rooms=24, bookings=500, customers=50):
+    categories = [code for code, _ in Room.ROOM_CATEGORIES]
+    Room.objects.bulk_create(
+        Room(
+            title=f"Benchmark Room {index + 1}",
+            category=categories[index % len(categories)],
+            description="Seeded room used by the route benchmarks.",
+            price=Decimal('80.00') + index * 5,
+            size=300 + index * 10,
+            beds="1 King Bed",
+            capacity=2,
+            available=True,
+        )
+        for index in range(rooms)
+    )
+    room_list = list(Room.objects.order_by('id'))
+    # bulk_create skips the signals, so build the rate calendar a deployment would have.
+    rates.rebuild([room.pk for room in room_list])
+
+    staff = User.objects.create_user(
+        username=BENCHMARK_STAFF_EMAIL,
+        email=BENCHMARK_STAFF_EMAIL,
+        password=BENCHMARK_PASSWORD,
+        first_name="Bench",
+        is_staff=True,
+    )
+    User.objects.bulk_create(
+        User(username=f"guest{index}@example.com", email=f"guest{index}@example.com", first_name="Guest")
+        for index in range(customers)
+    )
+    user_list = list(User.objects.exclude(pk=staff.pk).order_by('id'))
+
+    today = date.today()
+    statuses = ['PENDING', 'CONFIRMED', 'CANCELLED', 'COMPLETED']
+    Booking.objects.bulk_create(
+        Booking(
+            user=user_list[index % len(user_list)] if user_list else None,
+            room=room_list[index % len(room_list)],
+            first_name="Guest",
+            last_name=f"Number {index}",
+            mobile="0712345678",
+            email=f"guest{index % max(customers, 1)}@example.com",
+            check_in=today + timedelta(days=(index % 120) - 60),
+            check_out=today + timedelta(days=(index % 120) - 58),
+            guests=2,
+            status=statuses[index % len(statuses)],
+            total_price=room_list[index % len(room_list)].price * 2,
+        )
+        for index in range(bookings)
+    )
+    booking_list = list(Booking.objects.order_by('id'))
+
+    providers = ['STRIPE', 'PAYPAL', 'MPESA']
+    Payment.objects.bulk_create(
+        Payment(
+            booking=booking,
+            provider=providers[index % len(providers)],
+            status='PENDING',
+            amount=booking.total_price,
+            currency='KES',
+            reference=f"bench-{providers[index % len(providers)].lower()}-{index}",
+            raw_response={'seeded': True},
+        )
+        for index, booking in enumerate(booking_list[: len(booking_list) // 2])
+    )
+
+    return {
+        'staff': staff,
+        'room': room_list[0],
+        'booking': booking_list[0],
+        'stripe_payment': Payment.objects.filter(provider='STRIPE').order_by('id').first(),
+        'mpesa_payment': Payment.objects.filter(provider='MPESA').order_by('id').first(),
+    }
+
+
+def build_scenarios(fixtures):
+    room = fixtures['room']
+    booking = fixtures['booking']
+    today = date.today()
+    # Past every seeded booking, but inside the default rate calendar horizon.
+    far_in = today + timedelta(days=300)
+    far_out = far_in + timedelta(days=2)
+    stripe_reference = fixtures['stripe_payment'].reference if fixtures['stripe_payment'] else 'missing'
+    mpesa_reference = fixtures['mpesa_payment'].reference if fixtures['mpesa_payment'] else 'missing'
+
+    return [
+        {'name': 'index', 'method': 'get', 'path': reverse('index')},
+        {'name': 'room_list', 'method': 'get', 'path': reverse('room_list')},
+        {
+            'name': 'room_list_dates',
+            'method': 'get',
+            'path': reverse('room_list'),
+            'data': {'check_in': far_in.isoformat(), 'check_out': far_out.isoformat()},
+        },
+        {'name': 'room_detail', 'method': 'get', 'path': reverse('room_detail', args=[room.id])},
+        {'name': 'booking_get', 'method': 'get', 'path': reverse('booking'), 'data': {'room': room.id}},
+        {
+            'name': 'booking_post',
+            'method': 'post',
+            'path': reverse('booking'),
+            'data': {
+                'fname': 'Bench',
+                'lname': 'Guest',
+                'mobile': '0712345678',
+                'email': 'bench-guest@example.com',
+                'guests': 2,
+                'room_id': room.id,
+                'date-1': far_in.strftime('%m/%d/%Y'),
+                'date-2': far_out.strftime('%m/%d/%Y'),
+            },
+        },
+        {'name': 'payment_page', 'method': 'get', 'path': reverse('payment_page', args=[booking.id])},
+        {'name': 'invoice_pdf', 'method': 'get', 'path': reverse('invoice_pdf', args=[booking.id])},
+        {'name': 'admin_users', 'method': 'get', 'path': reverse('admin_users'), 'staff': True},
+        {'name': 'admin_payments', 'method': 'get', 'path': reverse('admin_payments'), 'staff': True},
+        {'name': 'admin_booked_rooms', 'method': 'get', 'path': reverse('admin_booked_rooms'), 'staff': True},
+        {
+            'name': 'stripe_webhook',
+            'method': 'post',
+            'path': reverse('stripe_webhook'),
+            'body': json.dumps({
+                'type': 'payment_intent.succeeded',
+                'data': {'object': {'id': stripe_reference, 'status': 'succeeded'}},
+            }),
+        },
+        {
+            'name': 'mpesa_callback',
+            'method': 'post',
+            'path': reverse('mpesa_callback'),
+            'body': json.dumps({
+                'Body': {
+                    'stkCallback': {
+                        'MerchantRequestID': 'bench-merchant',
+                        'CheckoutRequestID': mpesa_reference,
+                        'ResultCode': 0,
+                        'ResultDesc': 'The service request is processed successfully.',
+                        'CallbackMetadata': {
+                            'Item': [
+                                {'Name': 'Amount', 'Value': 1},
+                                {'Name': 'MpesaReceiptNumber', 'Value': 'BENCH0001'},
+                                {'Name': 'PhoneNumber', 'Value': 254712345678},
+                            ]
+                        },
+                    }
+                }
+            }),
+        },
+    ]
+
+
+def _issue(client, scenario):
+    handler = getattr(client, scenario['method'])
+    if 'body' in scenario:
+        return handler(scenario['path'], data=scenario['body'], content_type='application/json')
+    return handler(scenario['path'], scenario.get('data', {}))
+
+
+def run_benchmarks(fixtures, iterations=20, warmup=2, routes=None):
+    # Ask for compressed bodies like a browser, so response sizes are what goes on the wire.
+    anonymous = Client(HTTP_ACCEPT_ENCODING='br, gzip')
+    staff = Client(HTTP_ACCEPT_ENCODING='br, gzip')
+    staff.force_login(fixtures['staff'])
+
+    results = {}
+    # Repeated POSTs from one client would trip the rate limits being measured around, and
+    # the seeded bookings' invoices must not land in the real cache under real booking ids.
+    with tempfile.TemporaryDirectory() as invoice_dir, override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        RATE_LIMITS={},
+        STORAGES={**settings.STORAGES, 'invoices': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': invoice_dir},
+        }},
+    ):
+        for scenario in build_scenarios(fixtures):
+            if routes and scenario['name'] not in routes:
+                continue
+            client = staff if scenario.get('staff') else anonymous
+
+            for _ in range(warmup):
+                _issue(client, scenario)
+
+            samples = []
+            status_code = None
+            for _ in range(iterations):
+                started = time.perf_counter()
+                response = _issue(client, scenario)
+                samples.append((time.perf_counter() - started) * 1000)
+                status_code = response.status_code
+
+            # Query counts and allocations are measured on a separate request so
+            # that tracemalloc overhead does not leak into the latency samples.
+            tracemalloc.start()
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    response = _issue(client, scenario)
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            results[scenario['name']] = {
+                'method': scenario['method'].upper(),
+                'path': scenario['path'],
+                'status': status_code,
+                'iterations': iterations,
+                'latency_ms': latency_summary(samples),
+                'queries': len(queries.captured_queries),
+                'peak_memory_kb': round(peak_bytes / 1024, 1),
+                'response_bytes': len(getattr(response, 'content', b'') or b''),
+                # Before minification/compression, and the encoding applied (see compression.py).
+                'uncompressed_bytes': (getattr(response.wsgi_request, 'response_bytes', None) or {}).get('original'),
+                'encoding': response.get('Content-Encoding'),
+            }
+    return {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'warmup': warmup,
+        },
+        'routes': results,
+    }
+
+
+def check_budgets(report, budgets=None):
+    budgets = QUERY_BUDGETS if budgets is None else budgets
+    violations = []
+    for name, result in report['routes'].items():
+        budget = budgets.get(name)
+        if budget is not None and result['queries'] > budget:
+            violations.append(f"{name}: {result['queries']} queries (budget {budget})")
+        if result['status'] == 500:
+            violations.append(f"{name}: HTTP {result['status']}")
+    return violations
+
+
+def compare_reports(current, baseline):
+    rows = []
+    for name, result in current['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if not previous:
+            continue
+        before = previous['latency_ms'].get('p50')
+        after = result['latency_ms'].get('p50')
+        change = None
+        if before:
+            change = round((after - before) / before * 100, 1)
+        rows.append({
+            'route': name,
+            'p50_before': before,
+            'p50_after': after,
+            'p50_change_pct': change,
+            'queries_before': previous.get('queries'),
+            'queries_after': result['queries'],
+        })
+    return rows
+
+
+def benchmark_connection_reuse(iterations=200, alias='default', conn_max_age=None):
+    """Time the database part of a request lifecycle: request_started, one query, request_finished.
+
+    ``conn_max_age=0`` reproduces a fresh connection per request, without the pool;
+    ``None`` keeps the configured CONN_MAX_AGE / pool settings.
+    """
+    db = connections[alias]
+    original_max_age = db.settings_dict.get('CONN_MAX_AGE', 0)
+    original_options = db.settings_dict.get('OPTIONS', {})
+    if conn_max_age is not None:
+        db.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    if conn_max_age == 0 and 'pool' in original_options:
+        # Through the pool, request_finished only hands the connection back; nothing is reopened.
+        db.settings_dict['OPTIONS'] = {key: value for key, value in original_options.items() if key != 'pool'}
+    db.close()
+
+    opened = []
+
+    def _count(sender, connection, **kwargs):
+        if connection.alias == alias:
+            opened.append(1)
+
+    connection_created.connect(_count)
+    samples = []
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            request_started.send(sender=None)
+            with db.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+            request_finished.send(sender=None)
+            samples.append((time.perf_counter() - started) * 1000)
+    finally:
+        connection_created.disconnect(_count)
+        db.close()
+        db.settings_dict['CONN_MAX_AGE'] = original_max_age
+        db.settings_dict['OPTIONS'] = original_options
+
+    return {
+        'iterations': iterations,
+        'connections_opened': len(opened),
+        'latency_ms': latency_summary(samples),
+    }
+
+
+def benchmark_cache(cache, iterations=1000, value_bytes=512):
+    payload = 'x' * value_bytes
+    keys = [f'cache-bench:{index}' for index in range(iterations)]
+    timings = {'set': [], 'get': [], 'get_miss': [], 'incr': []}
+
+    for key in keys:
+        started = time.perf_counter()
+        cache.set(key, payload, 60)
+        timings['set'].append((time.perf_counter() - started) * 1000)
+    for key in keys:
+        started = time.perf_counter()
+        cache.get(key)
+        timings['get'].append((time.perf_counter() - started) * 1000)
+    for key in keys:
+        started = time.perf_counter()
+        cache.get(f'{key}:missing')
+        timings['get_miss'].append((time.perf_counter() - started) * 1000)
+    cache.set('cache-bench:counter', 0, 60)
+    for _ in keys:
+        started = time.perf_counter()
+        cache.incr('cache-bench:counter')
+        timings['incr'].append((time.perf_counter() - started) * 1000)
+
+    cache.delete_many(keys + ['cache-bench:counter'])
+    return {operation: latency_summary(samples) for operation, samples in timings.items()}
+
+
+def benchmark_payment_modes(booking, requests=200, sync_threads=8, async_concurrency=200, provider_latency_ms=200):
+    """Run ``stripe_create_intent`` against a slow fake Stripe in both serving modes.
+
+    Requests go through Django's WSGI and ASGI handlers with the full MIDDLEWARE, as
+    in production. The sync mode uses a pool of ``sync_threads`` threads, like a
+    gthread gunicorn worker; the async mode drives the ASGI handler from a single
+    event loop with up to ``async_concurrency`` requests in flight, like one uvicorn
+    worker.
+    """
+    import asyncio
+    import io
+    import sys
+    import threading
+    import types
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.core.handlers.asgi import ASGIHandler
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.urls import path
+
+    from . import async_views, views
+    from .fake_providers import FakeProviderConfig, FakeProviderServer, settings_for
+
+    server = FakeProviderServer(('127.0.0.1', 0), FakeProviderConfig(latency_ms=provider_latency_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # booking/urls.py picks the payment views once, at import; each mode gets its own URLconf.
+    def urlconf(view):
+        module = types.ModuleType(f'{__name__}.payment_urls')
+        module.urlpatterns = [path('payments/stripe/create-intent/', view, name='stripe_create_intent')]
+        return module
+
+    url = '/payments/stripe/create-intent/'
+    body = f'booking_id={booking.id}'.encode()
+    csrf_secret = 'b' * 32
+    headers = {
+        'Host': 'testserver',
+        'Origin': 'https://testserver',
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Content-Length': str(len(body)),
+        'Cookie': f'{settings.CSRF_COOKIE_NAME}={csrf_secret}',
+        'X-CSRFToken': csrf_secret,
+    }
+
+    def wsgi_environ():
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': url,
+            'QUERY_STRING': '',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '443',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_TYPE': headers['Content-Type'],
+            'CONTENT_LENGTH': headers['Content-Length'],
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.url_scheme': 'https',
+        }
+        for name, value in headers.items():
+            if name not in ('Content-Type', 'Content-Length'):
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    asgi_scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'https',
+        'path': url,
+        'raw_path': url.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 443),
+    }
+
+    def summarize(mode, workers, samples, statuses, wall_seconds):
+        return {
+            'mode': mode,
+            'workers': workers,
+            'requests': len(samples),
+            'succeeded': statuses.count(200),
+            'wall_seconds': round(wall_seconds, 3),
+            'throughput_rps': round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+            'latency_ms': latency_summary(samples),
+        }
+
+    def run_sync():
+        handler = WSGIHandler()
+        samples, statuses = [], []
+
+        def call():
+            started = time.perf_counter()
+            status = []
+            try:
+                response = handler(wsgi_environ(), lambda line, response_headers: status.append(int(line[:3])))
+                b''.join(response)
+                response.close()
+            finally:
+                connection.close()
+            samples.append((time.perf_counter() - started) * 1000)
+            statuses.append(status[0])
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sync_threads) as pool:
+            for _ in range(requests):
+                pool.submit(call)
+        return summarize('sync', sync_threads, samples, statuses, time.perf_counter() - began)
+
+    async def run_async():
+        handler = ASGIHandler()
+        samples, statuses = [], []
+        limit = asyncio.Semaphore(async_concurrency)
+
+        async def call():
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            status = []
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # The handler listens for a disconnect until the response is sent.
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with limit:
+                started = time.perf_counter()
+                await handler(dict(asgi_scope), receive, send)
+                samples.append((time.perf_counter() - started) * 1000)
+                statuses.append(status[0])
+
+        began = time.perf_counter()
+        try:
+            await asyncio.gather(*(call() for _ in range(requests)))
+        finally:
+            await async_views.aclose_http_client()
+        return summarize('async', async_concurrency, samples, statuses, time.perf_counter() - began)
+
+    overrides = dict(
+        settings_for(server.base_url),
+        STRIPE_SECRET_KEY='sk_test_benchmark',
+        ASYNC_HTTP_MAX_CONNECTIONS=async_concurrency,
+        CONCURRENCY_LIMITS={},
+        # Every request comes from one address; the limiter stays in the stack with no limits.
+        RATE_LIMITS={},
+    )
+    try:
+        with override_settings(**overrides):
+            with override_settings(ROOT_URLCONF=urlconf(views.stripe_create_intent)):
+                results = [run_sync()]
+            with override_settings(ROOT_URLCONF=urlconf(async_views.stripe_create_intent)):
+                results.append(asyncio.run(run_async()))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {
+        'provider_latency_ms': provider_latency_ms,
+        'requests': requests,
+        'results': results,
+    }
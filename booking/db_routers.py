@@ -0,0 +1,49 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+def reading_from_replica():
+    return _read_from_replica.get()
+
+
+def activate_replica_reads(enabled=True):
+    return _read_from_replica.set(enabled)
+
+
+def deactivate_replica_reads(token):
+    _read_from_replica.reset(token)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = activate_replica_reads(enabled)
+    try:
+        yield
+    finally:
+        deactivate_replica_reads(token)
+
+
+class ReplicaRouter:
+    """Send reads to a replica only inside replica_reads(); everything else uses the primary."""
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if replicas and _read_from_replica.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
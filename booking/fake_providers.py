@@ -0,0 +1,298 @@
+"""Local stand-in for the Stripe, PayPal and Daraja (M-Pesa) APIs used by the payment views.
+
+Only the endpoints that booking/views.py calls are implemented. Responses mirror the
+fields the views read, so a site pointed at this server behaves as it would against the
+provider sandboxes, minus the network and rate limits.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+@dataclass
+class FakeProviderConfig:
+    latency_ms: float = 0
+    jitter_ms: float = 0
+    error_rate: float = 0.0
+    callback_delay_ms: float = 500
+    mpesa_result_code: int = 0
+    stripe_intent_status: str = 'succeeded'
+    stripe_webhook_url: str = ''
+    callback_workers: int = 16
+    seed: int | None = None
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Async clients open hundreds of connections at once; the default backlog of 5 drops them.
+    request_queue_size = 1024
+
+    def __init__(self, address, config=None):
+        super().__init__(address, FakeProviderHandler)
+        self.config = config or FakeProviderConfig()
+        self.random = random.Random(self.config.seed)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.intents = {}
+        self.orders = {}
+        self.stats = {'requests': 0, 'errors': 0, 'callbacks_sent': 0, 'callbacks_failed': 0}
+        self.callbacks = ThreadPoolExecutor(max_workers=self.config.callback_workers)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_id(self, prefix):
+        with self.lock:
+            return f"{prefix}{next(self.ids):08d}"
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.config.error_rate
+
+    def simulated_delay(self):
+        with self.lock:
+            jitter = self.random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        delay = max(0.0, self.config.latency_ms + jitter) / 1000
+        if delay:
+            time.sleep(delay)
+
+    def deliver_later(self, url, payload):
+        if not url:
+            return
+        self.callbacks.submit(self._deliver, url, payload)
+
+    def _deliver(self, url, payload):
+        time.sleep(self.config.callback_delay_ms / 1000)
+        request = urllib.request.Request(
+            url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=15) as response:
+                response.read()
+        except Exception:
+            self.count('callbacks_failed')
+            return
+        self.count('callbacks_sent')
+
+    def server_close(self):
+        super().server_close()
+        self.callbacks.shutdown(wait=False, cancel_futures=True)
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    server_version = "FakeProviders/1.0"
+
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        server = self.server
+        parsed = urlparse(self.path)
+        path = parsed.path.rstrip('/')
+        self.query = parse_qs(parsed.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+
+        if path == '/__stats__':
+            return self._json(200, dict(server.stats))
+
+        server.count('requests')
+        server.simulated_delay()
+        if server.should_fail():
+            server.count('errors')
+            return self._json(500, {'error': {'message': 'Simulated provider failure'}})
+
+        routes = [
+            ('POST', '/v1/payment_intents', self.stripe_create_intent),
+            ('GET', '/v1/payment_intents/', self.stripe_retrieve_intent),
+            ('POST', '/v1/oauth2/token', self.paypal_token),
+            ('POST', '/v2/checkout/orders', self.paypal_create_order),
+            ('GET', '/checkoutnow', self.paypal_approve),
+            ('GET', '/oauth/v1/generate', self.mpesa_token),
+            ('POST', '/mpesa/stkpush/v1/processrequest', self.mpesa_stk_push),
+            ('POST', '/mpesa/stkpushquery/v1/query', self.mpesa_stk_query),
+        ]
+        if method == 'POST' and path.startswith('/v2/checkout/orders/') and path.endswith('/capture'):
+            return self.paypal_capture(path.split('/')[4])
+        for route_method, route_path, handler in routes:
+            if method != route_method:
+                continue
+            if route_path.endswith('/') and path.startswith(route_path):
+                return handler(path[len(route_path):])
+            if path == route_path:
+                return handler()
+        return self._json(404, {'error': {'message': f'No fake endpoint for {method} {path}'}})
+
+    def _json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json_body(self):
+        try:
+            return json.loads(self.body or b'{}')
+        except json.JSONDecodeError:
+            return {}
+
+    # Stripe
+    def stripe_create_intent(self):
+        server = self.server
+        form = {key: values[0] for key, values in parse_qs(self.body.decode('utf-8')).items()}
+        intent_id = server.next_id('pi_fake_')
+        intent = {
+            'id': intent_id,
+            'object': 'payment_intent',
+            'amount': int(form.get('amount', 0)),
+            'currency': form.get('currency', 'kes'),
+            'client_secret': f'{intent_id}_secret_fake',
+            'status': 'requires_payment_method',
+            'metadata': {'booking_id': form.get('metadata[booking_id]')},
+            'receipt_email': form.get('receipt_email'),
+        }
+        with server.lock:
+            server.intents[intent_id] = intent
+        if server.config.stripe_webhook_url:
+            server.deliver_later(
+                server.config.stripe_webhook_url,
+                {
+                    'type': 'payment_intent.succeeded',
+                    'data': {'object': dict(intent, status='succeeded')},
+                },
+            )
+        return self._json(200, intent)
+
+    def stripe_retrieve_intent(self, intent_id):
+        server = self.server
+        with server.lock:
+            intent = server.intents.get(intent_id)
+        if intent is None:
+            return self._json(404, {'error': {'message': f'No such payment_intent: {intent_id}'}})
+        return self._json(200, dict(intent, status=server.config.stripe_intent_status))
+
+    # PayPal
+    def paypal_token(self):
+        return self._json(200, {'access_token': 'fake-paypal-token', 'token_type': 'Bearer', 'expires_in': 32400})
+
+    def paypal_create_order(self):
+        server = self.server
+        payload = self._json_body()
+        order_id = server.next_id('FAKEORDER')
+        order = {
+            'id': order_id,
+            'status': 'CREATED',
+            'purchase_units': payload.get('purchase_units', []),
+            'return_url': (payload.get('application_context') or {}).get('return_url', ''),
+            'links': [
+                {'rel': 'self', 'href': f'{server.base_url}/v2/checkout/orders/{order_id}', 'method': 'GET'},
+                {'rel': 'approve', 'href': f'{server.base_url}/checkoutnow?token={order_id}', 'method': 'GET'},
+            ],
+        }
+        with server.lock:
+            server.orders[order_id] = order
+        return self._json(201, order)
+
+    def paypal_approve(self):
+        token = (self.query.get('token') or [''])[0]
+        with self.server.lock:
+            order = self.server.orders.get(token)
+        if order is None or not order['return_url']:
+            return self._json(404, {'error': {'message': 'Unknown order'}})
+        separator = '&' if '?' in order['return_url'] else '?'
+        self.send_response(302)
+        self.send_header('Location', f"{order['return_url']}{separator}{urlencode({'token': token})}")
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def paypal_capture(self, order_id):
+        with self.server.lock:
+            order = self.server.orders.get(order_id)
+            if order is not None:
+                order['status'] = 'COMPLETED'
+        if order is None:
+            return self._json(404, {'name': 'RESOURCE_NOT_FOUND', 'message': 'Unknown order'})
+        return self._json(201, {'id': order_id, 'status': 'COMPLETED', 'purchase_units': order['purchase_units']})
+
+    # M-Pesa (Daraja)
+    def mpesa_token(self):
+        return self._json(200, {'access_token': 'fake-mpesa-token', 'expires_in': '3599'})
+
+    def mpesa_stk_push(self):
+        server = self.server
+        payload = self._json_body()
+        merchant_request_id = server.next_id('fake-merchant-')
+        checkout_request_id = server.next_id('ws_CO_fake_')
+        result_code = server.config.mpesa_result_code
+        callback = {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': result_code,
+            'ResultDesc': 'The service request is processed successfully.' if result_code == 0 else 'Request cancelled by user',
+        }
+        if result_code == 0:
+            callback['CallbackMetadata'] = {
+                'Item': [
+                    {'Name': 'Amount', 'Value': payload.get('Amount')},
+                    {'Name': 'MpesaReceiptNumber', 'Value': checkout_request_id[-10:].upper()},
+                    {'Name': 'TransactionDate', 'Value': int(time.strftime('%Y%m%d%H%M%S'))},
+                    {'Name': 'PhoneNumber', 'Value': payload.get('PhoneNumber')},
+                ]
+            }
+        server.deliver_later(payload.get('CallBackURL'), {'Body': {'stkCallback': callback}})
+        return self._json(200, {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing',
+        })
+
+    def mpesa_stk_query(self):
+        payload = self._json_body()
+        result_code = self.server.config.mpesa_result_code
+        return self._json(200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successsfully',
+            'MerchantRequestID': 'fake-merchant-query',
+            'CheckoutRequestID': payload.get('CheckoutRequestID'),
+            'ResultCode': str(result_code),
+            'ResultDesc': 'The service request is processed successfully.' if result_code == 0 else 'Request cancelled by user',
+        })
+
+
+def settings_for(base_url, callback_base_url=''):
+    base_url = base_url.rstrip('/')
+    values = {
+        'STRIPE_API_BASE': base_url,
+        'PAYPAL_BASE_URL': base_url,
+        'MPESA_AUTH_URL': f'{base_url}/oauth/v1/generate?grant_type=client_credentials',
+        'MPESA_STK_URL': f'{base_url}/mpesa/stkpush/v1/processrequest',
+        'MPESA_STK_QUERY_URL': f'{base_url}/mpesa/stkpushquery/v1/query',
+    }
+    if callback_base_url:
+        values['MPESA_CALLBACK_URL'] = f"{callback_base_url.rstrip('/')}/payments/mpesa/callback/"
+    return values
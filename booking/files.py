@@ -0,0 +1,43 @@
+"""Atomic writes for the derivative caches (room images, invoice PDFs).
+
+Their files are looked up with ``storage.exists(name)`` and then served, so a file
+must never be visible under its final name before it is complete. On a local
+filesystem the bytes go to a temporary file in the same directory that is then
+renamed over the final name, so concurrent renders of the same content simply
+replace each other instead of leaving ``_abc1234`` suffixed twins. Other storages
+(S3 and friends) upload whole objects and keep ``Storage.save``.
+"""
+import os
+import tempfile
+
+from django.core.files.base import ContentFile
+
+TEMP_PREFIX = '.partial-'
+
+
+def save_atomic(storage, name, data):
+    """Store ``data`` at exactly ``name``, replacing what is there; return ``name``."""
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        return storage.save(name, ContentFile(data))
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        # mkstemp creates the file 0600; give it the mode Storage.save would have.
+        os.chmod(temp_path, storage.file_permissions_mode or 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return name
+
+
+def is_temporary(filename):
+    return filename.startswith(TEMP_PREFIX)
@@ -0,0 +1,195 @@
+"""Resized WebP and JPEG derivatives of Room.image, content-addressed on disk.
+
+Uploads are served at whatever size the phone produced; pages use the
+``room_picture`` template tag instead, which points a ``srcset`` at derivatives of
+the sizes the layout needs. A derivative is stored in the ``room_images`` storage
+under ``<digest>/<width>.<ext>``, where the digest covers the source bytes, so a
+URL always names the same bytes and is served with an immutable Cache-Control.
+Replacing the image gives the room a new digest (and new URLs).
+
+Saving a room with a new image renders every derivative after the commit; rooms
+whose image was set some other way get their digest on first render and each
+derivative on first request.
+"""
+import hashlib
+import io
+import re
+from datetime import timedelta
+
+from django.core.files.storage import storages
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .files import is_temporary, save_atomic
+from .models import Room
+
+# Bump when the resizing or encoding changes so new URLs are issued.
+PIPELINE_VERSION = 1
+
+# Rendition -> candidate widths for the srcset and the sizes the layout displays it at.
+RENDITIONS = {
+    'thumbnail': {'widths': (160, 320), 'sizes': '160px'},
+    'card': {'widths': (400, 800), 'sizes': '(max-width: 767px) 100vw, 400px'},
+    'hero': {'widths': (800, 1200, 1600), 'sizes': '(max-width: 767px) 100vw, 50vw'},
+}
+WIDTHS = frozenset(width for rendition in RENDITIONS.values() for width in rendition['widths'])
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'content_type': 'image/webp', 'options': {'quality': 80, 'method': 4}},
+    'jpg': {'format': 'JPEG', 'content_type': 'image/jpeg', 'options': {'quality': 82, 'optimize': True, 'progressive': True}},
+}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+DERIVATIVE_FILENAME = re.compile(r'^\d+\.(?:%s)$' % '|'.join(FORMATS))
+# Temporary files older than this belong to a render that died, not one in progress.
+STALE_TEMP_AGE = timedelta(hours=1)
+
+
+def image_storage():
+    return storages['room_images']
+
+
+def derivative_name(digest, width, fmt):
+    return f"{digest}/{width}.{fmt}"
+
+
+def rendition_widths(rendition, source_width):
+    """Widths of ``rendition`` for a source ``source_width`` pixels wide; never upscaled."""
+    widths = RENDITIONS[rendition]['widths']
+    if not source_width:
+        return list(widths)
+    return sorted({min(width, source_width) for width in widths})
+
+
+def allowed_width(width, source_width):
+    return width == source_width or (width in WIDTHS and (not source_width or width < source_width))
+
+
+def describe(room):
+    """Digest and measure ``room.image`` and store the result on the room."""
+    digest = hashlib.sha256(f"pipeline:{PIPELINE_VERSION}\n".encode('utf-8'))
+    with room.image.open('rb') as source:
+        for chunk in source.chunks():
+            digest.update(chunk)
+        source.seek(0)
+        with Image.open(source) as image:
+            width, height = image.size
+            # EXIF orientation 5-8 means the stored pixels are rotated a quarter turn.
+            if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                width, height = height, width
+    room.image_digest = digest.hexdigest()
+    room.image_width, room.image_height = width, height
+    Room.objects.filter(pk=room.pk).update(
+        image_digest=room.image_digest, image_width=width, image_height=height,
+    )
+    return room.image_digest
+
+
+def ensure_digest(room):
+    """The room's image digest, computed on first use; None if the image cannot be read."""
+    if not room.image:
+        return None
+    if room.image_digest:
+        return room.image_digest
+    try:
+        return describe(room)
+    except (OSError, ValueError):
+        return None
+
+
+def _load(room, width):
+    with room.image.open('rb') as source:
+        image = Image.open(source)
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale; a square box keeps the short
+        # side at least ``width`` whichever way the photo turns out to be rotated.
+        image.draft('RGB', (width, width))
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def render(image, width, fmt):
+    spec = FORMATS[fmt]
+    height = max(1, round(image.height * width / image.width))
+    resized = image.resize((width, height), Image.Resampling.LANCZOS) if width != image.width else image
+    has_alpha = resized.mode in ('RGBA', 'LA') or (resized.mode == 'P' and 'transparency' in resized.info)
+    if spec['format'] == 'JPEG' and has_alpha:
+        rgba = resized.convert('RGBA')
+        flattened = Image.new('RGB', rgba.size, (255, 255, 255))
+        flattened.paste(rgba, mask=rgba.getchannel('A'))
+        resized = flattened
+    else:
+        resized = resized.convert('RGBA' if has_alpha else 'RGB')
+    buffer = io.BytesIO()
+    # Metadata is not copied: EXIF was applied above and may hold the photo's location.
+    resized.save(buffer, spec['format'], **spec['options'])
+    return buffer.getvalue()
+
+
+def _save(storage, name, data):
+    # Served as immutable for a year, so never visible before it is complete.
+    return save_atomic(storage, name, data)
+
+
+def ensure_derivative(room, width, fmt):
+    """Return the storage name of one derivative, rendering it first if needed."""
+    storage = image_storage()
+    name = derivative_name(room.image_digest, width, fmt)
+    if not storage.exists(name):
+        name = _save(storage, name, render(_load(room, width), width, fmt))
+    return name
+
+
+def generate(room):
+    """Render every missing derivative of ``room.image``; return how many were written."""
+    digest = ensure_digest(room)
+    if digest is None:
+        return 0
+    storage = image_storage()
+    image = None
+    written = 0
+    widths = {width for rendition in RENDITIONS for width in rendition_widths(rendition, room.image_width)}
+    for width in sorted(widths, reverse=True):
+        for fmt in FORMATS:
+            name = derivative_name(digest, width, fmt)
+            if storage.exists(name):
+                continue
+            if image is None:
+                image = _load(room, width)
+            _save(storage, name, render(image, width, fmt))
+            written += 1
+    return written
+
+
+def generate_for(room_id):
+    room = Room.objects.filter(pk=room_id).first()
+    if room is not None:
+        generate(room)
+
+
+def prune():
+    """Delete derivatives whose digest no room uses any more; return how many directories.
+
+    In directories still in use, only stray files are removed: suffixed twins left by
+    older versions and temporary files of renders that died.
+    """
+    storage = image_storage()
+    try:
+        directories, _ = storage.listdir('')
+    except FileNotFoundError:
+        return 0
+    in_use = set(Room.objects.exclude(image_digest='').values_list('image_digest', flat=True))
+    stale_before = timezone.now() - STALE_TEMP_AGE
+    removed = 0
+    for directory in directories:
+        for filename in storage.listdir(directory)[1]:
+            name = f"{directory}/{filename}"
+            if directory not in in_use:
+                storage.delete(name)
+            elif is_temporary(filename):
+                if storage.get_modified_time(name) < stale_before:
+                    storage.delete(name)
+            elif not DERIVATIVE_FILENAME.match(filename):
+                storage.delete(name)
+        removed += directory not in in_use
+    return removed
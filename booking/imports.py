@@ -0,0 +1,246 @@
+"""Streaming bulk import of rooms and historical bookings from CSV or JSON lines.
+
+Rows are parsed one at a time, validated against the model fields, and saved with
+``bulk_create`` in batches, each in its own transaction. A bad row is reported with
+its line number and skipped; it never aborts the rest of the file. Booking stays that
+occupy a room (CONFIRMED or COMPLETED) are checked against the stays already in the
+database, archived ones included, and earlier rows of the same file, so no night sells
+more than the room's units. Existing stays are loaded into memory once, so the check
+costs no query per row.
+"""
+import bisect
+import csv
+import heapq
+import io
+import json
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from . import inventory, occupancy
+from .models import ArchivedBooking, Booking, Room
+
+ROOM_FIELDS = ('title', 'category', 'description', 'price', 'size', 'beds', 'available', 'capacity', 'units')
+BOOKING_FIELDS = (
+    'first_name', 'last_name', 'mobile', 'email', 'check_in', 'check_out', 'guests',
+    'special_request', 'status', 'total_price',
+)
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message):
+        self.errors.append((line, message))
+
+
+def iter_records(stream, fmt):
+    """Yield ``(line_number, dict)`` pairs from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield line_number, exc
+                continue
+            yield line_number, record
+    else:
+        raise ValueError(f"Unknown import format {fmt!r}; expected csv or jsonl.")
+
+
+def text_stream(binary):
+    # utf-8-sig drops the BOM spreadsheet programs put in front of CSV exports.
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def _clean_values(record, allowed):
+    values = {}
+    for name in allowed:
+        value = record.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value in (None, ''):
+            continue
+        values[name] = value
+    return values
+
+
+def _validation_message(exc):
+    if hasattr(exc, 'message_dict'):
+        return '; '.join(f"{name}: {' '.join(messages)}" for name, messages in exc.message_dict.items())
+    return ' '.join(exc.messages)
+
+
+class _Stays:
+    """The nights already sold per room, for rejecting stays that would overbook it.
+
+    Single-unit rooms keep sorted, disjoint ``[check_in, check_out)`` intervals. Stays
+    loaded from the database are merged where they already overlap, so a new stay only
+    has to be compared with the interval just before its check-out. Rooms with several
+    units count the stays on each night instead.
+    """
+
+    def __init__(self, units=None):
+        self.units = units or {}
+        self.starts = defaultdict(list)
+        self.ends = defaultdict(list)
+        self.nights = defaultdict(Counter)
+
+    @classmethod
+    def from_database(cls, units=None):
+        """``units`` maps the rooms that do not sell exactly one unit to the units they sell."""
+        stays = cls(units)
+        # Archived stays count too; merged so both streams arrive in (room, check-in) order.
+        rows = heapq.merge(*(
+            model.objects.filter(status__in=occupancy.OCCUPYING_STATUSES, room__isnull=False)
+            .values_list('room_id', 'check_in', 'check_out')
+            .order_by('room_id', 'check_in')
+            .iterator(chunk_size=5000)
+            for model in (Booking, ArchivedBooking)
+        ))
+        for room_id, check_in, check_out in rows:
+            if room_id in stays.units:
+                stays.add(room_id, check_in, check_out)
+                continue
+            starts, ends = stays.starts[room_id], stays.ends[room_id]
+            if ends and check_in < ends[-1]:
+                ends[-1] = max(ends[-1], check_out)
+            else:
+                starts.append(check_in)
+                ends.append(check_out)
+        return stays
+
+    def overlaps(self, room_id, check_in, check_out):
+        """Whether some night of the stay has no unit of the room left."""
+        if room_id in self.units:
+            nights = self.nights[room_id]
+            return any(nights[day] >= self.units[room_id] for day in _each_night(check_in, check_out))
+        index = bisect.bisect_left(self.starts[room_id], check_out)
+        return index > 0 and self.ends[room_id][index - 1] > check_in
+
+    def add(self, room_id, check_in, check_out):
+        if room_id in self.units:
+            self.nights[room_id].update(_each_night(check_in, check_out))
+            return
+        index = bisect.bisect_left(self.starts[room_id], check_in)
+        self.starts[room_id].insert(index, check_in)
+        self.ends[room_id].insert(index, check_out)
+
+
+def _each_night(check_in, check_out):
+    day = check_in
+    while day < check_out:
+        yield day
+        day += timedelta(days=1)
+
+
+def _build_room(record, context):
+    room = Room(**_clean_values(record, ROOM_FIELDS))
+    if 'available' in record and isinstance(record['available'], str):
+        room.available = record['available'].strip().lower() in TRUE_VALUES
+    room.full_clean(exclude=['image'])
+    return room
+
+
+def _build_booking(record, context):
+    booking = Booking(**_clean_values(record, BOOKING_FIELDS))
+    room_ref = (str(record.get('room_id') or '')).strip()
+    room_title = (record.get('room') or '').strip() if isinstance(record.get('room'), str) else ''
+    if room_ref:
+        if not room_ref.isdigit() or int(room_ref) not in context['room_ids']:
+            raise ValidationError({'room_id': [f"No room with id {room_ref}."]})
+        booking.room_id = int(room_ref)
+    elif room_title:
+        if room_title not in context['room_titles']:
+            raise ValidationError({'room': [f"No room titled {room_title!r}."]})
+        booking.room_id = context['room_titles'][room_title]
+
+    booking.full_clean(exclude=['user', 'room'])
+    if booking.check_out <= booking.check_in:
+        raise ValidationError({'check_out': ["Check-out must be after check-in."]})
+    if booking.guests < 1:
+        raise ValidationError({'guests': ["At least one guest is required."]})
+
+    if booking.room_id and booking.status in occupancy.OCCUPYING_STATUSES:
+        stays = context['stays']
+        if stays.overlaps(booking.room_id, booking.check_in, booking.check_out):
+            raise ValidationError({'check_in': ["Overlaps existing confirmed stays in every unit of this room."]})
+        stays.add(booking.room_id, booking.check_in, booking.check_out)
+    return booking
+
+
+IMPORTERS = {
+    'rooms': (Room, _build_room),
+    'bookings': (Booking, _build_booking),
+}
+
+
+def _context(kind):
+    if kind != 'bookings':
+        return {}
+    rooms = list(Room.objects.only('id', 'title', 'units').order_by('id'))
+    room_ids = {room.pk for room in rooms}
+    room_titles = {}
+    for room in rooms:
+        room_titles.setdefault(room.title, room.pk)
+    # The same capacity live bookings get: the active units once a type has RoomUnits.
+    units = {room_id: count for room_id, count in inventory.sellable_units(rooms).items() if count != 1}
+    return {'room_ids': room_ids, 'room_titles': room_titles, 'stays': _Stays.from_database(units)}
+
+
+def run_import(kind, records, batch_size=1000, dry_run=False, max_errors=None, progress=None):
+    """Validate and save ``records`` (from iter_records) as ``kind`` ('rooms' or 'bookings')."""
+    model, build = IMPORTERS[kind]
+    context = _context(kind)
+    result = ImportResult()
+    batch = []
+    # bulk_create sends no post_save, so the occupancy stats are refreshed once at the end.
+    touched = {}
+
+    def flush():
+        if batch and not dry_run:
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=batch_size)
+            if kind == 'bookings':
+                for booking in batch:
+                    if booking.status in occupancy.OCCUPYING_STATUSES:
+                        occupancy.add_span(touched, booking.room_id, occupancy.stay_span(booking.check_in, booking.check_out))
+        result.created += len(batch)
+        batch.clear()
+        if progress is not None:
+            progress(result)
+
+    for line, record in records:
+        result.rows += 1
+        if isinstance(record, Exception):
+            result.add_error(line, f"Invalid JSON: {record}")
+        elif not isinstance(record, dict):
+            result.add_error(line, "Expected an object per line.")
+        else:
+            try:
+                batch.append(build(record, context))
+            except ValidationError as exc:
+                result.add_error(line, _validation_message(exc))
+            except (TypeError, ValueError) as exc:
+                result.add_error(line, str(exc))
+        if max_errors is not None and len(result.errors) >= max_errors:
+            break
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    occupancy.refresh_spans(touched)
+    return result
@@ -0,0 +1,123 @@
+"""Room-type inventory: how many rooms of each type are still free over a stay.
+
+A Room is a bookable type with ``units`` identical rooms. Once the type has RoomUnit
+rows, its active units are sold instead: taking a room out of service sells one
+fewer, and no night is sold that check-in could not fulfil. A night is full when as
+many confirmed stays of the type cover it as it has units, and a stay fits when each
+of its nights has a unit left. Availability is worked out per type from the stays
+that overlap the requested dates, in one query whatever the number of units; the
+physical RoomUnit is only picked at check-in (``assign_unit``).
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Booking, Room, RoomUnit
+
+# Stays that hold a unit. Completed stays are over, pending ones are not yet paid for.
+HOLDING_STATUSES = ('CONFIRMED',)
+
+
+def overlapping(check_in, check_out):
+    return Booking.objects.filter(status__in=HOLDING_STATUSES, check_in__lt=check_out, check_out__gt=check_in)
+
+
+def sellable(room='pk', units='units'):
+    """Expression: the room's active RoomUnits if it has any, else its ``units``.
+
+    ``room`` and ``units`` name the room id and units for the queryset it is used in,
+    e.g. ``sellable('room', 'room__units')`` on a model with a ``room`` foreign key.
+    """
+    active = (
+        RoomUnit.objects.filter(room=OuterRef(room))
+        .values('room')
+        .annotate(active=Count('pk', filter=Q(active=True)))
+        .values('active')
+    )
+    return Coalesce(Subquery(active), F(units), output_field=IntegerField())
+
+
+def sellable_units(rooms):
+    """``{room_id: units that can be sold}`` for Room instances ``rooms``.
+
+    Uses the ``sellable`` annotation of ``with_units_booked`` when present.
+    """
+    counts = {room.pk: room.sellable for room in rooms if hasattr(room, 'sellable')}
+    missing = {room.pk: room.units for room in rooms if room.pk not in counts}
+    if missing:
+        active = (
+            RoomUnit.objects.filter(room_id__in=missing)
+            .values('room_id')
+            .annotate(active=Count('pk', filter=Q(active=True)))
+            .values_list('room_id', 'active')
+        )
+        missing.update(active)
+        counts.update(missing)
+    return counts
+
+
+def peak_booked(room_ids, check_in, check_out):
+    """``{room_id: most units taken on any one night}`` of check_in..check_out."""
+    changes = defaultdict(lambda: defaultdict(int))
+    stays = overlapping(check_in, check_out).filter(room_id__in=room_ids)
+    for room_id, first, end in stays.values_list('room_id', 'check_in', 'check_out'):
+        changes[room_id][max(first, check_in)] += 1
+        changes[room_id][min(end, check_out)] -= 1
+    peaks = {}
+    for room_id, deltas in changes.items():
+        taken = peak = 0
+        for day in sorted(deltas):
+            taken += deltas[day]
+            peak = max(peak, taken)
+        peaks[room_id] = peak
+    return peaks
+
+
+def units_left(rooms, check_in, check_out):
+    """``{room_id: units free on every night}`` for Room instances ``rooms``."""
+    rooms = list(rooms)
+    capacity = sellable_units(rooms)
+    peaks = peak_booked([room.pk for room in rooms], check_in, check_out)
+    return {room.pk: max(capacity[room.pk] - peaks.get(room.pk, 0), 0) for room in rooms}
+
+
+def is_available(room, check_in, check_out):
+    return units_left([room], check_in, check_out)[room.pk] > 0
+
+
+def with_units_booked(queryset, day):
+    """Annotate Rooms with ``sellable`` units, ``units_booked`` on the night of ``day`` and ``is_booked``."""
+    booked = (
+        overlapping(day, day + timedelta(days=1))
+        .filter(room=OuterRef('pk'))
+        .values('room')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return queryset.annotate(sellable=sellable(), units_booked=Coalesce(Subquery(booked), 0)).annotate(
+        is_booked=ExpressionWrapper(Q(units_booked__gte=F('sellable')), output_field=BooleanField()),
+    )
+
+
+def assign_unit(booking):
+    """Give ``booking`` an active RoomUnit of its type that is free for the whole stay.
+
+    Returns the unit, or None when every unit is taken (or the type has none).
+    """
+    with transaction.atomic():
+        # Locking the type serializes check-ins, so two guests never get the same unit.
+        Room.objects.select_for_update().filter(pk=booking.room_id).first()
+        busy = (
+            overlapping(booking.check_in, booking.check_out)
+            .filter(unit__isnull=False, room_id=booking.room_id)
+            .exclude(pk=booking.pk)
+            .values('unit_id')
+        )
+        unit = RoomUnit.objects.filter(room_id=booking.room_id, active=True).exclude(pk__in=busy).first()
+        if unit is not None:
+            booking.unit = unit
+            booking.save(update_fields=['unit', 'updated_at'])
+    return unit
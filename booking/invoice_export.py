@@ -0,0 +1,124 @@
+"""Bulk invoice export: many bookings' PDFs rendered in a process pool into one ZIP.
+
+The ZIP is produced as a stream of byte chunks, so callers can write it to disk or
+hand it to a StreamingHttpResponse; at most ``max_pending`` rendered PDFs are held in
+memory at once. Invoices already in the invoice cache are copied instead of
+re-rendered, and freshly rendered ones are added to it. With ``workers=1`` nothing is
+forked and the PDFs are rendered in the calling thread, as web requests should.
+"""
+import io
+import logging
+import os
+import shutil
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+from .files import save_atomic
+from .invoices import invoice_digest, invoice_lines, invoice_name, invoice_storage, render_invoice
+from .views import _get_booking_amount
+
+logger = logging.getLogger(__name__)
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back out in chunks."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class _InlineExecutor:
+    """The part of ProcessPoolExecutor used here, running each job when it is submitted."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+def archive_name(booking_id):
+    return f"invoice_{booking_id}.pdf"
+
+
+def iter_invoice_zip(bookings, workers=None, progress=None, max_pending=None):
+    """Yield a ZIP of invoices for ``bookings`` (a Booking queryset) as byte chunks.
+
+    ``progress(done, total)`` is called after each invoice is written.
+    """
+    storage = invoice_storage()
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    total = bookings.count()
+    done = 0
+    buffer = _ChunkBuffer()
+
+    def report():
+        if progress is not None:
+            progress(done, total)
+
+    # PDFs are already compressed; storing them avoids spending CPU for nothing.
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else _InlineExecutor()
+    with pool, zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        pending = {}
+
+        def write_finished():
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                booking_id, digest = pending.pop(future)
+                pdf = future.result()
+                archive.writestr(archive_name(booking_id), pdf)
+                name = invoice_name(booking_id, digest)
+                if not storage.exists(name):
+                    save_atomic(storage, name, pdf)
+            return len(finished)
+
+        for booking in bookings.select_related('room').order_by('id').iterator(chunk_size=500):
+            lines = invoice_lines(booking, _get_booking_amount(booking))
+            digest = invoice_digest(lines)
+            cached = invoice_name(booking.id, digest)
+            try:
+                # Opened first, so a file invalidated since exists() never starts a ZIP entry.
+                source = storage.open(cached, 'rb') if storage.exists(cached) else None
+            except FileNotFoundError:
+                source = None
+            if source is not None:
+                with source, archive.open(archive_name(booking.id), 'w') as target:
+                    shutil.copyfileobj(source, target)
+                done += 1
+                report()
+            else:
+                pending[pool.submit(render_invoice, lines)] = (booking.id, digest)
+                while len(pending) >= max_pending:
+                    done += write_finished()
+                    report()
+            if buffer.chunks:
+                yield buffer.drain()
+
+        while pending:
+            done += write_finished()
+            report()
+            yield buffer.drain()
+
+    logger.info("Exported %s invoices", done)
+    yield buffer.drain()
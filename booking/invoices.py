@@ -0,0 +1,96 @@
+"""Invoice PDF rendering with a content-addressed file cache.
+
+An invoice is a pure function of a handful of booking and room fields, so the PDF is
+stored in the ``invoices`` storage under ``<booking_id>/<digest>.pdf`` where the digest
+covers exactly those fields. Any edit produces a new digest (and a new ETag); stale
+files for a booking are removed when the booking or one of its payments is saved.
+"""
+import hashlib
+import io
+
+from django.core.files.storage import storages
+
+from .files import save_atomic
+
+# Bump when the PDF layout changes so previously cached files are not served.
+INVOICE_LAYOUT_VERSION = 1
+
+
+def invoice_storage():
+    return storages['invoices']
+
+
+def invoice_lines(booking, amount):
+    return [
+        f"Booking ID: {booking.id}",
+        f"Name: {booking.first_name} {booking.last_name}",
+        f"Email: {booking.email}",
+        f"Room: {booking.room.title if booking.room else 'N/A'}",
+        f"Check-in: {booking.check_in}",
+        f"Check-out: {booking.check_out}",
+        f"Guests: {booking.guests}",
+        f"Total: {amount}",
+    ]
+
+
+def invoice_digest(lines):
+    payload = "\n".join([f"layout:{INVOICE_LAYOUT_VERSION}", *lines])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def invoice_name(booking_id, digest):
+    return f"{booking_id}/{digest}.pdf"
+
+
+def render_invoice(lines):
+    from reportlab.pdfgen import canvas
+
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer)
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(40, 800, "Royal Hotel Booking Receipt")
+    p.setFont("Helvetica", 12)
+    y = 770
+    for line in lines:
+        p.drawString(40, y, line)
+        y -= 20
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def ensure_invoice(booking_id, lines, digest):
+    """Return the storage name of the cached PDF, rendering it first if needed."""
+    storage = invoice_storage()
+    name = invoice_name(booking_id, digest)
+    if not storage.exists(name):
+        # Atomic, so a concurrent request never opens a half-written PDF.
+        save_atomic(storage, name, render_invoice(lines))
+    return name
+
+
+def open_invoice(booking_id, lines, digest):
+    """Open the PDF for reading, rendering and caching it first if needed.
+
+    ``invalidate_invoices`` (a save in another request) may delete the file between
+    the render and the open; then it is rendered again, and served uncached if even
+    that copy is gone by the time it is opened.
+    """
+    storage = invoice_storage()
+    for _ in range(2):
+        try:
+            return storage.open(ensure_invoice(booking_id, lines, digest), 'rb')
+        except FileNotFoundError:
+            continue
+    return io.BytesIO(render_invoice(lines))
+
+
+def invalidate_invoices(booking_id):
+    storage = invoice_storage()
+    directory = str(booking_id)
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        storage.delete(f"{directory}/{filename}")
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from booking import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed and cancelled bookings (and their payments) that checked out long ago "
+        "into the archive tables, in small batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help="Archive bookings that checked out at least this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        cutoff = archive.cutoff_for(options['older_than_days'])
+        if options['dry_run']:
+            count = archive.archivable(cutoff).count()
+            self.stdout.write(f"{count} bookings checked out before {cutoff} would be archived.")
+            return
+
+        archived = archive.archive(
+            cutoff,
+            batch_size=options['batch_size'],
+            progress=lambda total: self.stdout.write(f"Archived {total} bookings..."),
+            pause=(lambda: time.sleep(options['sleep'])) if options['sleep'] else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} bookings checked out before {cutoff}."))
@@ -0,0 +1,59 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from booking.benchmarks import benchmark_payment_modes, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = "Compare sync (threaded WSGI) and async (ASGI) payment views against a slow fake provider."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8, help="Threads per sync worker.")
+        parser.add_argument('--concurrency', type=int, default=200, help="In-flight requests for the async worker.")
+        parser.add_argument('--provider-latency-ms', type=float, default=200)
+        parser.add_argument('--output', help="Write the JSON report to this path.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        tmpdir = None
+        if connection.vendor == 'sqlite':
+            # An in-memory test database cannot take concurrent writes from several threads.
+            tmpdir = tempfile.TemporaryDirectory()
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmpdir.name) / 'asgi-bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            fixtures = seed_benchmark_data(rooms=4, bookings=20, customers=5)
+            report = benchmark_payment_modes(
+                fixtures['booking'],
+                requests=options['requests'],
+                sync_threads=options['threads'],
+                async_concurrency=options['concurrency'],
+                provider_latency_ms=options['provider_latency_ms'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if tmpdir is not None:
+                tmpdir.cleanup()
+
+        self.stdout.write(
+            f"stripe_create_intent, {report['requests']} requests, provider latency {report['provider_latency_ms']}ms"
+        )
+        for result in report['results']:
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{result['mode']:<6} workers={result['workers']:<4} ok={result['succeeded']:<5} "
+                f"{result['throughput_rps']:>8.1f} req/s  p50={latency['p50']:.1f}ms  p95={latency['p95']:.1f}ms"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,40 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from booking.benchmarks import benchmark_cache
+from room_booking.cache_urls import cache_config_from_url
+
+
+class Command(BaseCommand):
+    help = "Smoke-benchmark get/set/incr latency for each configured cache (and any extra CACHE_URLs)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', action='append', dest='aliases', help="Configured cache alias (repeatable).")
+        parser.add_argument('--url', action='append', dest='urls', default=[],
+                            help="Additional CACHE_URL to measure, e.g. file:///tmp/cache (repeatable).")
+        parser.add_argument('--iterations', type=int, default=1000)
+        parser.add_argument('--value-bytes', type=int, default=512)
+
+    def handle(self, *args, **options):
+        targets = []
+        for alias in options['aliases'] or list(caches.settings):
+            if alias not in caches.settings:
+                raise CommandError(f"Unknown cache alias {alias!r}.")
+            targets.append((alias, caches[alias]))
+        for url in options['urls']:
+            config = cache_config_from_url(url)
+            backend = import_string(config['BACKEND'])(config.get('LOCATION', ''), config)
+            targets.append((url, backend))
+
+        for label, cache in targets:
+            try:
+                result = benchmark_cache(cache, options['iterations'], options['value_bytes'])
+            except Exception as exc:
+                self.stderr.write(f"{label}: {exc}")
+                continue
+            self.stdout.write(f"{label} ({type(cache).__name__})")
+            for operation, latency in result.items():
+                self.stdout.write(
+                    f"  {operation:<9} p50={latency['p50']:.4f}ms p95={latency['p95']:.4f}ms p99={latency['p99']:.4f}ms"
+                )
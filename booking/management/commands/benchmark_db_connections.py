@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from booking.benchmarks import benchmark_connection_reuse
+
+
+class Command(BaseCommand):
+    help = "Compare per-request database connections with the configured persistent/pooled connections."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        db = connections[options['database']]
+        pool = (db.settings_dict.get('OPTIONS') or {}).get('pool')
+        configured = 'pool' if pool else f"CONN_MAX_AGE={db.settings_dict.get('CONN_MAX_AGE', 0)}"
+        self.stdout.write(f"Database: {db.vendor} ({db.settings_dict.get('HOST') or db.settings_dict['NAME']})")
+
+        for label, max_age in (("new connection per request", 0), (f"configured ({configured})", None)):
+            result = benchmark_connection_reuse(
+                iterations=options['iterations'],
+                alias=options['database'],
+                conn_max_age=max_age,
+            )
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{label:<36} connections={result['connections_opened']:<5} "
+                f"p50={latency['p50']:.3f}ms p95={latency['p95']:.3f}ms mean={latency['mean']:.3f}ms"
+            )
@@ -0,0 +1,79 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from booking.benchmarks import (
+    QUERY_BUDGETS,
+    check_budgets,
+    compare_reports,
+    run_benchmarks,
+    seed_benchmark_data,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmark every named booking route against a freshly seeded test database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--rooms', type=int, default=24)
+        parser.add_argument('--bookings', type=int, default=500)
+        parser.add_argument('--route', action='append', dest='routes', help="Only run this route (repeatable).")
+        parser.add_argument('--output', help="Write the JSON report to this path.")
+        parser.add_argument('--compare', help="Previous JSON report to compare p50 latency against.")
+        parser.add_argument('--no-budgets', action='store_true', help="Report query budget violations without failing.")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the benchmark database between runs.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            fixtures = seed_benchmark_data(rooms=options['rooms'], bookings=options['bookings'])
+            report = run_benchmarks(
+                fixtures,
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                routes=options['routes'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        violations = check_budgets(report)
+        report['budgets'] = QUERY_BUDGETS
+        report['budget_violations'] = violations
+
+        for name, result in report['routes'].items():
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name:<20} {result['status']:>3}  p50={latency['p50']:>8.2f}ms  "
+                f"p95={latency['p95']:>8.2f}ms  queries={result['queries']:>3}  "
+                f"peak={result['peak_memory_kb']:>8.1f}KB  "
+                f"bytes={result['uncompressed_bytes'] or result['response_bytes']}->{result['response_bytes']}"
+            )
+
+        if options['compare']:
+            with open(options['compare'], 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            report['comparison'] = compare_reports(report, baseline)
+            for row in report['comparison']:
+                self.stdout.write(
+                    f"{row['route']:<20} p50 {row['p50_before']} -> {row['p50_after']}ms "
+                    f"({row['p50_change_pct']}%), queries {row['queries_before']} -> {row['queries_after']}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
+
+        if violations:
+            for violation in violations:
+                self.stderr.write(f"Budget exceeded: {violation}")
+            if not options['no_budgets']:
+                raise CommandError(f"{len(violations)} route(s) exceeded their budget.")
+        self.stdout.write(self.style.SUCCESS("Benchmark complete."))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from booking.sqlite_benchmark import benchmark_sqlite_concurrency
+
+
+class Command(BaseCommand):
+    help = "Measure multi-process SQLite throughput with the default and production profiles."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+
+    def handle(self, *args, **options):
+        profiles = (
+            ('default (rollback journal, deferred)', {}, False),
+            ('production (WAL, immediate)', settings.SQLITE_PRODUCTION_PRAGMAS, True),
+        )
+        for label, pragmas, immediate in profiles:
+            result = benchmark_sqlite_concurrency(
+                pragmas=pragmas,
+                immediate=immediate,
+                workers=options['workers'],
+                seconds=options['seconds'],
+                write_ratio=options['write_ratio'],
+            )
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{label:<38} reads/s={result['reads_per_second']:<9} writes/s={result['writes_per_second']:<8} "
+                f"locked={result['locked_errors']:<6} p95={latency.get('p95', 0):.2f}ms p99={latency.get('p99', 0):.2f}ms"
+            )
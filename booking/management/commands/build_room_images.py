@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from booking import images
+from booking.models import Room
+
+
+class Command(BaseCommand):
+    help = "Render the resized WebP/JPEG derivatives of every room image that does not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help="Also delete derivatives of images no room uses any more.")
+
+    def handle(self, *args, **options):
+        written = 0
+        for room in Room.objects.exclude(image='').exclude(image__isnull=True).order_by('pk').iterator():
+            if images.ensure_digest(room) is None:
+                self.stderr.write(f"Room {room.pk}: cannot read {room.image.name}.")
+                continue
+            written += images.generate(room)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} image derivatives."))
+        if options['prune']:
+            self.stdout.write(f"Removed derivatives of {images.prune()} old images.")
@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from booking import payloads
+
+
+class Command(BaseCommand):
+    help = (
+        "Replace settled payment payloads older than the retention period with a summary and "
+        "keep the full payload zlib-compressed. Safe to stop and rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.PAYMENT_RAW_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches.")
+        parser.add_argument('--after-id', type=int, default=0,
+                            help="Resume the live payments past this id (printed with each batch).")
+
+    def handle(self, *args, **options):
+        def progress(model, last_pk, count, before, after):
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: up to id {last_pk}; "
+                f"{count} compacted, {before} -> {after} bytes"
+            )
+
+        count, before, after = payloads.compact(
+            options['older_than_days'],
+            batch_size=options['batch_size'],
+            progress=progress,
+            pause=(lambda: time.sleep(options['sleep'])) if options['sleep'] else None,
+            after_pk=options['after_id'],
+        )
+        saved = before - after
+        self.stdout.write(self.style.SUCCESS(f"Compacted {count} payment payloads, saving {saved} bytes."))
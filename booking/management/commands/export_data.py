@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from booking import exports
+
+
+class Command(BaseCommand):
+    help = "Stream bookings or payments to CSV or JSON lines with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', help="File to write (default: stdout).")
+        parser.add_argument('--from', dest='date_from', help="Start date, inclusive (YYYY-MM-DD). "
+                            "Bookings filter on check-in, payments on creation date.")
+        parser.add_argument('--to', dest='date_to', help="End date, inclusive (YYYY-MM-DD).")
+        parser.add_argument('--status', action='append', dest='statuses')
+        parser.add_argument('--provider', action='append', dest='providers', help="Payments only.")
+        parser.add_argument('--include-archived', action='store_true',
+                            help="Also export rows moved to the archive tables (written first).")
+        parser.add_argument('--column', action='append', dest='columns',
+                            help="Columns to include, in order (repeatable). raw_response is only exported when listed.")
+
+    def handle(self, *args, **options):
+        dataset = options['dataset']
+        try:
+            columns = exports.resolve_columns(dataset, options['columns'])
+            queryset = exports.filter_queryset(
+                dataset,
+                date_from=exports.parse_date(options['date_from']),
+                date_to=exports.parse_date(options['date_to']),
+                statuses=options['statuses'],
+                providers=options['providers'],
+                include_archived=options['include_archived'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        chunks = exports.iter_export(dataset, queryset, columns, options['fmt'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(chunks)
+            self.stderr.write(f"Written to {options['output']}")
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.invoice_export import iter_invoice_zip
+from booking.models import Booking
+
+
+class Command(BaseCommand):
+    help = "Render invoices for bookings checking in within a date range into a single ZIP file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the ZIP file to write.")
+        parser.add_argument('--from', dest='date_from', required=True, help="First check-in date (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='date_to', required=True, help="Last check-in date, inclusive (YYYY-MM-DD).")
+        parser.add_argument('--status', action='append', dest='statuses',
+                            help="Only bookings with this status (repeatable). Defaults to CONFIRMED and COMPLETED.")
+        parser.add_argument('--workers', type=int, default=None, help="Render processes (default: CPU count).")
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from'])
+            date_to = date.fromisoformat(options['date_to'])
+        except ValueError as exc:
+            raise CommandError(f"Invalid date: {exc}")
+        statuses = options['statuses'] or ['CONFIRMED', 'COMPLETED']
+        valid = {code for code, _ in Booking.BOOKING_STATUS}
+        unknown = set(statuses) - valid
+        if unknown:
+            raise CommandError(f"Unknown status: {', '.join(sorted(unknown))}")
+
+        bookings = Booking.objects.filter(
+            check_in__gte=date_from,
+            check_in__lte=date_to,
+            status__in=statuses,
+        )
+
+        step = [0]
+
+        def progress(done, total):
+            if done == total or done - step[0] >= 100:
+                step[0] = done
+                self.stdout.write(f"{done}/{total} invoices")
+
+        with open(options['output'], 'wb') as f:
+            for chunk in iter_invoice_zip(bookings, workers=options['workers'], progress=progress):
+                f.write(chunk)
+        self.stdout.write(self.style.SUCCESS(f"Invoices written to {options['output']}"))
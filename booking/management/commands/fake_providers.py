@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from booking.fake_providers import FakeProviderConfig, FakeProviderServer, settings_for
+
+
+class Command(BaseCommand):
+    help = "Run a local stand-in for the Stripe, PayPal and M-Pesa APIs for offline load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Added to every provider response.")
+        parser.add_argument('--jitter-ms', type=float, default=0, help="Random +/- spread around --latency-ms.")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of calls answered with HTTP 500.")
+        parser.add_argument('--callback-delay-ms', type=float, default=500)
+        parser.add_argument('--mpesa-result-code', type=int, default=0, help="0 = paid, 1032 = cancelled by user.")
+        parser.add_argument('--stripe-intent-status', default='succeeded')
+        parser.add_argument('--stripe-webhook-url', default='', help="Deliver payment_intent.succeeded events here.")
+        parser.add_argument('--site-url', default='http://127.0.0.1:8000', help="Used to print MPESA_CALLBACK_URL.")
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        config = FakeProviderConfig(
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            error_rate=options['error_rate'],
+            callback_delay_ms=options['callback_delay_ms'],
+            mpesa_result_code=options['mpesa_result_code'],
+            stripe_intent_status=options['stripe_intent_status'],
+            stripe_webhook_url=options['stripe_webhook_url'],
+            seed=options['seed'],
+        )
+        server = FakeProviderServer((options['host'], options['port']), config)
+        self.stdout.write(f"Fake payment providers listening on {server.base_url}")
+        self.stdout.write("Point the site at it with:")
+        for key, value in settings_for(server.base_url, options['site_url']).items():
+            self.stdout.write(f"  {key}={value}")
+        self.stdout.write(f"Counters: {server.base_url}/__stats__")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.imports import IMPORTERS, iter_records, run_import, text_stream
+
+
+class Command(BaseCommand):
+    help = "Stream rooms or historical bookings from CSV or JSON lines into the database in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help="CSV or .jsonl file to import.")
+        parser.add_argument('--format', dest='fmt', choices=['csv', 'jsonl'],
+                            help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate every row without saving.")
+        parser.add_argument('--max-errors', type=int, default=None, help="Stop after this many bad rows.")
+
+    def handle(self, *args, **options):
+        fmt = options['fmt'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        def progress(result):
+            self.stdout.write(f"{result.rows} rows read, {result.created} valid, {len(result.errors)} errors")
+
+        with open(options['path'], 'rb') as f:
+            result = run_import(
+                options['kind'],
+                iter_records(text_stream(f), fmt),
+                batch_size=options['batch_size'],
+                dry_run=options['dry_run'],
+                max_errors=options['max_errors'],
+                progress=progress,
+            )
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        verb = "validated" if options['dry_run'] else "imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.created} {options['kind']} {verb}, {len(result.errors)} rows rejected."
+        ))
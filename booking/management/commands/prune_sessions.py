@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired database sessions in small batches. Unlike clearsessions this never "
+        "holds a long lock on the session table, so it is safe to run while the site is busy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches.")
+        parser.add_argument('--older-than-days', type=int, default=0,
+                            help="Only delete sessions that expired at least this many days ago.")
+
+    def handle(self, *args, **options):
+        if settings.SESSION_ENGINE not in (
+            'django.contrib.sessions.backends.db',
+            'django.contrib.sessions.backends.cached_db',
+        ):
+            self.stdout.write(f"{settings.SESSION_ENGINE} expires sessions on its own; nothing to prune.")
+            return
+
+        cutoff = timezone.now() - timezone.timedelta(days=options['older_than_days'])
+        expired = Session.objects.filter(expire_date__lt=cutoff)
+        deleted = 0
+        while True:
+            keys = list(expired.values_list('session_key', flat=True)[:options['batch_size']])
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            self.stdout.write(f"Deleted {deleted} expired sessions...")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} expired sessions."))
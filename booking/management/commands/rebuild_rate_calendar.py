@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from booking import rates
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite the NightlyRate calendar from room prices and rate rules for the next "
+        "RATE_CALENDAR_DAYS nights. Run nightly to roll the calendar forward."
+    )
+
+    def handle(self, *args, **options):
+        def progress(room):
+            self.stdout.write(f"Rebuilt rates for {room.title}")
+
+        written = rates.rebuild(progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} nightly rates."))
@@ -0,0 +1,55 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.traffic import capture_files, load_records, replay
+
+
+class Command(BaseCommand):
+    help = "Replay captured traffic against a target instance at one or more speed multipliers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='*', help="Capture files (defaults to everything in TRAFFIC_CAPTURE_DIR).")
+        parser.add_argument('--target', required=True, help="Base URL, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--speed', type=float, action='append', dest='speeds',
+                            help="Replay rate multiplier (repeatable). Defaults to 1, 5 and 10.")
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--limit', type=int, help="Only replay the first N recorded requests.")
+        parser.add_argument('--include-unsafe', action='store_true',
+                            help="Also replay POST requests (bodies are never recorded, so they hit validation).")
+        parser.add_argument('--output', help="Write the JSON report to this path.")
+
+    def handle(self, *args, **options):
+        files = options['files'] or capture_files(settings.TRAFFIC_CAPTURE_DIR)
+        if not files:
+            raise CommandError("No capture files found.")
+        records = load_records(files)
+        if options['limit']:
+            records = records[:options['limit']]
+        if not records:
+            raise CommandError("Capture files contain no requests.")
+
+        reports = []
+        for speed in options['speeds'] or [1.0, 5.0, 10.0]:
+            self.stdout.write(f"Replaying {len(records)} requests at {speed:g}x ...")
+            report = replay(
+                records,
+                options['target'],
+                speed=speed,
+                concurrency=options['concurrency'],
+                include_unsafe=options['include_unsafe'],
+            )
+            reports.append(report)
+            self.stdout.write(f"  {report['requests']} requests, {report.get('achieved_rps')} req/s")
+            for name, route in report['routes'].items():
+                latency = route['latency_ms']
+                self.stdout.write(
+                    f"  {name:<22} n={route['requests']:<6} p50={latency['p50']:>8.2f}ms "
+                    f"p95={latency['p95']:>8.2f}ms p99={latency['p99']:>8.2f}ms errors={route['error_rate']:.2%}"
+                )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'files': files, 'runs': reports}, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}")
@@ -0,0 +1,289 @@
+import json
+import logging
+import os
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import compression
+from .db_routers import activate_replica_reads, deactivate_replica_reads
+from .ratelimit import check_rate_limits, throttled_response
+from .traffic import sanitize_request
+
+try:
+    from whitenoise.middleware import WhiteNoiseMiddleware
+except ImportError:
+    WhiteNoiseMiddleware = None
+
+PRIMARY_PIN_COOKIE = 'db_primary_pin'
+
+
+class TrafficCaptureMiddleware:
+    """Append sanitized request metadata to rotating JSON-lines files for later replay."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRAFFIC_CAPTURE_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        directory = Path(settings.TRAFFIC_CAPTURE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"traffic-{os.getpid()}.jsonl"
+
+        # One file per worker process so rotation never races between gunicorn workers.
+        # Handlers (ASGI and WSGI, test clients) each build the middleware; they share
+        # the process's logger and its file instead of opening one more each time.
+        self.logger = logging.getLogger(f"booking.traffic.{os.getpid()}")
+        if not any(getattr(handler, 'baseFilename', None) == os.path.abspath(path) for handler in self.logger.handlers):
+            for handler in self.logger.handlers:
+                handler.close()
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+                backupCount=settings.TRAFFIC_CAPTURE_BACKUPS,
+                encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.handlers = [handler]
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._log(sanitize_request(request, response, (time.perf_counter() - started) * 1000))
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        duration_ms = (time.perf_counter() - started) * 1000
+        # request.user loads the session and user synchronously; auser() is its async twin.
+        user = await request.auser() if hasattr(request, 'auser') else None
+        self._log(sanitize_request(request, response, duration_ms, user=user))
+        return response
+
+    def _log(self, record):
+        if record is not None:
+            self.logger.info(json.dumps(record, separators=(',', ':')))
+
+
+class ReplicaRoutingMiddleware:
+    """Serve catalog reads from replicas, except for clients that wrote recently.
+
+    Any unsafe request (booking, payment, login, callbacks) pins the client to the
+    primary for REPLICA_STICKY_SECONDS via a cookie, so guests always see their own
+    booking right after creating it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', []):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.read_url_names = set(settings.REPLICA_READ_URL_NAMES)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django would run a sync process_view in a worker thread, whose context the
+            # replica token belongs to; reset() in __acall__ then fails.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request.use_replica = False
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                deactivate_replica_reads(request._replica_token)
+        return self._pin_to_primary(request, response)
+
+    async def __acall__(self, request):
+        request.use_replica = False
+        request._replica_token = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                deactivate_replica_reads(request._replica_token)
+        return self._pin_to_primary(request, response)
+
+    def _pin_to_primary(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and settings.REPLICA_STICKY_SECONDS > 0:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE,
+                '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite='Lax',
+                secure=request.is_secure(),
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self._route(request)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self._route(request)
+        return None
+
+    def _route(self, request):
+        match = request.resolver_match
+        request.use_replica = (
+            request.method in ('GET', 'HEAD')
+            and match is not None
+            and match.url_name in self.read_url_names
+            and PRIMARY_PIN_COOKIE not in request.COOKIES
+        )
+        if request.use_replica:
+            # Reset in __call__ once the response (including template rendering) is built.
+            request._replica_token = activate_replica_reads()
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """Apply the RATE_LIMITS token buckets to unsafe requests, keyed by URL name."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return None
+        match = request.resolver_match
+        limits = settings.RATE_LIMITS.get(match.url_name) if match is not None else None
+        if not limits:
+            return None
+        retry_after = check_rate_limits(request, match.url_name, limits)
+        if retry_after:
+            return throttled_response(request, retry_after)
+        return None
+
+
+class ResponseCompressionMiddleware(MiddlewareMixin):
+    """Minify HTML and gzip/brotli-encode dynamic responses (see booking/compression.py).
+
+    Sizes end up in ``request.response_bytes`` (``original``, ``sent`` and the
+    ``encoding``) for the traffic capture and the route benchmarks. Streamed
+    responses are encoded chunk by chunk; their sizes are not known up front.
+    """
+
+    def __init__(self, get_response):
+        if not (settings.HTML_MINIFY or settings.RESPONSE_COMPRESSION):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_response(self, request, response):
+        # Files (invoices, room images) are already compressed or served by WhiteNoise.
+        if response.has_header('Content-Encoding') or isinstance(response, FileResponse):
+            return response
+        content_type = compression.media_type(response)
+        if content_type not in compression.COMPRESSIBLE_TYPES:
+            return response
+
+        sizes = {'original': None if response.streaming else len(response.content)}
+        if settings.HTML_MINIFY and content_type == 'text/html' and not response.streaming:
+            try:
+                html = response.content.decode(response.charset)
+            except UnicodeDecodeError:
+                html = None
+            if html is not None:
+                response.content = compression.minify_html(html).encode(response.charset)
+        sizes['sent'] = None if response.streaming else len(response.content)
+        sizes['encoding'] = None
+        request.response_bytes = sizes
+
+        if not settings.RESPONSE_COMPRESSION:
+            return self._set_length(response)
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return self._set_length(response)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # get_token() (the {% csrf_token %} tag) and rotate_token() leave this key behind,
+        # even after CsrfViewMiddleware has reset it to False.
+        if 'CSRF_COOKIE_NEEDS_UPDATE' in request.META:
+            return self._set_length(response)
+        encoding = compression.negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return self._set_length(response)
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.compress_async_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compression.compress_stream(response.streaming_content, encoding)
+            del response.headers['Content-Length']
+        else:
+            compressed = compression.compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return self._set_length(response)
+            response.content = compressed
+            sizes['sent'] = len(compressed)
+        sizes['encoding'] = encoding
+        # A strong ETag would now claim byte-for-byte equality with the identity body.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return self._set_length(response)
+
+    @staticmethod
+    def _set_length(response):
+        if not response.streaming and response.has_header('Content-Length'):
+            response.headers['Content-Length'] = str(len(response.content))
+        return response
+
+
+if WhiteNoiseMiddleware is not None:
+
+    class StaticFilesMiddleware(WhiteNoiseMiddleware):
+        """WhiteNoise that stays on the event loop under ASGI.
+
+        WhiteNoiseMiddleware is sync-only, and near the top of MIDDLEWARE it would make
+        Django run every request below it through a worker thread, so async views would
+        hold a thread for as long as they wait on a provider. Only static files, which
+        are read from disk, are served from a thread here.
+        """
+
+        sync_capable = True
+        async_capable = True
+
+        def __init__(self, get_response=None, settings=settings):
+            super().__init__(get_response, settings)
+            self.async_mode = iscoroutinefunction(get_response)
+            if self.async_mode:
+                markcoroutinefunction(self)
+
+        def __call__(self, request):
+            if self.async_mode:
+                return self.__acall__(request)
+            return super().__call__(request)
+
+        async def __acall__(self, request):
+            if self.autorefresh:
+                static_file = await sync_to_async(self.find_file)(request.path_info)
+            else:
+                static_file = self.files.get(request.path_info)
+            if static_file is not None:
+                return await sync_to_async(self.serve)(static_file, request)
+            return await self.get_response(request)
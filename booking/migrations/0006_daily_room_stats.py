@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_changelist_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRoomStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('category', models.CharField(choices=[('STD', 'Standard'), ('PRE', 'Premium'), ('SLV', 'Silver'), ('DLX', 'Deluxe'), ('EXE', 'Executive')], max_length=3)),
+                ('nights_sold', models.PositiveIntegerField(default=0)),
+                ('room_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('payments_collected', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='booking.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'category'], name='daily_room_stats_date_cat_idx')],
+                'constraints': [models.UniqueConstraint(fields=('room', 'date'), name='daily_room_stats_room_date_uniq')],
+            },
+        ),
+    ]
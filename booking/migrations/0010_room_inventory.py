@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_room_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='units',
+            field=models.PositiveIntegerField(default=1, help_text='Identical rooms of this type that can be sold per night'),
+        ),
+        migrations.CreateModel(
+            name='RoomUnit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(help_text='Door number, e.g. 214', max_length=20)),
+                ('active', models.BooleanField(default=True, help_text='Untick while the room is out of service')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='physical_units', to='booking.room')),
+            ],
+            options={
+                'ordering': ['room', 'number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='unit',
+            field=models.ForeignKey(blank=True, help_text='Physical room, assigned at check-in', null=True, on_delete=django.db.models.deletion.SET_NULL, to='booking.roomunit'),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='unit',
+            field=models.ForeignKey(blank=True, help_text='Physical room, assigned at check-in', null=True, on_delete=django.db.models.deletion.SET_NULL, to='booking.roomunit'),
+        ),
+        migrations.AddConstraint(
+            model_name='roomunit',
+            constraint=models.UniqueConstraint(fields=('room', 'number'), name='room_unit_number_unique'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_room_inventory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('category', models.CharField(blank=True, choices=[('STD', 'Standard'), ('PRE', 'Premium'), ('SLV', 'Silver'), ('DLX', 'Deluxe'), ('EXE', 'Executive')], max_length=3)),
+                ('start', models.DateField(blank=True, help_text='First night; empty for no limit', null=True)),
+                ('end', models.DateField(blank=True, help_text='Last night; empty for no limit', null=True)),
+                ('weekdays', models.CharField(blank=True, help_text='ISO weekdays of the nights it covers, e.g. 5,6 for Friday and Saturday nights; empty for all', max_length=20)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, help_text='Fixed nightly rate', max_digits=10, null=True)),
+                ('percent', models.DecimalField(blank=True, decimal_places=2, help_text='Or a change to the room price, e.g. 20 or -15', max_digits=5, null=True)),
+                ('priority', models.IntegerField(default=0)),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rate_rules', to='booking.room')),
+            ],
+            options={
+                'ordering': ['-priority', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='NightlyRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nightly_rates', to='booking.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room', 'date'), name='nightly_rate_room_date_uniq')],
+            },
+        ),
+    ]
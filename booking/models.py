@@ -1,4 +1,6 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
 
 class Room(models.Model):
@@ -17,13 +19,39 @@ class Room(models.Model):
     size = models.IntegerField(help_text="Size in sq ft")
     beds = models.CharField(max_length=50, help_text="e.g. 2 Single(s)")
     image = models.ImageField(upload_to='room/', blank=True, null=True)
+    # Filled in by booking.images: sha256 of the upload and its upright pixel size.
+    image_digest = models.CharField(max_length=64, blank=True, default='', editable=False)
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
     available = models.BooleanField(default=True)
     capacity = models.IntegerField(default=2, help_text="Max guests")
+    # A Room is a bookable room type; guests book the type and get a RoomUnit at check-in.
+    units = models.PositiveIntegerField(default=1, help_text="Identical rooms of this type that can be sold per night")
     
     def __str__(self):
         return f"{self.title} - ${self.price}/night"
 
-class Booking(models.Model):
+
+class RoomUnit(models.Model):
+    """One physical room of a room type, assigned to a booking at check-in."""
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='physical_units')
+    number = models.CharField(max_length=20, help_text="Door number, e.g. 214")
+    active = models.BooleanField(default=True, help_text="Untick while the room is out of service")
+
+    class Meta:
+        ordering = ['room', 'number']
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'number'], name='room_unit_number_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.number} ({self.room.title})"
+
+
+class BookingFields(models.Model):
+    """Columns shared by Booking and ArchivedBooking."""
+
     BOOKING_STATUS = (
         ('PENDING', 'Pending'),
         ('CONFIRMED', 'Confirmed'),
@@ -33,6 +61,10 @@ class Booking(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, blank=True)
+    unit = models.ForeignKey(
+        RoomUnit, on_delete=models.SET_NULL, null=True, blank=True,
+        help_text="Physical room, assigned at check-in",
+    )
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     mobile = models.CharField(max_length=15)
@@ -46,9 +78,29 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        abstract = True
+
+
+class Booking(BookingFields):
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'check_in'], name='booking_status_check_in_idx'),
+            models.Index(fields=['check_in'], name='booking_check_in_idx'),
+            # Case-insensitive admin search (iexact compares UPPER() of both sides).
+            models.Index(Upper('email'), name='booking_email_upper_idx'),
+            models.Index(Upper('last_name'), name='booking_last_name_upper_idx'),
+            models.Index(Upper('first_name'), name='booking_first_name_upper_idx'),
+        ]
+
     def __str__(self):
         return f"Booking #{self.id} - {self.first_name} {self.last_name}"
 
+    def clean(self):
+        super().clean()
+        if self.unit_id and self.room_id and self.unit.room_id != self.room_id:
+            raise ValidationError({'unit': "This unit belongs to another room."})
+
 class ContactMessage(models.Model):
     full_name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -60,7 +112,9 @@ class ContactMessage(models.Model):
     def __str__(self):
         return f"Message from {self.full_name} - {self.subject}"
 
-class Payment(models.Model):
+class PaymentFields(models.Model):
+    """Columns shared by Payment and ArchivedPayment."""
+
     PROVIDERS = (
         ('STRIPE', 'Stripe'),
         ('PAYPAL', 'PayPal'),
@@ -74,15 +128,166 @@ class Payment(models.Model):
         ('REFUNDED', 'Refunded'),
     )
 
-    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='payments')
     provider = models.CharField(max_length=20, choices=PROVIDERS)
     status = models.CharField(max_length=20, choices=STATUSES, default='PENDING')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=3, default='KES')
     reference = models.CharField(max_length=100, blank=True, null=True)
     raw_response = models.JSONField(blank=True, null=True)
+    # Set by compact_payment_payloads: raw_response becomes a summary, this the full payload.
+    raw_payload = models.BinaryField(blank=True, null=True, editable=False)
+    raw_compacted_at = models.DateTimeField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        abstract = True
+
+    def full_raw_response(self):
+        """The provider payload as received, also once it has been compacted."""
+        if self.raw_payload:
+            from .payloads import decompress
+
+            return decompress(self.raw_payload)
+        return self.raw_response
+
+
+class Payment(PaymentFields):
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='payments')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['reference'], name='payment_reference_idx'),
+            models.Index(fields=['status', 'created_at'], name='payment_status_created_idx'),
+            models.Index(fields=['provider', 'created_at'], name='payment_provider_created_idx'),
+            models.Index(fields=['created_at'], name='payment_created_at_idx'),
+        ]
+
     def __str__(self):
         return f"{self.provider} {self.amount} {self.currency} - {self.status}"
+
+class DailyRoomStats(models.Model):
+    """One room's sold nights, room revenue and collected payments for one day.
+
+    Kept up to date by booking.occupancy from Booking and Payment changes and rebuilt
+    nightly by ``rebuild_room_stats``. Only days with activity have a row.
+    """
+    date = models.DateField()
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='daily_stats')
+    category = models.CharField(max_length=3, choices=Room.ROOM_CATEGORIES)
+    nights_sold = models.PositiveIntegerField(default=0)
+    room_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payments_collected = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='daily_room_stats_room_date_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'category'], name='daily_room_stats_date_cat_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} on {self.date}: {self.nights_sold} sold"
+
+
+class RateRule(models.Model):
+    """A seasonal, weekday or one-off nightly rate for a room, a category or every room.
+
+    On each night the matching rule with the highest priority wins (a room rule beats a
+    category rule, which beats a rule for every room, on equal priority); without one
+    the room's own ``price`` applies. booking.rates materializes the result into
+    NightlyRate.
+    """
+    name = models.CharField(max_length=100)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, blank=True, related_name='rate_rules')
+    category = models.CharField(max_length=3, choices=Room.ROOM_CATEGORIES, blank=True)
+    start = models.DateField(null=True, blank=True, help_text="First night; empty for no limit")
+    end = models.DateField(null=True, blank=True, help_text="Last night; empty for no limit")
+    weekdays = models.CharField(
+        max_length=20, blank=True,
+        help_text="ISO weekdays of the nights it covers, e.g. 5,6 for Friday and Saturday nights; empty for all",
+    )
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Fixed nightly rate")
+    percent = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, blank=True,
+        help_text="Or a change to the room price, e.g. 20 or -15",
+    )
+    priority = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-priority', 'name']
+
+    def __str__(self):
+        return self.name
+
+    def weekday_numbers(self):
+        return {int(day) for day in self.weekdays.split(',') if day.strip()}
+
+    def clean(self):
+        super().clean()
+        if (self.price is None) == (self.percent is None):
+            raise ValidationError("Give either a fixed price or a percentage, not both.")
+        if self.room_id and self.category:
+            raise ValidationError("A rule is for one room or one category, not both.")
+        if self.start and self.end and self.end < self.start:
+            raise ValidationError({'end': "The last night is before the first."})
+        if self.percent is not None and self.percent <= -100:
+            raise ValidationError({'percent': "A discount of 100% or more would make the night free or negative."})
+        try:
+            days = self.weekday_numbers()
+        except ValueError:
+            days = {0}
+        if not days <= set(range(1, 8)):
+            raise ValidationError({'weekdays': "Use numbers 1 (Monday) to 7 (Sunday), separated by commas."})
+
+
+class NightlyRate(models.Model):
+    """One room's price for one night, materialized from RateRules by booking.rates."""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='nightly_rates')
+    date = models.DateField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='nightly_rate_room_date_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} on {self.date}: {self.price}"
+
+
+class ArchivedBooking(BookingFields):
+    """A finished booking moved out of the live table by ``archive_history``.
+
+    Keeps the original id, so invoice links and exports still line up.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['check_in'], name='archived_booking_check_in_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived booking #{self.id} - {self.first_name} {self.last_name}"
+
+
+class ArchivedPayment(PaymentFields):
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.ForeignKey(ArchivedBooking, on_delete=models.CASCADE, related_name='payments')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='archived_payment_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.provider} {self.amount} {self.currency} - {self.status}"
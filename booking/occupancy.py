@@ -0,0 +1,249 @@
+"""Daily occupancy and revenue per room, materialized in DailyRoomStats.
+
+A room-night is sold when a CONFIRMED or COMPLETED booking covers it, and earns the
+booking's total price spread evenly over its nights (the room's nightly price when the
+booking has no total). Payments count on the day they were created, while SUCCEEDED.
+Archived bookings and payments count the same as live ones.
+
+Changes are not applied as deltas: the affected rooms and days are recomputed from
+Booking and Payment, so the table ends up with what a full rebuild would produce
+whatever order concurrent changes commit in. Signals cover single saves;
+set-based updates and bulk imports call ``refresh_bookings`` / ``refresh_spans``
+themselves, and ``rebuild_room_stats`` redoes everything nightly.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, Min, OuterRef, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from . import inventory
+from .models import ArchivedBooking, ArchivedPayment, Booking, DailyRoomStats, Payment, Room
+
+OCCUPYING_STATUSES = ('CONFIRMED', 'COMPLETED')
+
+# Days recomputed per transaction; bounds memory and lock time during rebuilds.
+WINDOW_DAYS = 92
+
+CENT = Decimal('0.01')
+
+
+def stay_span(check_in, check_out):
+    """The nights of a stay as an inclusive ``(first, last)`` pair, or None."""
+    if not check_in or not check_out or check_out <= check_in:
+        return None
+    return check_in, check_out - timedelta(days=1)
+
+
+def add_span(spans, room_id, span):
+    if room_id is None or span is None:
+        return
+    if room_id in spans:
+        first, last = spans[room_id]
+        span = (min(first, span[0]), max(last, span[1]))
+    spans[room_id] = span
+
+
+def _compute(start, end, room_ids):
+    """Return ``{(room_id, day): [nights, revenue, collected]}`` for start..end inclusive."""
+    totals = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+
+    for booking_model, payment_model in ((Booking, Payment), (ArchivedBooking, ArchivedPayment)):
+        bookings = booking_model.objects.filter(
+            status__in=OCCUPYING_STATUSES, room__isnull=False, check_in__lte=end, check_out__gt=start,
+        )
+        payments = payment_model.objects.filter(
+            status='SUCCEEDED', booking__room__isnull=False, created_at__date__gte=start, created_at__date__lte=end,
+        )
+        if room_ids is not None:
+            bookings = bookings.filter(room_id__in=room_ids)
+            payments = payments.filter(booking__room_id__in=room_ids)
+
+        rows = bookings.values_list('room_id', 'check_in', 'check_out', 'total_price', 'room__price')
+        for room_id, check_in, check_out, total_price, room_price in rows.iterator(chunk_size=2000):
+            nights = (check_out - check_in).days
+            if nights <= 0:
+                continue
+            nightly = total_price / nights if total_price else room_price
+            day = max(check_in, start)
+            last = min(check_out - timedelta(days=1), end)
+            while day <= last:
+                row = totals[(room_id, day)]
+                row[0] += 1
+                row[1] += nightly
+                day += timedelta(days=1)
+
+        collected = (
+            payments.annotate(day=TruncDate('created_at'))
+            .values('booking__room_id', 'day')
+            .annotate(total=Sum('amount'))
+            .values_list('booking__room_id', 'day', 'total')
+        )
+        for room_id, day, total in collected:
+            totals[(room_id, day)][2] += total
+    return totals
+
+
+def recompute(start, end, room_ids=None, progress=None):
+    """Rewrite the DailyRoomStats rows of ``room_ids`` (all rooms if None) for start..end."""
+    room_ids = sorted(set(room_ids)) if room_ids is not None else None
+    window_start = start
+    while window_start <= end:
+        window_end = min(window_start + timedelta(days=WINDOW_DAYS - 1), end)
+        with transaction.atomic():
+            rooms = Room.objects.all()
+            if room_ids is not None:
+                rooms = rooms.filter(pk__in=room_ids)
+            # Serializes refreshes of the same rooms; NO KEY keeps booking inserts unblocked.
+            categories = dict(rooms.select_for_update(no_key=True).values_list('pk', 'category'))
+            existing = DailyRoomStats.objects.filter(date__gte=window_start, date__lte=window_end)
+            if room_ids is not None:
+                existing = existing.filter(room_id__in=room_ids)
+            existing.delete()
+            DailyRoomStats.objects.bulk_create(
+                [
+                    DailyRoomStats(
+                        room_id=room_id, date=day, category=categories[room_id], nights_sold=nights,
+                        room_revenue=revenue.quantize(CENT), payments_collected=collected.quantize(CENT),
+                    )
+                    for (room_id, day), (nights, revenue, collected) in _compute(window_start, window_end, room_ids).items()
+                    if room_id in categories
+                ],
+                batch_size=1000,
+            )
+        if progress is not None:
+            progress(window_start, window_end)
+        window_start = window_end + timedelta(days=1)
+
+
+def refresh_spans(spans):
+    """Recompute ``{room_id: (first_day, last_day)}`` in one pass over their union."""
+    if not spans:
+        return
+    start = min(first for first, _ in spans.values())
+    end = max(last for _, last in spans.values())
+    recompute(start, end, spans)
+
+
+def refresh_bookings(booking_ids):
+    """Recompute the stays and payment days of ``booking_ids`` after a set-based change."""
+    spans = {}
+    bookings = Booking.objects.filter(pk__in=booking_ids, room__isnull=False)
+    for room_id, first, last in (
+        bookings.values('room_id').annotate(first=Min('check_in'), last=Max('check_out')).values_list('room_id', 'first', 'last')
+    ):
+        add_span(spans, room_id, stay_span(first, last))
+    paid = Payment.objects.filter(booking__in=bookings).annotate(day=TruncDate('created_at'))
+    for room_id, first, last in (
+        paid.values('booking__room_id').annotate(first=Min('day'), last=Max('day')).values_list('booking__room_id', 'first', 'last')
+    ):
+        add_span(spans, room_id, (first, last))
+    refresh_spans(spans)
+
+
+def _data_range():
+    days = []
+    for booking_model, payment_model in ((Booking, Payment), (ArchivedBooking, ArchivedPayment)):
+        stays = booking_model.objects.filter(status__in=OCCUPYING_STATUSES, room__isnull=False).aggregate(
+            first=Min('check_in'), last=Max('check_out'),
+        )
+        paid = payment_model.objects.filter(status='SUCCEEDED').aggregate(first=Min('created_at'), last=Max('created_at'))
+        days += [day for day in (stays['first'], stays['last'] and stays['last'] - timedelta(days=1)) if day]
+        days += [timezone.localdate(moment) for moment in (paid['first'], paid['last']) if moment]
+    return (min(days), max(days)) if days else (None, None)
+
+
+def rebuild(start=None, end=None, progress=None):
+    """Recompute start..end, defaulting to the whole history.
+
+    A full rebuild also drops rows outside the range the data covers.
+    """
+    first, last = _data_range()
+    if start is None and end is None:
+        DailyRoomStats.objects.exclude(date__gte=first or date.max, date__lte=last or date.min).delete()
+    start, end = start or first, end or last
+    if start is None or end is None:
+        return
+    recompute(start, end, progress=progress)
+
+
+def booked_now(today=None):
+    """``Exists`` for Room querysets: every sellable unit is sold on some night today or later."""
+    today = today or timezone.localdate()
+    return Exists(
+        DailyRoomStats.objects.filter(room=OuterRef('pk'), date__gte=today)
+        .annotate(sellable=inventory.sellable('room', 'room__units'))
+        .filter(nights_sold__gte=F('sellable'))
+    )
+
+
+def trailing_months(today=None, months=12):
+    """``(first_day, today)`` covering the current month and the ``months - 1`` before it."""
+    today = today or timezone.localdate()
+    month_index = today.year * 12 + today.month - 1 - (months - 1)
+    return date(month_index // 12, month_index % 12 + 1, 1), today
+
+
+def _days_in(period_start, period, start, end):
+    if period == 'day':
+        period_end = period_start
+    else:
+        period_end = period_start.replace(day=calendar.monthrange(period_start.year, period_start.month)[1])
+    return (min(period_end, end) - max(period_start, start)).days + 1
+
+
+def report(start, end, period='month'):
+    """Occupancy, ADR, RevPAR, room revenue and payments per category and period.
+
+    Available room-nights come from today's room inventory: what ``available`` rooms sell
+    now (``inventory.sellable``), so out-of-service units are not counted.
+    Returns ``(rows, totals)``: one dict per period and category, then per category.
+    """
+    period_expr = TruncMonth('date') if period == 'month' else F('date')
+    stats = (
+        DailyRoomStats.objects.filter(date__gte=start, date__lte=end)
+        .annotate(period=period_expr)
+        .values('period', 'category')
+        .annotate(sold=Sum('nights_sold'), revenue=Sum('room_revenue'), collected=Sum('payments_collected'))
+        .order_by('period', 'category')
+    )
+    capacity = defaultdict(int)
+    rooms = Room.objects.filter(available=True).annotate(sellable=inventory.sellable())
+    for category, sellable in rooms.values_list('category', 'sellable'):
+        capacity[category] += sellable
+    labels = dict(Room.ROOM_CATEGORIES)
+
+    def summarize(category, available, sold, revenue, collected, **extra):
+        return {
+            **extra,
+            'category': labels.get(category, category),
+            'available': available,
+            'sold': sold,
+            'occupancy': round(100 * sold / available, 1) if available else None,
+            'adr': (revenue / sold).quantize(CENT) if sold else None,
+            'revpar': (revenue / available).quantize(CENT) if available else None,
+            'revenue': revenue,
+            'collected': collected,
+        }
+
+    rows = []
+    sums = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+    for row in stats:
+        available = capacity.get(row['category'], 0) * _days_in(row['period'], period, start, end)
+        rows.append(summarize(
+            row['category'], available, row['sold'], row['revenue'], row['collected'], period=row['period'],
+        ))
+        total = sums[row['category']]
+        total[0] += row['sold']
+        total[1] += row['revenue']
+        total[2] += row['collected']
+    days = (end - start).days + 1
+    totals = [
+        summarize(category, capacity.get(category, 0) * days, *sums[category])
+        for category in sorted(set(sums) | set(capacity))
+    ]
+    return rows, totals
@@ -0,0 +1,118 @@
+"""Retention for provider payloads in Payment.raw_response.
+
+While a payment is in flight the views merge callbacks and status queries into
+``raw_response``. Once it has settled and is older than PAYMENT_RAW_RETENTION_DAYS,
+``compact_payment_payloads`` replaces it with a small summary of the fields staff and
+reconciliation look at, and keeps the full payload zlib-compressed in ``raw_payload``
+(``full_raw_response()`` gives it back). Each batch is one transaction and compacted
+rows are skipped on the next run, so the command can be interrupted and rerun.
+"""
+import json
+import zlib
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedPayment, Payment
+
+COMPRESSION_LEVEL = 6
+
+MPESA_KEYS = ('merchant_request_id', 'callback_result_desc', 'metadata')
+
+
+def compress(raw):
+    data = json.dumps(raw, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    return zlib.compress(data, COMPRESSION_LEVEL)
+
+
+def decompress(blob):
+    return json.loads(zlib.decompress(bytes(blob)).decode('utf-8'))
+
+
+def _first_capture_id(order):
+    for unit in order.get('purchase_units') or []:
+        for capture in (unit.get('payments') or {}).get('captures') or []:
+            return capture.get('id')
+    return None
+
+
+def summarize(provider, raw):
+    """The parts of a provider payload worth keeping inline once a payment has settled."""
+    if not isinstance(raw, dict):
+        return {'text': str(raw)[:200]}
+    if provider == 'STRIPE':
+        keys = ('id', 'status', 'amount', 'amount_received', 'currency', 'latest_charge')
+        summary = {key: raw[key] for key in keys if key in raw}
+    elif provider == 'PAYPAL':
+        summary = {key: raw[key] for key in ('id', 'status') if key in raw}
+        capture_id = _first_capture_id(raw)
+        if capture_id:
+            summary['capture_id'] = capture_id
+    elif provider == 'MPESA':
+        summary = {key: raw[key] for key in MPESA_KEYS if raw.get(key)}
+        callback = raw.get('callback') or raw.get('stk_query') or raw.get('response') or {}
+        for key in ('ResultCode', 'ResultDesc', 'CheckoutRequestID'):
+            if key in callback:
+                summary[key] = callback[key]
+    else:
+        summary = {}
+    summary['compacted'] = True
+    return summary
+
+
+def compactable(model, cutoff):
+    return model.objects.filter(
+        raw_compacted_at__isnull=True, raw_response__isnull=False, updated_at__lt=cutoff,
+    ).exclude(status='PENDING')
+
+
+def compact_batch(model, cutoff, batch_size=500, after_pk=0):
+    """Compact up to ``batch_size`` payloads with ids above ``after_pk``.
+
+    Returns ``(payments, bytes_before, bytes_after)``.
+    """
+    before = after = 0
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            compactable(model, cutoff).filter(pk__gt=after_pk).order_by('pk').select_for_update(skip_locked=True)
+            .only('pk', 'provider', 'raw_response')[:batch_size]
+        )
+        for payment in payments:
+            raw = payment.raw_response
+            payment.raw_payload = compress(raw)
+            payment.raw_response = summarize(payment.provider, raw)
+            payment.raw_compacted_at = now
+            before += len(json.dumps(raw, cls=DjangoJSONEncoder))
+            after += len(json.dumps(payment.raw_response)) + len(payment.raw_payload)
+        # bulk_update, not save(): no signals, and updated_at keeps its settlement time.
+        model.objects.bulk_update(payments, ['raw_response', 'raw_payload', 'raw_compacted_at'])
+    return payments, before, after
+
+
+def compact(days, batch_size=500, progress=None, pause=None, after_pk=0):
+    """Compact every settled payload older than ``days``, live then archived payments.
+
+    ``progress(model, last_pk, count, bytes_before, bytes_after)`` runs after each
+    batch; ``after_pk`` resumes a stopped run of the live table past that id.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    totals = [0, 0, 0]
+    for model in (Payment, ArchivedPayment):
+        last_pk = after_pk if model is Payment else 0
+        while True:
+            # Walking forward by id keeps each batch an index range scan.
+            payments, before, after = compact_batch(model, cutoff, batch_size, last_pk)
+            if not payments:
+                break
+            last_pk = payments[-1].pk
+            totals[0] += len(payments)
+            totals[1] += before
+            totals[2] += after
+            if progress is not None:
+                progress(model, last_pk, *totals)
+            if pause:
+                pause()
+    return tuple(totals)
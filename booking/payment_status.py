@@ -0,0 +1,92 @@
+"""Change notification for a booking's payment status, used by the long-poll endpoint.
+
+Every Payment save bumps a per-booking version counter in the cache once the
+transaction commits. Waiting requests watch that counter, which is cheap and shared
+across workers when CACHE_URL points at Redis or Memcached, and read the database
+again only after it moves. Waiters in the same process are also woken directly, so a
+callback handled by the same worker is seen immediately rather than on the next tick.
+"""
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+_changed = threading.Condition()
+
+TERMINAL_STATUSES = {'SUCCEEDED', 'FAILED', 'CANCELLED', 'REFUNDED'}
+
+# Per-process caches: a version bumped by one worker is never seen by another.
+LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def max_wait():
+    """Longest a status request may be held, in seconds; 0 means plain interval polling.
+
+    Held requests are only worth it when the views are served async (a held sync
+    request ties up a whole WSGI worker) and the version counter lives in a shared cache.
+    """
+    if not settings.ASYNC_PAYMENT_VIEWS or settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        return 0.0
+    return settings.PAYMENT_STATUS_MAX_WAIT_SECONDS
+
+
+def version_key(booking_id):
+    return f"payment-status:{booking_id}"
+
+
+def current_version(booking_id):
+    return cache.get(version_key(booking_id), 0)
+
+
+async def acurrent_version(booking_id):
+    return await cache.aget(version_key(booking_id), 0)
+
+
+def _bump(booking_id):
+    key = version_key(booking_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, settings.PAYMENT_STATUS_VERSION_TTL)
+
+
+def publish(booking_id):
+    _bump(booking_id)
+    with _changed:
+        _changed.notify_all()
+
+
+def publish_many(booking_ids):
+    for booking_id in booking_ids:
+        _bump(booking_id)
+    with _changed:
+        _changed.notify_all()
+
+
+def wait_for_change(booking_id, version, timeout):
+    """Block for at most ``timeout`` seconds until the version moves past ``version``."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if current_version(booking_id) != version:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        with _changed:
+            _changed.wait(min(remaining, settings.PAYMENT_STATUS_POLL_SECONDS))
+
+
+async def await_change(booking_id, version, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        if await acurrent_version(booking_id) != version:
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(remaining, settings.PAYMENT_STATUS_POLL_SECONDS))
@@ -0,0 +1,186 @@
+"""Token-bucket rate limits and per-process concurrency caps for the expensive views.
+
+Rate limits are configured per URL name in RATE_LIMITS, e.g.
+``{'login': {'ip': '10/m', 'email': '5/m'}}``: each entry is a bucket holding
+``count`` tokens that refill evenly over the period (s, m, h or d). Buckets are kept
+in the ``ratelimit`` cache as a single "theoretical arrival time" per key (GCRA), so
+one get_many/set_many pair covers every bucket a request touches. Concurrent
+requests in different workers can race on the same key and let a request or two
+through over the limit; the limits are meant to stop bursts, not to meter billing.
+
+Concurrency caps bound how many requests of a group (CONCURRENCY_LIMITS) one process
+serves at a time. Excess requests wait up to CONCURRENCY_LIMIT_WAIT_SECONDS and are
+then shed with a 503, so a provider slowdown cannot tie up every worker thread. Async
+views wait on an asyncio semaphore of their event loop instead, which wakes them only
+when a slot frees up; the cap applies to the async views of a group and, separately,
+to its sync views.
+"""
+import asyncio
+import functools
+import hashlib
+import math
+import threading
+import time
+import weakref
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# POST fields that carry the email address an attempt is made for.
+EMAIL_FIELDS = ('email', 'login_email')
+
+
+def parse_rate(rate):
+    """Parse ``'10/m'`` or ``'100/5m'`` into ``(count, period_seconds)``."""
+    count, _, period = rate.partition('/')
+    multiplier = period[:-1] or '1'
+    try:
+        return int(count), int(multiplier) * PERIODS[period[-1]]
+    except (KeyError, IndexError, ValueError):
+        raise ValueError(f"Invalid rate {rate!r}; expected e.g. '10/m' or '100/5m'.")
+
+
+def client_ip(request):
+    # Behind N trusted proxies the client address is the Nth entry from the right.
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _identity(request, kind):
+    if kind == 'ip':
+        return client_ip(request)
+    if kind == 'session':
+        session = getattr(request, 'session', None)
+        return session.session_key if session is not None else None
+    if kind == 'email':
+        for field in EMAIL_FIELDS:
+            value = (request.POST.get(field) or '').strip().lower()
+            if value:
+                return value
+        return None
+    raise ValueError(f"Unknown rate limit key {kind!r}; expected ip, session or email.")
+
+
+def _bucket_key(name, kind, identity):
+    digest = hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32]
+    return f"rl:{name}:{kind}:{digest}"
+
+
+def check_rate_limits(request, name, limits, now=None):
+    """Consume one token from each bucket for this request.
+
+    Returns 0 when the request is allowed, otherwise the seconds until it would be.
+    """
+    now = time.time() if now is None else now
+    buckets = {}
+    for kind, rate in limits.items():
+        identity = _identity(request, kind)
+        if identity:
+            count, period = parse_rate(rate)
+            buckets[_bucket_key(name, kind, identity)] = (count, period)
+    if not buckets:
+        return 0
+
+    cache = caches[settings.RATE_LIMIT_CACHE_ALIAS]
+    arrivals = cache.get_many(list(buckets))
+    updates = {}
+    retry_after = 0
+    for key, (count, period) in buckets.items():
+        interval = period / count
+        arrival = max(arrivals.get(key, now), now) + interval
+        allowed_at = arrival - count * interval
+        if allowed_at > now:
+            retry_after = max(retry_after, allowed_at - now)
+        else:
+            updates[key] = arrival
+    if retry_after:
+        return retry_after
+    cache.set_many(updates, timeout=max(period for _, period in buckets.values()) + 1)
+    return 0
+
+
+def _wants_json(request):
+    # The payment page posts with fetch() and an X-CSRFToken header and expects JSON back.
+    return 'application/json' in request.headers.get('Accept', '') or request.headers.get('X-CSRFToken') is not None
+
+
+def throttled_response(request, retry_after, status=429, message="Too many requests"):
+    seconds = max(1, math.ceil(retry_after))
+    text = f"{message}. Please try again in {seconds} seconds."
+    if _wants_json(request):
+        response = JsonResponse({'error': text, 'retry_after': seconds}, status=status)
+    else:
+        response = HttpResponse(text, status=status, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(seconds)
+    return response
+
+
+_semaphores = {}
+_semaphores_lock = threading.Lock()
+
+
+def _semaphore(group):
+    limit = settings.CONCURRENCY_LIMITS[group]
+    with _semaphores_lock:
+        semaphore = _semaphores.get((group, limit))
+        if semaphore is None:
+            semaphore = _semaphores[(group, limit)] = threading.BoundedSemaphore(limit)
+        return semaphore
+
+
+# Per event loop: asyncio semaphores cannot be shared between loops.
+_async_semaphores = weakref.WeakKeyDictionary()
+
+
+def _async_semaphore(group):
+    limit = settings.CONCURRENCY_LIMITS[group]
+    loop = asyncio.get_running_loop()
+    with _semaphores_lock:
+        semaphores = _async_semaphores.setdefault(loop, {})
+        semaphore = semaphores.get((group, limit))
+        if semaphore is None:
+            semaphore = semaphores[(group, limit)] = asyncio.BoundedSemaphore(limit)
+        return semaphore
+
+
+def concurrency_limit(group):
+    """Cap how many requests of ``group`` this process serves at once; works on sync and async views."""
+
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @functools.wraps(view_func)
+            async def _wrapped(request, *args, **kwargs):
+                if group not in settings.CONCURRENCY_LIMITS:
+                    return await view_func(request, *args, **kwargs)
+                semaphore = _async_semaphore(group)
+                try:
+                    await asyncio.wait_for(semaphore.acquire(), settings.CONCURRENCY_LIMIT_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    return throttled_response(request, 1, status=503, message="The site is busy")
+                try:
+                    return await view_func(request, *args, **kwargs)
+                finally:
+                    semaphore.release()
+        else:
+            @functools.wraps(view_func)
+            def _wrapped(request, *args, **kwargs):
+                if group not in settings.CONCURRENCY_LIMITS:
+                    return view_func(request, *args, **kwargs)
+                semaphore = _semaphore(group)
+                if not semaphore.acquire(timeout=settings.CONCURRENCY_LIMIT_WAIT_SECONDS):
+                    return throttled_response(request, 1, status=503, message="The site is busy")
+                try:
+                    return view_func(request, *args, **kwargs)
+                finally:
+                    semaphore.release()
+        return _wrapped
+
+    return decorator
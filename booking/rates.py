@@ -0,0 +1,160 @@
+"""Nightly rate calendar and stay quotes.
+
+RateRules (seasons, weekend nights, events) decide what each room costs per night.
+The result is materialized into NightlyRate rows for the next RATE_CALENDAR_DAYS, so
+quoting a stay is one range query over its nights, and quoting a whole room list
+for the same dates is still one query. Nights the calendar does not cover (past
+the horizon, or not rebuilt yet) are priced from the rules on the spot, so a quote
+is never wrong, only slower.
+
+Rule and room price changes rebuild the affected rooms after commit; run
+``rebuild_rate_calendar`` nightly to roll the horizon forward.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import NightlyRate, RateRule, Room
+
+CENT = Decimal('0.01')
+
+logger = logging.getLogger(__name__)
+
+
+def horizon(today=None):
+    """``(first, last)`` night the calendar covers."""
+    today = today or timezone.localdate()
+    return today, today + timedelta(days=settings.RATE_CALENDAR_DAYS - 1)
+
+
+def each_night(check_in, check_out):
+    day = check_in
+    while day < check_out:
+        yield day
+        day += timedelta(days=1)
+
+
+def _applies_to(rule, room):
+    if rule.room_id is not None:
+        return rule.room_id == room.pk
+    return not rule.category or rule.category == room.category
+
+
+def rules_for(rooms):
+    """``{room_id: [RateRule]}``, each list in order of precedence."""
+    rooms = list(rooms)
+    rules = []
+    for rule in RateRule.objects.filter(Q(room__isnull=True) | Q(room_id__in=[room.pk for room in rooms])):
+        # clean() rejects these, but rules saved without it must not break every quote.
+        try:
+            rule.days = rule.weekday_numbers()
+        except ValueError:
+            logger.warning("Ignoring rate rule %s: bad weekdays %r", rule.pk, rule.weekdays)
+            continue
+        rules.append(rule)
+    # Priority first, then the narrower rule (room, category, all rooms), then the newer one.
+    rules.sort(
+        key=lambda rule: (rule.priority, 2 if rule.room_id else 1 if rule.category else 0, rule.pk), reverse=True,
+    )
+    return {room.pk: [rule for rule in rules if _applies_to(rule, room)] for room in rooms}
+
+
+def night_price(room, day, rules):
+    """The price of ``room`` on the night of ``day``, from its ``rules_for`` list."""
+    for rule in rules:
+        if (rule.start and day < rule.start) or (rule.end and day > rule.end):
+            continue
+        if rule.days and day.isoweekday() not in rule.days:
+            continue
+        if rule.price is not None:
+            return rule.price
+        return (room.price * (100 + rule.percent) / 100).quantize(CENT)
+    return room.price
+
+
+def quote_many(rooms, check_in, check_out):
+    """``{room_id: total}`` for staying in each of ``rooms`` from check_in to check_out."""
+    rooms = list(rooms)
+    prices = defaultdict(dict)
+    rows = NightlyRate.objects.filter(
+        room_id__in=[room.pk for room in rooms], date__gte=check_in, date__lt=check_out,
+    ).values_list('room_id', 'date', 'price')
+    for room_id, day, price in rows:
+        prices[room_id][day] = price
+    nights = max((check_out - check_in).days, 0)
+    missing = [room for room in rooms if len(prices[room.pk]) < nights]
+    if missing:
+        rules = rules_for(missing)
+        for room in missing:
+            for day in each_night(check_in, check_out):
+                if day not in prices[room.pk]:
+                    prices[room.pk][day] = night_price(room, day, rules[room.pk])
+    return {room.pk: sum(prices[room.pk].values(), Decimal('0.00')) for room in rooms}
+
+
+def quote(room, check_in, check_out):
+    return quote_many([room], check_in, check_out)[room.pk]
+
+
+def rebuild(room_ids=None, start=None, end=None, progress=None):
+    """Rewrite the NightlyRate rows of ``room_ids`` (all rooms if None) for start..end.
+
+    Dates are clipped to the horizon. A full rebuild also drops the nights before it.
+    Each room is rewritten in its own transaction. Returns the number of rows written.
+    """
+    first, last = horizon()
+    start, end = max(start or first, first), min(end or last, last)
+    rooms = Room.objects.order_by('pk')
+    if room_ids is not None:
+        rooms = rooms.filter(pk__in=set(room_ids))
+    else:
+        NightlyRate.objects.filter(date__lt=first).delete()
+    if start > end:
+        return 0
+    days = list(each_night(start, end + timedelta(days=1)))
+    written = 0
+    for room in rooms:
+        with transaction.atomic():
+            rules = rules_for([room])[room.pk]
+            NightlyRate.objects.filter(room=room, date__gte=start, date__lte=end).delete()
+            NightlyRate.objects.bulk_create(
+                [NightlyRate(room=room, date=day, price=night_price(room, day, rules)) for day in days],
+                batch_size=2000,
+            )
+        written += len(days)
+        if progress:
+            progress(room)
+    return written
+
+
+def rule_scope(room_id, category, start, end):
+    """``(room_ids or None for all rooms, start, end)`` of the nights a rule can touch."""
+    if room_id is not None:
+        room_ids = [room_id]
+    elif category:
+        room_ids = list(Room.objects.filter(category=category).values_list('pk', flat=True))
+    else:
+        room_ids = None
+    return room_ids, start, end
+
+
+def rebuild_scopes(*scopes):
+    """Rebuild the union of ``rule_scope`` results, e.g. a rule before and after an edit."""
+    room_ids = set()
+    starts, ends = [], []
+    for scope_rooms, start, end in scopes:
+        if scope_rooms is None:
+            room_ids = None
+        elif room_ids is not None:
+            room_ids.update(scope_rooms)
+        starts.append(start)
+        ends.append(end)
+    start = None if None in starts else min(starts)
+    end = None if None in ends else max(ends)
+    rebuild(room_ids, start, end)
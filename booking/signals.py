@@ -0,0 +1,184 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import images, occupancy, payment_status, rates
+from .invoices import invalidate_invoices
+from .models import Booking, DailyRoomStats, Payment, RateRule, Room
+
+# Fields that decide a booking's or payment's contribution to DailyRoomStats.
+BOOKING_STATS_FIELDS = ('room_id', 'check_in', 'check_out', 'status', 'total_price')
+PAYMENT_STATS_FIELDS = ('booking_id', 'status', 'amount')
+# Fields that decide which NightlyRate rows a room or rule affects.
+ROOM_RATE_FIELDS = ('price', 'category')
+RATE_RULE_FIELDS = ('room_id', 'category', 'start', 'end', 'weekdays', 'price', 'percent', 'priority')
+
+
+@receiver(post_save, sender=Payment)
+def publish_payment_status(sender, instance, **kwargs):
+    booking_id = instance.booking_id
+    transaction.on_commit(lambda: payment_status.publish(booking_id))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=Payment)
+def invalidate_cached_invoices(sender, instance, created, **kwargs):
+    if created and sender is Booking:
+        return
+    booking_id = instance.pk if sender is Booking else instance.booking_id
+    transaction.on_commit(lambda: invalidate_invoices(booking_id))
+
+
+def _snapshot(instance, fields):
+    # Read __dict__ so deferred fields are not loaded just to be remembered.
+    return tuple(instance.__dict__.get(name) for name in fields)
+
+
+@receiver(post_init, sender=Booking)
+def remember_booking_stats(sender, instance, **kwargs):
+    instance._stats_snapshot = _snapshot(instance, BOOKING_STATS_FIELDS)
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_stats(sender, instance, **kwargs):
+    instance._stats_snapshot = _snapshot(instance, PAYMENT_STATS_FIELDS)
+
+
+def _booking_spans(*states):
+    spans = {}
+    for room_id, check_in, check_out, status, _ in states:
+        if status in occupancy.OCCUPYING_STATUSES:
+            occupancy.add_span(spans, room_id, occupancy.stay_span(check_in, check_out))
+    return spans
+
+
+@receiver(post_save, sender=Booking)
+def refresh_booking_stats(sender, instance, created, **kwargs):
+    old, new = instance._stats_snapshot, _snapshot(instance, BOOKING_STATS_FIELDS)
+    instance._stats_snapshot = new
+    if old == new and not created:
+        return
+    spans = _booking_spans(old, new)
+    if spans:
+        transaction.on_commit(lambda: occupancy.refresh_spans(spans))
+
+
+@receiver(post_delete, sender=Booking)
+def forget_booking_stats(sender, instance, **kwargs):
+    spans = _booking_spans(_snapshot(instance, BOOKING_STATS_FIELDS))
+    if spans:
+        transaction.on_commit(lambda: occupancy.refresh_spans(spans))
+
+
+def _refresh_payment_day(booking_ids, created_at):
+    if created_at is None:
+        return
+    day = timezone.localdate(created_at)
+    spans = {}
+    for room_id in Booking.objects.filter(pk__in=booking_ids, room__isnull=False).values_list('room_id', flat=True):
+        occupancy.add_span(spans, room_id, (day, day))
+    occupancy.refresh_spans(spans)
+
+
+@receiver(post_save, sender=Payment)
+def refresh_payment_stats(sender, instance, created, **kwargs):
+    old, new = instance._stats_snapshot, _snapshot(instance, PAYMENT_STATS_FIELDS)
+    instance._stats_snapshot = new
+    if old == new and not created:
+        return
+    if 'SUCCEEDED' not in (old[1], new[1]):
+        return
+    booking_ids = {old[0], new[0]} - {None}
+    created_at = instance.created_at
+    transaction.on_commit(lambda: _refresh_payment_day(booking_ids, created_at))
+
+
+@receiver(post_delete, sender=Payment)
+def forget_payment_stats(sender, instance, **kwargs):
+    if instance.status == 'SUCCEEDED':
+        booking_ids = {instance.booking_id}
+        created_at = instance.created_at
+        transaction.on_commit(lambda: _refresh_payment_day(booking_ids, created_at))
+
+
+def backfill_room_stats(using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_migrate: fill an empty DailyRoomStats from the existing bookings and payments.
+
+    The admin room status reads only that table, so a fresh table would show every room
+    as available until the first ``rebuild_room_stats``. Runs after all migrations, when
+    the models match the schema; an empty database makes it a few cheap aggregates.
+    """
+    if using != DEFAULT_DB_ALIAS or DailyRoomStats.objects.exists():
+        return
+    occupancy.rebuild()
+
+
+@receiver(post_save, sender=Room)
+def sync_room_stats_category(sender, instance, created, **kwargs):
+    if not created:
+        DailyRoomStats.objects.filter(room=instance).exclude(category=instance.category).update(category=instance.category)
+
+
+def _image_name(instance):
+    value = instance.__dict__.get('image')
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=Room)
+def remember_room_image(sender, instance, **kwargs):
+    instance._image_snapshot = _image_name(instance)
+
+
+@receiver(post_save, sender=Room)
+def refresh_room_images(sender, instance, created, **kwargs):
+    old, new = instance._image_snapshot, _image_name(instance)
+    instance._image_snapshot = new
+    if old == new and not created:
+        return
+    if instance.image_digest:
+        instance.image_digest, instance.image_width, instance.image_height = '', None, None
+        Room.objects.filter(pk=instance.pk).update(image_digest='', image_width=None, image_height=None)
+    if new:
+        room_id = instance.pk
+        transaction.on_commit(lambda: images.generate_for(room_id))
+
+
+@receiver(post_init, sender=Room)
+def remember_room_rates(sender, instance, **kwargs):
+    instance._rates_snapshot = _snapshot(instance, ROOM_RATE_FIELDS)
+
+
+@receiver(post_save, sender=Room)
+def refresh_room_rates(sender, instance, created, **kwargs):
+    old, new = instance._rates_snapshot, _snapshot(instance, ROOM_RATE_FIELDS)
+    instance._rates_snapshot = new
+    if old == new and not created:
+        return
+    room_id = instance.pk
+    transaction.on_commit(lambda: rates.rebuild([room_id]))
+
+
+@receiver(post_init, sender=RateRule)
+def remember_rate_rule(sender, instance, **kwargs):
+    instance._rates_snapshot = _snapshot(instance, RATE_RULE_FIELDS)
+
+
+def _rule_scopes(*states):
+    return [rates.rule_scope(*state[:4]) for state in states]
+
+
+@receiver(post_save, sender=RateRule)
+def refresh_rule_rates(sender, instance, created, **kwargs):
+    old, new = instance._rates_snapshot, _snapshot(instance, RATE_RULE_FIELDS)
+    instance._rates_snapshot = new
+    if old == new and not created:
+        return
+    states = (new,) if created else (old, new)
+    transaction.on_commit(lambda: rates.rebuild_scopes(*_rule_scopes(*states)))
+
+
+@receiver(post_delete, sender=RateRule)
+def forget_rule_rates(sender, instance, **kwargs):
+    state = _snapshot(instance, RATE_RULE_FIELDS)
+    transaction.on_commit(lambda: rates.rebuild_scopes(*_rule_scopes(state)))
@@ -0,0 +1,117 @@
+"""Multi-process SQLite contention benchmark.
+
+Kept free of Django imports so spawned worker processes can load it without
+configuring settings.
+"""
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bench_booking (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    check_in TEXT NOT NULL,
+    check_out TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bench_booking_room ON bench_booking (room_id, status, check_in, check_out);
+"""
+
+
+def _sqlite_worker(args):
+    path, pragmas, immediate, seconds, write_ratio, seed = args
+    rng = random.Random(seed)
+    # Python's sqlite3 default (5s) is what an untuned Django connection gets.
+    timeout = int(pragmas['busy_timeout']) / 1000 if pragmas and 'busy_timeout' in pragmas else 5.0
+    db = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    for key, value in (pragmas or {}).items():
+        db.execute(f'PRAGMA {key}={value}')
+
+    stats = {'reads': 0, 'writes': 0, 'locked': 0, 'latency_ms': []}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        room_id = rng.randint(1, 40)
+        day = date(2030, 1, 1) + timedelta(days=rng.randint(0, 365))
+        check_in, check_out = day.isoformat(), (day + timedelta(days=2)).isoformat()
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                # Same shape as booking_view: availability check, then insert.
+                db.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+                clash = db.execute(
+                    "SELECT 1 FROM bench_booking WHERE room_id=? AND status='CONFIRMED' "
+                    "AND check_in < ? AND check_out > ? LIMIT 1",
+                    (room_id, check_out, check_in),
+                ).fetchone()
+                if not clash:
+                    db.execute(
+                        "INSERT INTO bench_booking (room_id, status, check_in, check_out) VALUES (?, 'CONFIRMED', ?, ?)",
+                        (room_id, check_in, check_out),
+                    )
+                db.execute('COMMIT')
+                stats['writes'] += 1
+            else:
+                db.execute(
+                    "SELECT room_id, COUNT(*) FROM bench_booking WHERE status='CONFIRMED' "
+                    "AND check_in < ? AND check_out > ? GROUP BY room_id",
+                    (check_out, check_in),
+                ).fetchall()
+                stats['reads'] += 1
+            stats['latency_ms'].append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            stats['locked'] += 1
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+    db.close()
+    return stats
+
+
+def benchmark_sqlite_concurrency(pragmas=None, immediate=False, workers=8, seconds=5.0, write_ratio=0.2):
+    """Hammer a scratch SQLite file from several processes, like gunicorn workers would."""
+    directory = tempfile.mkdtemp(prefix='sqlite-bench-')
+    path = os.path.join(directory, 'bench.sqlite3')
+    setup = sqlite3.connect(path)
+    for key, value in (pragmas or {}).items():
+        setup.execute(f'PRAGMA {key}={value}')
+    setup.executescript(_SQLITE_SCHEMA)
+    setup.close()
+
+    jobs = [(path, pragmas, immediate, seconds, write_ratio, seed) for seed in range(workers)]
+    try:
+        with multiprocessing.get_context('spawn').Pool(workers) as pool:
+            results = pool.map(_sqlite_worker, jobs)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        os.rmdir(directory)
+
+    latency = [sample for result in results for sample in result['latency_ms']]
+    reads = sum(result['reads'] for result in results)
+    writes = sum(result['writes'] for result in results)
+    locked = sum(result['locked'] for result in results)
+    return {
+        'workers': workers,
+        'seconds': seconds,
+        'reads_per_second': round(reads / seconds, 1),
+        'writes_per_second': round(writes / seconds, 1),
+        'locked_errors': locked,
+        'error_rate': round(locked / max(reads + writes + locked, 1), 4),
+        'latency_ms': _summary(latency),
+    }
+
+
+def _summary(samples_ms):
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+
+    def pick(pct):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+    return {'p50': pick(50), 'p95': pick(95), 'p99': pick(99), 'max': round(ordered[-1], 3)}
@@ -0,0 +1,103 @@
+"""Set-based booking and payment status changes for staff bulk actions.
+
+Each change is a single UPDATE per table inside one transaction, following the rules
+of the payments management page: a succeeded payment confirms a pending booking, and
+a cancelled or refunded payment cancels a pending or confirmed one. ``update()`` skips
+``post_save``, so the side effects the signals and payment views would have triggered
+(payment status notifications, invoice cache cleanup, receipt emails, the daily
+occupancy stats) run here after the transaction commits, in batches over the changed
+rows.
+"""
+from functools import partial
+
+from django.core.mail import get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import occupancy, payment_status
+from .invoices import invalidate_invoices
+from .models import Booking, Payment
+
+# New booking status -> statuses it may be reached from.
+BOOKING_TRANSITIONS = {
+    'CONFIRMED': ('PENDING',),
+    'CANCELLED': ('PENDING', 'CONFIRMED'),
+    'COMPLETED': ('CONFIRMED',),
+}
+
+# New payment status -> booking status it moves the booking to, where allowed.
+PAYMENT_BOOKING_EFFECTS = {
+    'SUCCEEDED': 'CONFIRMED',
+    'CANCELLED': 'CANCELLED',
+    'REFUNDED': 'CANCELLED',
+}
+
+RECEIPT_BATCH_SIZE = 100
+
+
+def _move_bookings(bookings, status, now):
+    """UPDATE the rows of ``bookings`` allowed to move to ``status``; return their ids."""
+    targets = Booking.objects.filter(pk__in=bookings.values('pk'), status__in=BOOKING_TRANSITIONS[status])
+    booking_ids = list(targets.select_for_update().values_list('pk', flat=True))
+    if booking_ids:
+        targets.update(status=status, updated_at=now)
+    return booking_ids
+
+
+def set_booking_status(bookings, status):
+    """Move every booking in the queryset that may go to ``status``; return how many did."""
+    if status not in BOOKING_TRANSITIONS:
+        raise ValueError(f"Bookings cannot be moved to {status!r} in bulk.")
+    with transaction.atomic():
+        booking_ids = _move_bookings(bookings, status, timezone.now())
+        transaction.on_commit(partial(after_status_change, booking_ids))
+    return len(booking_ids)
+
+
+def set_payment_status(payments, status, request=None):
+    """Set ``status`` on every payment in the queryset and apply the booking effect.
+
+    Returns ``(payments_updated, bookings_moved)``. Receipts go out for payments that
+    became SUCCEEDED, when a ``request`` is given to build the invoice links.
+    """
+    if status not in {code for code, _ in Payment.STATUSES}:
+        raise ValueError(f"Unknown payment status {status!r}.")
+    now = timezone.now()
+    with transaction.atomic():
+        selected = Payment.objects.filter(pk__in=payments.values('pk'))
+        rows = list(selected.select_for_update().values_list('booking_id', 'status'))
+        selected.update(status=status, updated_at=now)
+
+        moved = []
+        if status in PAYMENT_BOOKING_EFFECTS:
+            moved = _move_bookings(
+                Booking.objects.filter(pk__in=selected.values('booking_id')), PAYMENT_BOOKING_EFFECTS[status], now,
+            )
+        booking_ids = sorted({booking_id for booking_id, _ in rows})
+        receipts = []
+        if status == 'SUCCEEDED' and request is not None:
+            receipts = sorted({booking_id for booking_id, old in rows if old != 'SUCCEEDED'})
+        transaction.on_commit(partial(after_status_change, booking_ids, request, receipts))
+    return len(rows), len(moved)
+
+
+def send_receipts(request, booking_ids):
+    """Send receipt emails for ``booking_ids`` over one mail connection, a batch at a time."""
+    from .views import _receipt_message
+
+    connection = get_connection(fail_silently=True)
+    for start in range(0, len(booking_ids), RECEIPT_BATCH_SIZE):
+        bookings = Booking.objects.filter(
+            pk__in=booking_ids[start:start + RECEIPT_BATCH_SIZE],
+        ).exclude(email='').select_related('room')
+        connection.send_messages([_receipt_message(request, booking, connection=connection) for booking in bookings])
+
+
+def after_status_change(booking_ids, request=None, receipt_booking_ids=()):
+    """Side effects of a set-based status change, run once it has committed."""
+    payment_status.publish_many(booking_ids)
+    occupancy.refresh_bookings(booking_ids)
+    for booking_id in booking_ids:
+        invalidate_invoices(booking_id)
+    if receipt_booking_ids:
+        send_receipts(request, receipt_booking_ids)
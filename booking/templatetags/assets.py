@@ -0,0 +1,37 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from .. import assets
+
+register = template.Library()
+
+TAGS = {
+    'css': '<link href="{}" rel="stylesheet">',
+    'js': '<script src="{}"></script>',
+}
+
+
+@register.simple_tag
+def asset_bundle(bundle):
+    """Link ``bundle`` (a key of assets.BUNDLES), or its sources when ASSET_BUNDLES is off."""
+    tag = TAGS[bundle.rsplit('.', 1)[-1]]
+    return format_html_join('\n    ', tag, ((static(path),) for path in assets.sources(bundle)))
+
+
+@register.simple_tag
+def asset_preloads():
+    """``<link rel="preload">`` for the files in assets.PRELOADS."""
+    links = []
+    for path, kind, content_type in assets.PRELOADS:
+        if path.startswith(f"{assets.BUNDLE_DIR}/") and not settings.ASSET_BUNDLES:
+            continue
+        # Fonts are always fetched in CORS mode; the preload must match or it is wasted.
+        crossorigin = format_html(' crossorigin') if kind == 'font' else ''
+        path, separator, query = path.partition('?')
+        links.append(format_html(
+            '<link rel="preload" href="{}{}{}" as="{}" type="{}"{}>',
+            static(path), separator, query, kind, content_type, crossorigin,
+        ))
+    return format_html_join('\n    ', '{}', ((link,) for link in links))
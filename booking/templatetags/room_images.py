@@ -0,0 +1,44 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import format_html
+
+from .. import images
+
+register = template.Library()
+
+
+def _srcset(room, digest, widths, fmt):
+    return ', '.join(f"{reverse('room_image', args=[room.pk, digest, width, fmt])} {width}w" for width in widths)
+
+
+@register.simple_tag
+def room_picture(room, rendition='card', css_class='', alt=None, loading='lazy'):
+    """``<picture>`` markup for ``room.image`` at one of images.RENDITIONS.
+
+    WebP with a JPEG fallback, sized by ``srcset``/``sizes`` and lazy-loaded unless
+    ``loading="eager"`` (for images above the fold).
+    """
+    if not room.image:
+        return ''
+    alt = room.title if alt is None else alt
+    digest = images.ensure_digest(room)
+    if digest is None:
+        return format_html(
+            '<img src="{}" class="{}" alt="{}" loading="{}" decoding="async">', room.image.url, css_class, alt, loading,
+        )
+    widths = images.rendition_widths(rendition, room.image_width)
+    sizes = images.RENDITIONS[rendition]['sizes']
+    dimensions = ''
+    if room.image_width and room.image_height:
+        # Intrinsic size of the first candidate, so the browser reserves the right box.
+        height = max(1, round(room.image_height * widths[0] / room.image_width))
+        dimensions = format_html(' width="{}" height="{}"', widths[0], height)
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{} class="{}" alt="{}" loading="{}" decoding="async">'
+        '</picture>',
+        _srcset(room, digest, widths, 'webp'), sizes,
+        reverse('room_image', args=[room.pk, digest, widths[0], 'jpg']), _srcset(room, digest, widths, 'jpg'), sizes,
+        dimensions, css_class, alt, loading,
+    )
@@ -1,9 +1,61 @@
+import asyncio
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
 from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-from django.test import TestCase
-from django.urls import reverse
+import requests
+from PIL import Image
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.auth.models import User
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import connection
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
 
-from .models import Booking, Room
+from room_booking.cache_urls import cache_config_from_url, caches_from_env
+from room_booking.settings import _database_config_from_url, _replica_databases
+
+from . import (
+    assets, async_views, compression, images, inventory, payment_status, ratelimit, rates, status_changes, views,
+)
+
+from .benchmarks import (
+    QUERY_BUDGETS,
+    benchmark_cache,
+    benchmark_connection_reuse,
+    check_budgets,
+    run_benchmarks,
+    seed_benchmark_data,
+)
+from .db_routers import ReplicaRouter, reading_from_replica, replica_reads
+from .fake_providers import FakeProviderConfig, FakeProviderServer, settings_for
+from .invoices import invoice_storage
+from .middleware import PRIMARY_PIN_COOKIE, ReplicaRoutingMiddleware, TrafficCaptureMiddleware
+from .models import ArchivedBooking, Booking, DailyRoomStats, NightlyRate, Payment, RateRule, Room, RoomUnit
+from .traffic import capture_files, load_records, replay
 
 
 class PublicPagesTests(TestCase):
@@ -46,3 +98,1293 @@ class PublicPagesTests(TestCase):
         )
         response = self.client.get(reverse("payment_page", args=[booking.id]))
         self.assertEqual(response.status_code, 200)
+
+
+class AssetBundleTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_css_bundle_rebases_urls_and_minifies(self):
+        css = assets.build("site.css")
+        self.assertIn('url("../vendor/font-awesome/fonts/fontawesome-webfont.woff2?v=4.7.0")', css)
+        self.assertIn('url("../img/icon/wifi.png")', css)
+        self.assertEqual(assets.minify_css('a ,  b {\n  color : red ; /* x */\n  content: "a , b";\n}'),
+                         'a,b{color : red;content: "a , b"}')
+
+    def test_template_links_bundles_or_sources(self):
+        render = Template("{% load assets %}{% asset_preloads %}{% asset_bundle 'site.js' %}").render
+        with override_settings(ASSET_BUNDLES=True):
+            html = render(Context())
+        self.assertIn('<script src="/static/bundles/site.js"></script>', html)
+        self.assertIn('href="/static/vendor/font-awesome/fonts/fontawesome-webfont.woff2?v=4.7.0" as="font"', html)
+        with override_settings(ASSET_BUNDLES=False):
+            html = render(Context())
+        self.assertNotIn("bundles/", html)
+        self.assertIn("/static/vendor/jquery/jquery.min.js", html)
+
+    def test_collectstatic_hashes_bundles(self):
+        storages = dict(settings.STORAGES, staticfiles={"BACKEND": "booking.assets.ManifestStorage"})
+        with override_settings(
+            STORAGES=storages, STATIC_ROOT=self.directory, ASSET_BUILD_DIR=f"{self.directory}/build", ASSET_BUNDLES=True,
+        ):
+            finders.get_finder.cache_clear()
+            self.addCleanup(finders.get_finder.cache_clear)
+            call_command("collectstatic", interactive=False, verbosity=0)
+            url = Template("{% load assets %}{% asset_bundle 'site.css' %}").render(Context())
+        with open(f"{self.directory}/staticfiles.json") as handle:
+            hashed = json.load(handle)["paths"]["bundles/site.css"]
+        self.assertRegex(hashed, r"^bundles/site\.[0-9a-f]{12}\.css$")
+        self.assertIn(f"/static/{hashed}", url)
+        with open(f"{self.directory}/{hashed}") as handle:
+            self.assertRegex(handle.read(), r'fontawesome-webfont\.[0-9a-f]{12}\.woff2\?v=4\.7\.0')
+
+
+class ResponseCompressionTests(TestCase):
+    def setUp(self):
+        Room.objects.create(
+            title="Garden", category="STD", description="Quiet", price="80.00", size=200, beds="1 Double",
+        )
+
+    def test_minify_keeps_preformatted_blocks(self):
+        html = "<div>\n    <p>a  b</p>\n    <!-- note -->\n</div>\n<pre>\n  x\n</pre><textarea>\n y</textarea><script>\n// c\nf()</script>"
+        self.assertEqual(
+            compression.minify_html(html),
+            "<div>\n<p>a  b</p>\n</div>\n<pre>\n  x\n</pre><textarea>\n y</textarea><script>\n// c\nf()</script>",
+        )
+        self.assertEqual(compression.negotiate("gzip;q=0, deflate"), None)
+        self.assertEqual(compression.negotiate("deflate, gzip"), "gzip")
+
+    def test_html_is_minified_and_gzipped(self):
+        plain = self.client.get(reverse("room_list"))
+        response = self.client.get(reverse("room_list"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        sizes = response.wsgi_request.response_bytes
+        self.assertEqual(sizes["sent"], len(response.content))
+        self.assertGreater(sizes["original"], len(plain.content))
+        self.assertIn(b'\n<main>\n<div id="rooms">\n<div class="container">', plain.content)
+
+    def test_pages_with_csrf_tokens_are_not_compressed(self):
+        response = self.client.get(reverse("login"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertContains(response, "csrfmiddlewaretoken")
+
+    def test_streamed_exports_are_gzipped(self):
+        staff = User.objects.create_user("staff", "staff@example.com", "pass-12345", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse("admin_export", args=["bookings", "csv"]), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(gzip.decompress(b"".join(response.streaming_content)).startswith(b"id,status,"))
+
+
+class RouteBenchmarkTests(TestCase):
+    def test_every_route_stays_within_query_budget(self):
+        fixtures = seed_benchmark_data(rooms=4, bookings=20, customers=3)
+        report = run_benchmarks(fixtures, iterations=1, warmup=0)
+
+        self.assertEqual(set(report["routes"]), set(QUERY_BUDGETS))
+        self.assertEqual(check_budgets(report), [])
+
+    def test_budget_violation_is_reported(self):
+        report = {"routes": {"index": {"queries": 9, "status": 200}}}
+        self.assertEqual(check_budgets(report, {"index": 4}), ["index: 9 queries (budget 4)"])
+
+    def test_connection_benchmark_reports_each_request(self):
+        result = benchmark_connection_reuse(iterations=5, conn_max_age=0)
+        self.assertEqual(result["iterations"], 5)
+        self.assertIn("p95", result["latency_ms"])
+
+    def test_per_request_connections_bypass_the_pool(self):
+        options = connection.settings_dict["OPTIONS"]
+        pooled = dict(options, pool=True)
+        connection.settings_dict["OPTIONS"] = pooled
+        self.addCleanup(connection.settings_dict.__setitem__, "OPTIONS", options)
+        seen = []
+
+        def record(**kwargs):
+            seen.append("pool" in connection.settings_dict["OPTIONS"])
+
+        request_started.connect(record)
+        self.addCleanup(request_started.disconnect, record)
+        benchmark_connection_reuse(iterations=2, conn_max_age=0)
+        self.assertEqual(seen, [False, False])
+        self.assertIs(connection.settings_dict["OPTIONS"], pooled)
+
+
+class FakeProviderTests(LiveServerTestCase):
+    def setUp(self):
+        self.provider = FakeProviderServer(("127.0.0.1", 0), FakeProviderConfig(callback_delay_ms=200))
+        threading.Thread(target=self.provider.serve_forever, daemon=True).start()
+        self.addCleanup(self.provider.server_close)
+        self.addCleanup(self.provider.shutdown)
+
+        room = Room.objects.create(
+            title="Standard", category="STD", description="Cosy", price="50.00", size=200, beds="1 Bed",
+        )
+        self.booking = Booking.objects.create(
+            room=room, first_name="Jane", last_name="Doe", mobile="0712345678", email="jane@example.com",
+            check_in=date.today(), check_out=date.today() + timedelta(days=1), total_price="50.00",
+        )
+
+    def test_stk_push_round_trip_confirms_booking_via_callback(self):
+        overrides = settings_for(self.provider.base_url, self.live_server_url)
+        with override_settings(
+            MPESA_CONSUMER_KEY="key", MPESA_CONSUMER_SECRET="secret", MPESA_SHORTCODE="174379",
+            MPESA_PASSKEY="passkey", **overrides,
+        ):
+            response = self.client.post(
+                reverse("mpesa_stk_push"), {"booking_id": self.booking.id, "phone": "0712345678"},
+            )
+        self.assertRedirects(response, reverse("booking_confirmation", args=[self.booking.id]))
+
+        payment = Payment.objects.get(booking=self.booking)
+        deadline = time.monotonic() + 5
+        while payment.status == "PENDING" and time.monotonic() < deadline:
+            time.sleep(0.05)
+            payment.refresh_from_db()
+        self.assertEqual(payment.status, "SUCCEEDED")
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "CONFIRMED")
+
+    def test_error_rate_returns_provider_failures(self):
+        self.provider.config.error_rate = 1.0
+        response = requests.post(f"{self.provider.base_url}/v1/oauth2/token", timeout=5)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(requests.get(f"{self.provider.base_url}/__stats__", timeout=5).json()["errors"], 1)
+
+
+class AsyncPaymentViewTests(LiveServerTestCase):
+    def setUp(self):
+        self.provider = FakeProviderServer(("127.0.0.1", 0), FakeProviderConfig(callback_delay_ms=200))
+        threading.Thread(target=self.provider.serve_forever, daemon=True).start()
+        self.addCleanup(self.provider.server_close)
+        self.addCleanup(self.provider.shutdown)
+        self.factory = AsyncRequestFactory()
+
+        room = Room.objects.create(
+            title="Standard", category="STD", description="Cosy", price="50.00", size=200, beds="1 Bed",
+        )
+        self.booking = Booking.objects.create(
+            room=room, first_name="Jane", last_name="Doe", mobile="0712345678", email="jane@example.com",
+            check_in=date.today(), check_out=date.today() + timedelta(days=1), total_price="50.00",
+        )
+
+    def _post(self, name, data):
+        request = self.factory.post(reverse(name), data)
+        request._messages = CookieStorage(request)
+        return request
+
+    async def test_async_stk_push_confirms_booking_via_callback(self):
+        overrides = settings_for(self.provider.base_url, self.live_server_url)
+        with override_settings(
+            MPESA_CONSUMER_KEY="key", MPESA_CONSUMER_SECRET="secret", MPESA_SHORTCODE="174379",
+            MPESA_PASSKEY="passkey", **overrides,
+        ):
+            response = await async_views.mpesa_stk_push(
+                self._post("mpesa_stk_push", {"booking_id": self.booking.id, "phone": "0712345678"})
+            )
+            await async_views.aclose_http_client()
+        self.assertEqual(response.url, reverse("booking_confirmation", args=[self.booking.id]))
+
+        payment = await Payment.objects.aget(booking=self.booking)
+        deadline = time.monotonic() + 5
+        while payment.status == "PENDING" and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            await payment.arefresh_from_db()
+        self.assertEqual(payment.status, "SUCCEEDED")
+        await self.booking.arefresh_from_db()
+        self.assertEqual(self.booking.status, "CONFIRMED")
+
+    async def test_async_stripe_intent_and_confirm(self):
+        with override_settings(STRIPE_SECRET_KEY="sk_test", **settings_for(self.provider.base_url)):
+            response = await async_views.stripe_create_intent(
+                self._post("stripe_create_intent", {"booking_id": self.booking.id})
+            )
+            created = json.loads(response.content)
+            payment = await Payment.objects.aget(id=created["payment_id"])
+            response = await async_views.stripe_confirm(
+                self._post(
+                    "stripe_confirm", {"payment_id": payment.id, "payment_intent_id": payment.reference},
+                )
+            )
+            await async_views.aclose_http_client()
+        self.assertEqual(json.loads(response.content)["status"], "SUCCEEDED")
+        await self.booking.arefresh_from_db()
+        self.assertEqual(self.booking.status, "CONFIRMED")
+
+    def test_http_client_is_closed_with_its_event_loop(self):
+        async def client():
+            return async_views._http_client()
+
+        # Under WSGI each async view gets a new event loop.
+        first = asyncio.run(client())
+        second = asyncio.run(client())
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed)
+        self.assertTrue(second.is_closed)
+
+
+class TrafficCaptureTests(TestCase):
+    def test_capture_records_route_without_unsafe_params(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TRAFFIC_CAPTURE_ENABLED=True, TRAFFIC_CAPTURE_DIR=directory):
+                self.client.get(reverse("room_list"), {"check_in": "2030-01-01", "token": "secret-token"})
+            records = load_records(capture_files(directory))
+
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual(record["route"], "room_list")
+        self.assertEqual(record["query"], {"check_in": "2030-01-01"})
+        self.assertEqual(record["dropped_params"], ["token"])
+        self.assertNotIn("secret-token", json.dumps(record))
+
+    def test_middleware_instances_share_one_log_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(TRAFFIC_CAPTURE_ENABLED=True, TRAFFIC_CAPTURE_DIR=directory):
+                first = TrafficCaptureMiddleware(lambda request: HttpResponse())
+                second = TrafficCaptureMiddleware(lambda request: HttpResponse())
+            self.assertIs(first.logger, second.logger)
+            self.assertEqual(len(second.logger.handlers), 1)
+            second.logger.handlers[0].close()
+
+
+class TrafficReplayTests(LiveServerTestCase):
+    def test_replay_reports_latency_per_route(self):
+        records = [
+            {"ts": 0.0, "route": "index", "method": "GET", "path": "/", "query": {}},
+            {"ts": 0.1, "route": "room_list", "method": "GET", "path": "/rooms/", "query": {}},
+            {"ts": 0.2, "route": "booking", "method": "POST", "path": "/booking/", "query": {}},
+        ]
+        report = replay(records, self.live_server_url, speed=10, concurrency=2)
+
+        self.assertEqual(report["requests"], 2)
+        self.assertEqual(set(report["routes"]), {"index", "room_list"})
+        self.assertEqual(report["routes"]["index"]["errors"], 0)
+
+
+class DatabaseUrlTests(SimpleTestCase):
+    def test_postgres_defaults_to_persistent_connections_with_health_checks(self):
+        config = _database_config_from_url("postgresql://u:p@db.example.com/hotel?sslmode=require")
+        self.assertEqual(config["CONN_MAX_AGE"], 60)
+        self.assertTrue(config["CONN_HEALTH_CHECKS"])
+        self.assertEqual(config["OPTIONS"]["sslmode"], "require")
+        self.assertEqual(config["OPTIONS"]["application_name"], "royal-hotel")
+
+    def test_sqlite_production_profile_applies_pragmas(self):
+        config = _database_config_from_url("sqlite:///data/hotel.sqlite3?profile=production&busy_timeout=8000")
+        self.assertEqual(config["ENGINE"], "django.db.backends.sqlite3")
+        self.assertTrue(str(config["NAME"]).endswith("data/hotel.sqlite3"))
+        self.assertEqual(config["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+        self.assertEqual(config["OPTIONS"]["timeout"], 8)
+        self.assertIn("PRAGMA journal_mode=WAL", config["OPTIONS"]["init_command"])
+        self.assertIn("PRAGMA busy_timeout=8000", config["OPTIONS"]["init_command"])
+
+    def test_sqlite_default_profile_is_untouched(self):
+        config = _database_config_from_url("")
+        self.assertNotIn("OPTIONS", config)
+
+    def test_pool_and_timeouts_from_query_string(self):
+        config = _database_config_from_url(
+            "postgres://u:p@ep-x-pooler.neon.tech/hotel"
+            "?pool=true&pool_min_size=2&pool_max_size=8&pool_timeout=5"
+            "&statement_timeout=3000&application_name=web&conn_max_age=300"
+        )
+        self.assertEqual(config["OPTIONS"]["pool"], {"min_size": 2, "max_size": 8, "timeout": 5.0})
+        self.assertEqual(config["CONN_MAX_AGE"], 0)
+        self.assertEqual(config["OPTIONS"]["options"], "-c statement_timeout=3000")
+        self.assertEqual(config["OPTIONS"]["application_name"], "web")
+        self.assertTrue(config["DISABLE_SERVER_SIDE_CURSORS"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_STICKY_SECONDS=15)
+class ReplicaRoutingTests(SimpleTestCase):
+    def _run(self, request):
+        seen = {}
+
+        def view(request):
+            seen["replica"] = reading_from_replica()
+            return HttpResponse("ok")
+
+        def get_response(request):
+            request.resolver_match = resolve(request.path_info)
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        return seen["replica"], response
+
+    def test_catalog_get_reads_from_replica(self):
+        used_replica, _ = self._run(RequestFactory().get(reverse("room_list")))
+        self.assertTrue(used_replica)
+        self.assertFalse(reading_from_replica())
+
+    async def test_catalog_get_reads_from_replica_under_asgi(self):
+        seen = {}
+
+        async def view(request):
+            seen["replica"] = reading_from_replica()
+            return HttpResponse("ok")
+
+        async def get_response(request):
+            request.resolver_match = resolve(request.path_info)
+            await middleware.process_view(request, view, (), {})
+            return await view(request)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        await middleware(AsyncRequestFactory().get(reverse("room_list")))
+        self.assertTrue(seen["replica"])
+        self.assertFalse(reading_from_replica())
+
+    def test_write_pins_client_to_primary(self):
+        used_replica, response = self._run(RequestFactory().post(reverse("booking")))
+        self.assertFalse(used_replica)
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+        request = RequestFactory().get(reverse("room_list"))
+        request.COOKIES[PRIMARY_PIN_COOKIE] = "1"
+        used_replica, _ = self._run(request)
+        self.assertFalse(used_replica)
+
+    def test_router_only_uses_replica_inside_replica_reads(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Room), "default")
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Room), "replica_1")
+            self.assertEqual(router.db_for_write(Room), "default")
+
+    def test_replica_urls_are_parsed_like_database_url(self):
+        replicas = _replica_databases(["postgres://u:p@replica-a/hotel", "postgres://u:p@replica-b/hotel"])
+        self.assertEqual(list(replicas), ["replica_1", "replica_2"])
+        self.assertEqual(replicas["replica_2"]["HOST"], "replica-b")
+        self.assertEqual(replicas["replica_1"]["TEST"], {"MIRROR": "default"})
+
+
+class CompletedBookingSweepTests(TestCase):
+    def _past_confirmed_booking(self):
+        return Booking.objects.create(
+            first_name="Jane", last_name="Doe", mobile="0712345678", email="jane@example.com",
+            check_in=date.today() - timedelta(days=3), check_out=date.today() - timedelta(days=1),
+            status="CONFIRMED",
+        )
+
+    @override_settings(BOOKING_COMPLETION_SWEEP_SECONDS=3600)
+    def test_sweep_runs_at_most_once_per_interval(self):
+        views._last_completion_sweep = None
+        first = self._past_confirmed_booking()
+        views._mark_completed_bookings()
+        second = self._past_confirmed_booking()
+        views._mark_completed_bookings()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, "COMPLETED")
+        self.assertEqual(second.status, "CONFIRMED")
+
+
+class InventoryTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(
+            title="Twin", category="STD", description="Two beds", price="60.00", size=20, beds=2, units=2,
+        )
+        self.check_in = date.today() + timedelta(days=10)
+
+    def _stay(self, first, last, status="CONFIRMED"):
+        return Booking.objects.create(
+            first_name="Ann", last_name="Lee", mobile="0711111111", email="ann@example.com", room=self.room,
+            check_in=self.check_in + timedelta(days=first), check_out=self.check_in + timedelta(days=last),
+            status=status,
+        )
+
+    def test_room_type_sells_until_every_unit_is_taken_on_some_night(self):
+        self._stay(0, 2)
+        self._stay(1, 3)
+        self._stay(0, 3, status="CANCELLED")
+        self.assertEqual(inventory.units_left([self.room], self.check_in, self.check_in + timedelta(days=1)),
+                         {self.room.pk: 1})
+        self.assertFalse(inventory.is_available(self.room, self.check_in, self.check_in + timedelta(days=3)))
+        # Back-to-back stays share a unit: one checks out the morning the other arrives.
+        later = self.check_in + timedelta(days=2)
+        self.assertTrue(inventory.is_available(self.room, later, later + timedelta(days=2)))
+
+        params = {"check_in": self.check_in.isoformat(), "check_out": (self.check_in + timedelta(days=1)).isoformat()}
+        response = self.client.get(reverse("room_list"), params)
+        self.assertContains(response, "1 left for your dates")
+        params["check_out"] = (self.check_in + timedelta(days=2)).isoformat()
+        self.assertNotContains(self.client.get(reverse("room_list"), params), "Two beds")
+
+    def test_out_of_service_units_are_not_sold(self):
+        RoomUnit.objects.create(room=self.room, number="101")
+        RoomUnit.objects.create(room=self.room, number="102")
+        RoomUnit.objects.create(room=self.room, number="103", active=False)
+        check_out = self.check_in + timedelta(days=1)
+        self.assertEqual(inventory.units_left([self.room], self.check_in, check_out), {self.room.pk: 2})
+
+        self._stay(0, 1)
+        RoomUnit.objects.filter(number="102").update(active=False)
+        self.assertFalse(inventory.is_available(self.room, self.check_in, check_out))
+        today = self.check_in - timedelta(days=10)
+        self.assertEqual(inventory.units_left([self.room], today, today + timedelta(days=1)), {self.room.pk: 1})
+        room = inventory.with_units_booked(Room.objects.all(), self.check_in).get()
+        self.assertEqual((room.sellable, room.units_booked, room.is_booked), (1, 1, True))
+
+    def test_check_in_assigns_a_free_active_unit(self):
+        RoomUnit.objects.create(room=self.room, number="101")
+        RoomUnit.objects.create(room=self.room, number="102", active=False)
+        RoomUnit.objects.create(room=self.room, number="103")
+        first, second, third = self._stay(0, 2), self._stay(1, 3), self._stay(2, 4)
+
+        self.assertEqual(inventory.assign_unit(first).number, "101")
+        self.assertEqual(inventory.assign_unit(second).number, "103")
+        self.assertEqual(inventory.assign_unit(third).number, "101")
+        self.assertIsNone(inventory.assign_unit(self._stay(1, 2)))
+        self.assertEqual(Booking.objects.get(pk=second.pk).unit.number, "103")
+
+
+class RateCalendarTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(
+            title="Garden", category="STD", description="Quiet", price=Decimal("100.00"), size=20, beds=2,
+        )
+        self.other = Room.objects.create(
+            title="Loft", category="DLX", description="Airy", price=Decimal("200.00"), size=40, beds=2,
+        )
+        RateRule.objects.create(name="Weekends", weekdays="5,6", percent="20")
+        RateRule.objects.create(
+            name="Standard summer", category="STD", start=self.friday, end=self.friday, price="90.00", priority=1,
+        )
+
+    @property
+    def friday(self):
+        today = timezone.localdate()
+        return today + timedelta(days=(4 - today.weekday()) % 7 + 7)
+
+    def test_quotes_match_with_and_without_the_calendar(self):
+        check_in, check_out = self.friday - timedelta(days=1), self.friday + timedelta(days=2)
+        expected = {self.room.pk: Decimal("310.00"), self.other.pk: Decimal("680.00")}
+        self.assertEqual(rates.quote_many([self.room, self.other], check_in, check_out), expected)
+
+        self.assertEqual(rates.rebuild(), 2 * settings.RATE_CALENDAR_DAYS)
+        self.assertEqual(NightlyRate.objects.get(room=self.other, date=self.friday).price, Decimal("240.00"))
+        with self.assertNumQueries(1):
+            self.assertEqual(rates.quote_many([self.room, self.other], check_in, check_out), expected)
+
+    def test_booking_is_priced_from_the_calendar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RateRule.objects.create(
+                name="Loft event", room=self.other, start=self.friday, end=self.friday, price="500.00",
+            )
+        self.assertEqual(NightlyRate.objects.get(room=self.other, date=self.friday).price, Decimal("500.00"))
+
+        self.client.post(reverse("booking"), {
+            "fname": "Ann", "lname": "Lee", "mobile": "0711111111", "email": "ann@example.com", "room_id": self.other.pk,
+            "date-1": self.friday.isoformat(), "date-2": (self.friday + timedelta(days=2)).isoformat(), "guests": "2",
+        })
+        self.assertEqual(Booking.objects.get().total_price, Decimal("740.00"))
+
+    def test_rules_with_bad_weekdays_are_ignored(self):
+        RateRule.objects.create(name="Typo", weekdays="5,Sat", price="1.00", priority=5)
+        with self.assertLogs("booking.rates", "WARNING"):
+            total = rates.quote(self.other, self.friday, self.friday + timedelta(days=1))
+        self.assertEqual(total, Decimal("240.00"))
+
+    def test_discount_must_leave_a_price(self):
+        with self.assertRaises(ValidationError) as raised:
+            RateRule(name="Free", percent="-100").full_clean()
+        self.assertIn("percent", raised.exception.message_dict)
+        RateRule(name="Half", percent="-50").full_clean()
+
+
+class PaymentStatusTests(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.booking = Booking.objects.create(
+            first_name="Jane", last_name="Doe", mobile="0712345678", email="jane@example.com",
+            check_in=date.today(), check_out=date.today() + timedelta(days=1), total_price="50.00",
+        )
+        self.url = reverse("payment_status", args=[self.booking.id])
+
+    def _payment(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Payment.objects.create(
+                booking=self.booking, provider="MPESA", amount="50.00", reference="ws_CO_1", **kwargs,
+            )
+
+    def test_payment_save_bumps_version(self):
+        self.assertIsNone(self.client.get(self.url).json()["payment"])
+        payment = self._payment()
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["payment"]["id"], payment.id)
+        self.assertEqual(data["payment"]["status"], "PENDING")
+        self.assertEqual(data["version"], 1)
+
+    def test_wait_is_clamped_without_async_views_and_a_shared_cache(self):
+        self._payment()
+        started = time.monotonic()
+        self.assertEqual(self.client.get(self.url, {"since": 1, "wait": 10}).json()["version"], 1)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertContains(self.client.get(reverse("booking_confirmation", args=[self.booking.id])), 'data-wait="0"')
+
+    @override_settings(PAYMENT_STATUS_POLL_SECONDS=5, ASYNC_PAYMENT_VIEWS=True)
+    def test_long_poll_wakes_on_publish(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        shared = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir}}
+        self.enterContext(override_settings(CACHES={**settings.CACHES, **shared}))
+        self._payment()
+        timer = threading.Timer(0.2, payment_status.publish, args=[self.booking.id])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        started = time.monotonic()
+        data = self.client.get(self.url, {"since": 1, "wait": 10}).json()
+        self.assertLess(time.monotonic() - started, 4)
+        self.assertEqual(data["version"], 2)
+
+    @override_settings(PAYMENT_STATUS_MPESA_QUERY_AFTER_SECONDS=60)
+    def test_stale_mpesa_payment_is_queried_once(self):
+        payment = self._payment()
+        Payment.objects.filter(id=payment.id).update(created_at=timezone.now() - timedelta(minutes=5))
+        with mock.patch.object(views, "_mpesa_query_stk_status", return_value=({"ResultCode": "0"}, None)) as query:
+            self.assertEqual(self.client.get(self.url).json()["payment"]["status"], "SUCCEEDED")
+            self.client.get(self.url)
+        self.assertEqual(query.call_count, 1)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, "CONFIRMED")
+
+
+class CacheUrlTests(SimpleTestCase):
+    def test_supported_schemes(self):
+        self.assertEqual(
+            cache_config_from_url("")["BACKEND"], "django.core.cache.backends.locmem.LocMemCache"
+        )
+        filebased = cache_config_from_url("file:///var/tmp/hotel-cache?timeout=600")
+        self.assertEqual(filebased["LOCATION"], "/var/tmp/hotel-cache")
+        self.assertEqual(filebased["TIMEOUT"], 600)
+        memcached = cache_config_from_url("memcached://127.0.0.1:11211,127.0.0.1:11212")
+        self.assertEqual(memcached["LOCATION"], ["127.0.0.1:11211", "127.0.0.1:11212"])
+        redis = cache_config_from_url("redis://127.0.0.1:6379/1?timeout=none")
+        self.assertEqual(redis["LOCATION"], "redis://127.0.0.1:6379/1")
+        self.assertIsNone(redis["TIMEOUT"])
+
+    def test_database_backend_prefix_and_version(self):
+        config = cache_config_from_url("db://hotel_cache?key_prefix=blue&version=3")
+        self.assertEqual(config["BACKEND"], "django.core.cache.backends.db.DatabaseCache")
+        self.assertEqual(config["LOCATION"], "hotel_cache")
+        self.assertEqual(config["KEY_PREFIX"], "blue")
+        self.assertEqual(config["VERSION"], 3)
+
+    def test_named_caches_fall_back_to_shared_url_with_distinct_prefixes(self):
+        env = {
+            "CACHE_URL": "redis://cache:6379/0",
+            "CACHE_URL_PAGES": "file:///srv/page-cache",
+            "CACHE_KEY_PREFIX": "hotel-prod",
+            "CACHE_VERSION": "2",
+        }
+        with mock.patch.dict("os.environ", env):
+            configured = caches_from_env()
+
+        self.assertEqual(set(configured), {"default", "sessions", "ratelimit", "pages"})
+        self.assertEqual(configured["sessions"]["LOCATION"], "redis://cache:6379/0")
+        self.assertEqual(configured["sessions"]["KEY_PREFIX"], "hotel-prod:sessions")
+        self.assertEqual(configured["ratelimit"]["VERSION"], 2)
+        self.assertEqual(configured["pages"]["BACKEND"], "django.core.cache.backends.filebased.FileBasedCache")
+
+    def test_cache_benchmark_measures_each_operation(self):
+        result = benchmark_cache(caches["default"], iterations=5)
+        self.assertEqual(set(result), {"set", "get", "get_miss", "incr"})
+
+    def test_unknown_scheme_is_rejected(self):
+        with self.assertRaises(ValueError):
+            cache_config_from_url("couchbase://localhost")
+
+
+class InvoiceCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storages = dict(settings.STORAGES, invoices={
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": directory.name},
+        })
+        override = override_settings(STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.booking = Booking.objects.create(
+            first_name="Jane", last_name="Doe", mobile="0712345678", email="jane@example.com",
+            check_in=date.today(), check_out=date.today() + timedelta(days=1), total_price="50.00",
+        )
+        self.url = reverse("invoice_pdf", args=[self.booking.id])
+
+    def _cached_files(self):
+        try:
+            return invoice_storage().listdir(str(self.booking.id))[1]
+        except FileNotFoundError:
+            return []
+
+    def test_invoice_is_cached_and_revalidated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        etag = response["ETag"]
+        self.assertEqual(len(self._cached_files()), 1)
+
+        with mock.patch("booking.invoices.render_invoice") as render:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_invoice_removed_between_render_and_open_is_rendered_again(self):
+        storage = invoice_storage()
+        original_open = storage.open
+        removed = []
+
+        def open_after_invalidation(name, mode="rb"):
+            if not removed:
+                removed.append(name)
+                storage.delete(name)
+            return original_open(name, mode)
+
+        with mock.patch.object(storage, "open", side_effect=open_after_invalidation):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        self.assertEqual(len(removed), 1)
+        self.assertEqual(len(self._cached_files()), 1)
+
+    def test_booking_change_invalidates_invoice(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.booking.guests = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.save()
+        self.assertEqual(self._cached_files(), [])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class RoomImageTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storages = dict(
+            settings.STORAGES,
+            default={"BACKEND": "django.core.files.storage.FileSystemStorage", "OPTIONS": {"location": directory.name}},
+            room_images={
+                "BACKEND": "django.core.files.storage.FileSystemStorage",
+                "OPTIONS": {"location": f"{directory.name}/renditions"},
+            },
+        )
+        override = override_settings(STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _photo(self, size=(1000, 500)):
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (200, 40, 40)).save(buffer, "JPEG")
+        return SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+    def _room(self, **kwargs):
+        return Room.objects.create(
+            title="Garden", category="STD", description="Quiet", price="80.00", size=200, beds="1 Double", **kwargs,
+        )
+
+    def test_saving_an_image_renders_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            room = self._room(image=self._photo())
+        room.refresh_from_db()
+        self.assertEqual((room.image_width, room.image_height), (1000, 500))
+        # thumbnail 160/320, card 400/800, hero 800 and the 1000px original width.
+        names = images.image_storage().listdir(room.image_digest)[1]
+        self.assertCountEqual(names, [f"{width}.{fmt}" for width in (160, 320, 400, 800, 1000) for fmt in ("webp", "jpg")])
+        with images.image_storage().open(f"{room.image_digest}/400.webp") as derivative:
+            self.assertEqual(Image.open(derivative).size, (400, 200))
+
+        storage = images.image_storage()
+        self.assertEqual(images.ensure_derivative(room, 400, "webp"), f"{room.image_digest}/400.webp")
+        storage.save(f"{room.image_digest}/400_abc1234.webp", io.BytesIO(b"twin"))
+        storage.save(f"{room.image_digest}/.partial-old", io.BytesIO(b"half"))
+        storage.save(f"{room.image_digest}/.partial-new", io.BytesIO(b"half"))
+        two_hours_ago = time.time() - 2 * 3600
+        os.utime(storage.path(f"{room.image_digest}/.partial-old"), (two_hours_ago, two_hours_ago))
+        self.assertEqual(images.prune(), 0)
+        self.assertEqual(len(storage.listdir(room.image_digest)[1]), 11)
+        self.assertTrue(storage.exists(f"{room.image_digest}/.partial-new"))
+
+        digest = room.image_digest
+        room.image = self._photo(size=(600, 600))
+        with self.captureOnCommitCallbacks(execute=True):
+            room.save()
+        room.refresh_from_db()
+        self.assertNotEqual(room.image_digest, digest)
+        self.assertEqual(images.prune(), 1)
+
+    def test_template_tag_and_lazy_derivative(self):
+        room = self._room()
+        Room.objects.filter(pk=room.pk).update(image=default_storage.save("room/photo.jpg", self._photo()))
+        room.refresh_from_db()
+        html = Template("{% load room_images %}{% room_picture room 'card' %}").render(Context({"room": room}))
+        self.assertTrue(room.image_digest)
+        url = reverse("room_image", args=[room.pk, room.image_digest, 800, "webp"])
+        self.assertIn(f"{url} 800w", html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('width="400" height="200"', html)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertEqual(response["Cache-Control"], images.IMMUTABLE)
+        self.assertEqual(Image.open(io.BytesIO(b"".join(response.streaming_content))).size, (800, 400))
+
+        self.assertEqual(self.client.get(reverse("room_image", args=[room.pk, room.image_digest, 555, "jpg"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("room_image", args=[room.pk, "0" * 64, 400, "jpg"])).status_code, 404)
+
+
+class InvoiceExportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        storages = dict(settings.STORAGES, invoices={
+            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "OPTIONS": {"location": f"{directory.name}/cache"},
+        })
+        override = override_settings(STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        for day, status in ((1, "CONFIRMED"), (2, "COMPLETED"), (3, "PENDING"), (40, "CONFIRMED")):
+            Booking.objects.create(
+                first_name="Jane", last_name="Doe", mobile="0712345678", email="jane@example.com",
+                check_in=date(2026, 3, 1) + timedelta(days=day), check_out=date(2026, 3, 2) + timedelta(days=day),
+                total_price="50.00", status=status,
+            )
+
+    def test_command_writes_zip_for_range_and_status(self):
+        output = f"{self.directory}/march.zip"
+        out = io.StringIO()
+        call_command("export_invoices", output, "--from", "2026-03-01", "--to", "2026-03-31", "--workers", "2", stdout=out)
+
+        with zipfile.ZipFile(output) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 2)
+            self.assertTrue(all(archive.read(name).startswith(b"%PDF") for name in names))
+        self.assertIn("2/2 invoices", out.getvalue())
+        self.assertEqual(sum(len(invoice_storage().listdir(folder)[1]) for folder in invoice_storage().listdir("")[0]), 2)
+
+    def test_admin_action_streams_zip(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pass-12345")
+        self.client.force_login(admin_user)
+        ids = list(Booking.objects.values_list("id", flat=True))
+        response = self.client.post(
+            reverse("admin:booking_booking_changelist"),
+            {"action": "export_invoices", "_selected_action": ids},
+        )
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with mock.patch("booking.invoice_export.ProcessPoolExecutor") as pool:
+            content = b"".join(response.streaming_content)
+        pool.assert_not_called()
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertEqual(len(archive.namelist()), 4)
+
+
+class DataExportTests(TestCase):
+    def setUp(self):
+        booking = Booking.objects.create(
+            first_name="Jane", last_name="Doe", mobile="0712345678", email="jane@example.com",
+            check_in=date(2026, 3, 5), check_out=date(2026, 3, 6), total_price="50.00", status="CONFIRMED",
+        )
+        Payment.objects.create(booking=booking, provider="MPESA", status="SUCCEEDED", amount="50.00",
+                               raw_response={"phone": "254712345678"})
+        Payment.objects.create(booking=booking, provider="STRIPE", status="FAILED", amount="50.00")
+
+    def test_command_filters_and_excludes_raw_response(self):
+        out = io.StringIO()
+        call_command("export_data", "payments", "--format", "jsonl", "--provider", "MPESA", stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["provider"], "MPESA")
+        self.assertNotIn("raw_response", rows[0])
+
+        out = io.StringIO()
+        call_command("export_data", "payments", "--column", "id", "--column", "raw_response", "--status", "SUCCEEDED", stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[0], "id,raw_response")
+        self.assertIn("254712345678", out.getvalue())
+
+    def test_staff_view_streams_csv(self):
+        staff = User.objects.create_user("staff", "staff@example.com", "pass-12345", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(
+            reverse("admin_export", args=["bookings", "csv"]), {"from": "2026-03-01", "to": "2026-03-31"},
+        )
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith("id,status,first_name"))
+
+        response = self.client.get(reverse("admin_export", args=["bookings", "csv"]), {"column": "bogus"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(
+            title="Garden Suite", category="DLX", description="Quiet", price="80.00", size=30, beds=2,
+        )
+        Booking.objects.create(
+            first_name="Old", last_name="Guest", mobile="0700000000", email="old@example.com", room=self.room,
+            check_in=date(2026, 5, 1), check_out=date(2026, 5, 5), total_price="320.00", status="CONFIRMED",
+        )
+
+    def _booking(self, **fields):
+        record = {
+            "first_name": "Ann", "last_name": "Lee", "mobile": "0711111111", "email": "ann@example.com",
+            "room_id": self.room.id, "status": "COMPLETED", "total_price": "80.00",
+        }
+        record.update(fields)
+        return json.dumps(record)
+
+    def test_bookings_report_overlaps_and_bad_rows_by_line(self):
+        lines = [
+            self._booking(check_in="2026-04-28", check_out="2026-05-01"),
+            self._booking(check_in="2026-05-04", check_out="2026-05-06"),
+            self._booking(check_in="2026-04-20", check_out="2026-04-29"),
+            self._booking(check_in="2026-05-10", check_out="2026-05-09"),
+            "{not json",
+            self._booking(check_in="2026-04-20", check_out="2026-04-29", status="CANCELLED"),
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as f:
+            f.write("\n".join(lines))
+            f.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command("import_data", "bookings", f.name, "--batch-size", "2", stdout=out, stderr=err)
+
+        self.assertEqual(Booking.objects.count(), 3)
+        errors = err.getvalue()
+        self.assertIn("line 2: check_in: Overlaps", errors)
+        self.assertIn("line 3: check_in: Overlaps", errors)
+        self.assertIn("line 4: check_out:", errors)
+        self.assertIn("line 5: Invalid JSON", errors)
+        self.assertIn("2 bookings imported, 4 rows rejected", out.getvalue())
+
+    def test_bookings_overlapping_archived_stays_are_rejected(self):
+        ArchivedBooking.objects.create(
+            id=9001, first_name="Older", last_name="Guest", mobile="0700000000", email="older@example.com", room=self.room,
+            check_in=date(2026, 3, 1), check_out=date(2026, 3, 5), total_price="320.00", status="COMPLETED",
+            created_at=timezone.now(), updated_at=timezone.now(),
+        )
+        lines = [
+            self._booking(check_in="2026-03-04", check_out="2026-03-06"),
+            self._booking(check_in="2026-03-05", check_out="2026-03-06"),
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as f:
+            f.write("\n".join(lines))
+            f.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command("import_data", "bookings", f.name, stdout=out, stderr=err)
+
+        self.assertIn("line 1: check_in: Overlaps", err.getvalue())
+        self.assertIn("1 bookings imported, 1 rows rejected", out.getvalue())
+
+    def test_bookings_fill_every_unit_of_a_room_type(self):
+        self.room.units = 2
+        self.room.save()
+        lines = [
+            self._booking(check_in="2026-05-03", check_out="2026-05-06"),
+            self._booking(check_in="2026-05-04", check_out="2026-05-05"),
+            self._booking(check_in="2026-05-05", check_out="2026-05-07"),
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as f:
+            f.write("\n".join(lines))
+            f.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command("import_data", "bookings", f.name, stdout=out, stderr=err)
+
+        self.assertIn("line 2: check_in: Overlaps", err.getvalue())
+        self.assertIn("2 bookings imported, 1 rows rejected", out.getvalue())
+
+    def test_bookings_only_fill_active_units(self):
+        self.room.units = 2
+        self.room.save()
+        RoomUnit.objects.create(room=self.room, number="1")
+        RoomUnit.objects.create(room=self.room, number="2", active=False)
+        lines = [
+            self._booking(check_in="2026-06-01", check_out="2026-06-03"),
+            self._booking(check_in="2026-06-02", check_out="2026-06-04"),
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as f:
+            f.write("\n".join(lines))
+            f.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command("import_data", "bookings", f.name, stdout=out, stderr=err)
+
+        self.assertIn("line 2: check_in: Overlaps", err.getvalue())
+        self.assertIn("1 bookings imported, 1 rows rejected", out.getvalue())
+
+    def test_admin_upload_of_rooms_csv(self):
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pass-12345")
+        self.client.force_login(admin_user)
+        upload = io.BytesIO(
+            "\ufefftitle,category,description,price,size,beds,available\n"
+            "Lake View,DLX,Big windows,120.00,40,2,yes\n"
+            "Broken,DLX,No price,,40,2,no\n".encode("utf-8")
+        )
+        upload.name = "rooms.csv"
+        url = reverse("admin:booking_room_import")
+        response = self.client.post(url, {"file": upload, "format": "csv"})
+        self.assertContains(response, "1 imported")
+        self.assertContains(response, "price:")
+        self.assertTrue(Room.objects.get(title="Lake View").available)
+
+        upload.seek(0)
+        response = self.client.post(url, {"file": upload, "format": "csv", "dry_run": "on"})
+        self.assertContains(response, "dry run")
+        self.assertEqual(Room.objects.filter(title="Lake View").count(), 1)
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pass-12345"))
+        self.rooms = [
+            Room.objects.create(title=f"Room {n}", category="STD", description="Room", price="40.00", size=20, beds=1)
+            for n in range(2)
+        ]
+
+    def _bookings(self, count, **fields):
+        for n in range(count):
+            booking = Booking.objects.create(
+                first_name=fields.get("first_name", f"Guest{n}"), last_name=fields.get("last_name", "Smith"),
+                mobile="0700000000", email=f"guest{n}@example.com", room=self.rooms[n % 2],
+                check_in=date(2026, 6, 1), check_out=date(2026, 6, 3), total_price="80.00", status="CONFIRMED",
+            )
+            Payment.objects.create(booking=booking, provider="STRIPE", status="SUCCEEDED", amount="80.00")
+
+    def _query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for name in ("admin:booking_booking_changelist", "admin:booking_payment_changelist"):
+            self._bookings(3)
+            few = self._query_count(reverse(name))
+            self._bookings(30)
+            self.assertEqual(self._query_count(reverse(name)), few, name)
+
+    def test_search_and_room_autocomplete_filter(self):
+        self._bookings(4)
+        Booking.objects.filter(pk=Booking.objects.order_by("pk").first().pk).update(first_name="Jane", last_name="Doe")
+        url = reverse("admin:booking_booking_changelist")
+
+        response = self.client.get(url, {"q": "jane DOE"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+        response = self.client.get(url, {"room_id": self.rooms[1].pk, "status__exact": "CONFIRMED"})
+        self.assertEqual(response.context["cl"].result_count, 2)
+        self.assertContains(response, 'data-model-name="booking" data-field-name="room"')
+        self.assertContains(response, f'<option value="{self.rooms[1].pk}" selected>')
+        self.assertContains(response, 'data-query-string="?status__exact=CONFIRMED"')
+
+
+class BulkStatusTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "pass-12345"))
+        self.bookings = {}
+        for status in ("PENDING", "CONFIRMED", "CANCELLED", "COMPLETED"):
+            booking = Booking.objects.create(
+                first_name="Ann", last_name=status.title(), mobile="0700000000", email=f"{status.lower()}@example.com",
+                check_in=date(2026, 7, 1), check_out=date(2026, 7, 2), total_price="40.00", status=status,
+            )
+            self.bookings[status] = booking
+            Payment.objects.create(booking=booking, provider="STRIPE", status="PENDING", amount="40.00")
+
+    def _status(self, key):
+        return Booking.objects.get(pk=self.bookings[key].pk).status
+
+    def test_cancel_action_only_moves_allowed_bookings(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin:booking_booking_changelist"), {
+                "action": "cancel_bookings", "_selected_action": [b.pk for b in self.bookings.values()],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            [self._status(key) for key in ("PENDING", "CONFIRMED", "CANCELLED", "COMPLETED")],
+            ["CANCELLED", "CANCELLED", "CANCELLED", "COMPLETED"],
+        )
+        self.assertEqual(
+            [str(message) for message in get_messages(response.wsgi_request)],
+            ["2 bookings marked cancelled. 2 skipped: their status does not allow it."],
+        )
+
+    def test_payment_status_rules_and_batched_receipts(self):
+        version = payment_status.current_version(self.bookings["PENDING"].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin_payments"), {
+                "action": "bulk_status", "status": "SUCCEEDED",
+                "payment_ids": list(Payment.objects.values_list("pk", flat=True)),
+            })
+        self.assertEqual(Payment.objects.exclude(status="SUCCEEDED").count(), 0)
+        self.assertEqual(self._status("PENDING"), "CONFIRMED")
+        self.assertEqual(self._status("CANCELLED"), "CANCELLED")
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertNotEqual(payment_status.current_version(self.bookings["PENDING"].pk), version)
+
+        refunded = Payment.objects.filter(booking__in=[self.bookings["PENDING"], self.bookings["COMPLETED"]])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin:booking_payment_changelist"), {
+                "action": "mark_refunded", "_selected_action": list(refunded.values_list("pk", flat=True)),
+            })
+        self.assertEqual(self._status("PENDING"), "CANCELLED")
+        self.assertEqual(self._status("COMPLETED"), "COMPLETED")
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_single_payment_form_sends_no_receipt(self):
+        payment = Payment.objects.get(booking=self.bookings["PENDING"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("admin_payments"), {
+                "action": "update_status", "payment_id": payment.pk, "status": "SUCCEEDED",
+            })
+        self.assertEqual(Payment.objects.get(pk=payment.pk).status, "SUCCEEDED")
+        self.assertEqual(self._status("PENDING"), "CONFIRMED")
+        self.assertEqual(mail.outbox, [])
+
+
+class OccupancyStatsTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(
+            title="Sea View", category="DLX", description="Room", price="100.00", size=30, beds=2,
+        )
+        Room.objects.create(title="Spare", category="DLX", description="Room", price="100.00", size=30, beds=2)
+
+    def _stats(self):
+        return list(
+            DailyRoomStats.objects.order_by("room_id", "date")
+            .values_list("room_id", "date", "category", "nights_sold", "room_revenue", "payments_collected")
+        )
+
+    def _book(self, check_in, nights, status="CONFIRMED", total="300.00"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                first_name="Ann", last_name="Lee", mobile="0700000000", email="ann@example.com", room=self.room,
+                check_in=check_in, check_out=check_in + timedelta(days=nights), total_price=total, status=status,
+            )
+
+    def test_migrate_backfills_an_empty_stats_table(self):
+        self._book(date(2026, 8, 30), 3)
+        DailyRoomStats.objects.all().delete()
+        call_command("migrate", verbosity=0)
+        self.assertEqual(sum(row[3] for row in self._stats()), 3)
+
+    def test_incremental_updates_match_a_rebuild(self):
+        booking = self._book(date(2026, 8, 30), 3)
+        self._book(date(2026, 9, 10), 2, status="PENDING")
+        self.assertEqual(
+            [(row[1], row[3], row[4]) for row in self._stats()],
+            [(date(2026, 8, 30), 1, Decimal("100.00")), (date(2026, 8, 31), 1, Decimal("100.00")),
+             (date(2026, 9, 1), 1, Decimal("100.00"))],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.check_in, booking.check_out = date(2026, 9, 2), date(2026, 9, 4)
+            booking.save()
+            Payment.objects.create(booking=booking, provider="STRIPE", status="SUCCEEDED", amount="300.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            status_changes.set_booking_status(Booking.objects.filter(status="PENDING"), "CONFIRMED")
+        incremental = self._stats()
+        self.assertEqual(sum(row[3] for row in incremental), 4)
+        self.assertEqual(sum(row[5] for row in incremental), Decimal("300.00"))
+
+        DailyRoomStats.objects.update(nights_sold=99)
+        call_command("rebuild_room_stats", stdout=io.StringIO())
+        self.assertEqual(self._stats(), incremental)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            status_changes.set_booking_status(Booking.objects.all(), "CANCELLED")
+        self.assertEqual([row[3] for row in self._stats()], [0])
+
+    def test_admin_filter_and_dashboard_read_the_stats(self):
+        today = timezone.localdate()
+        self._book(today, 2, total="250.00")
+        admin_user = User.objects.create_superuser("admin", "admin@example.com", "pass-12345")
+        self.client.force_login(admin_user)
+
+        response = self.client.get(reverse("admin:booking_room_changelist"), {"room_status": "booked"})
+        self.assertEqual([room.title for room in response.context["cl"].result_list], ["Sea View"])
+
+        response = self.client.get(reverse("admin_stats"), {"from": today.isoformat(), "to": today.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        (deluxe,) = response.context["totals"]
+        self.assertEqual((deluxe["available"], deluxe["sold"], deluxe["occupancy"]), (2, 1, 50.0))
+        self.assertEqual(deluxe["adr"], Decimal("125.00"))
+
+        # The spare room's only unit goes out of service: one room-night is left to sell.
+        RoomUnit.objects.create(room=Room.objects.get(title="Spare"), number="201", active=False)
+        response = self.client.get(reverse("admin_stats"), {"from": today.isoformat(), "to": today.isoformat()})
+        (deluxe,) = response.context["totals"]
+        self.assertEqual((deluxe["available"], deluxe["occupancy"]), (1, 100.0))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("guest", "guest@example.com", "pass-12345")
+        self.room = Room.objects.create(
+            title="Old Wing", category="STD", description="Room", price="50.00", size=20, beds=1,
+        )
+        today = timezone.localdate()
+        self.bookings = {}
+        for key, status, days_ago, paid_status in (
+            ("old", "COMPLETED", 400, "SUCCEEDED"),
+            ("old_pending_payment", "CANCELLED", 400, "PENDING"),
+            ("recent", "COMPLETED", 30, "SUCCEEDED"),
+        ):
+            booking = Booking.objects.create(
+                user=self.user, room=self.room, first_name="Ann", last_name=key, mobile="0700000000",
+                email="guest@example.com", check_in=today - timedelta(days=days_ago + 2),
+                check_out=today - timedelta(days=days_ago), total_price="100.00", status=status,
+            )
+            Payment.objects.create(booking=booking, provider="MPESA", status=paid_status, amount="100.00")
+            self.bookings[key] = booking
+
+    def test_archive_moves_old_history_and_keeps_it_readable(self):
+        call_command("rebuild_room_stats", stdout=io.StringIO())
+        stats = list(DailyRoomStats.objects.order_by("date").values_list("date", "nights_sold", "payments_collected"))
+
+        out = io.StringIO()
+        call_command("archive_history", "--batch-size", "1", stdout=out)
+        self.assertIn("Archived 1 bookings", out.getvalue())
+        old = self.bookings["old"]
+        self.assertFalse(Booking.objects.filter(pk=old.pk).exists())
+        archived = ArchivedBooking.objects.get(pk=old.pk)
+        self.assertEqual((archived.created_at, archived.payments.get().status), (old.created_at, "SUCCEEDED"))
+        self.assertEqual(Booking.objects.count(), 2)
+
+        call_command("rebuild_room_stats", stdout=io.StringIO())
+        self.assertEqual(
+            list(DailyRoomStats.objects.order_by("date").values_list("date", "nights_sold", "payments_collected")), stats,
+        )
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("my_bookings"))
+        self.assertContains(response, f"#{old.pk}")
+        self.assertContains(response, reverse("invoice_pdf", args=[old.pk]))
+
+        out = io.StringIO()
+        call_command("export_data", "payments", "--include-archived", "--column", "id", "--column", "booking_id", stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+
+
+class PaymentPayloadTests(TestCase):
+    def setUp(self):
+        booking = Booking.objects.create(
+            first_name="Ann", last_name="Lee", mobile="0700000000", email="ann@example.com",
+            check_in=date(2026, 1, 1), check_out=date(2026, 1, 2), total_price="40.00", status="CONFIRMED",
+        )
+        self.raw = {
+            "request": {"Password": "secret", "PhoneNumber": "254712345678"},
+            "response": {"CheckoutRequestID": "ws_CO_1", "ResponseCode": "0"},
+            "merchant_request_id": "mr-1",
+            "callback": {"ResultCode": 0, "ResultDesc": "Processed", "CheckoutRequestID": "ws_CO_1"},
+            "metadata": {"MpesaReceiptNumber": "QKX1", "Amount": 40},
+        }
+        self.old = Payment.objects.create(booking=booking, provider="MPESA", status="SUCCEEDED", amount="40.00", raw_response=self.raw)
+        self.pending = Payment.objects.create(booking=booking, provider="MPESA", status="PENDING", amount="40.00", raw_response=self.raw)
+        self.recent = Payment.objects.create(booking=booking, provider="STRIPE", status="FAILED", amount="40.00", raw_response={"id": "pi_1"})
+        long_ago = timezone.now() - timedelta(days=200)
+        Payment.objects.filter(pk__in=[self.old.pk, self.pending.pk]).update(updated_at=long_ago)
+
+    def test_compaction_keeps_summary_and_full_payload(self):
+        out = io.StringIO()
+        call_command("compact_payment_payloads", "--batch-size", "1", stdout=out)
+        self.assertIn("Compacted 1 payment payloads", out.getvalue())
+
+        old = Payment.objects.get(pk=self.old.pk)
+        self.assertEqual(old.raw_response, {
+            "merchant_request_id": "mr-1", "metadata": {"MpesaReceiptNumber": "QKX1", "Amount": 40},
+            "ResultCode": 0, "ResultDesc": "Processed", "CheckoutRequestID": "ws_CO_1", "compacted": True,
+        })
+        self.assertEqual(old.full_raw_response(), self.raw)
+        self.assertLess(old.updated_at, timezone.now() - timedelta(days=199))
+        self.assertEqual(Payment.objects.get(pk=self.pending.pk).raw_response, self.raw)
+        self.assertEqual(Payment.objects.get(pk=self.recent.pk).full_raw_response(), {"id": "pi_1"})
+
+        out = io.StringIO()
+        call_command("compact_payment_payloads", stdout=out)
+        self.assertIn("Compacted 0 payment payloads", out.getvalue())
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        caches["ratelimit"].clear()
+
+    @override_settings(RATE_LIMITS={"login": {"email": "2/m"}})
+    def test_login_attempts_per_email_get_429(self):
+        url = reverse("login")
+        for _ in range(2):
+            response = self.client.post(url, {"login_email": "guest@example.com", "login_password": "wrong"})
+            self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, {"login_email": "GUEST@example.com", "login_password": "wrong"})
+        self.assertEqual(response.status_code, 429)
+        self.assertLessEqual(int(response["Retry-After"]), 30)
+        response = self.client.post(url, {"login_email": "other@example.com", "login_password": "wrong"})
+        self.assertEqual(response.status_code, 200)
+
+    def test_parse_rate(self):
+        self.assertEqual(ratelimit.parse_rate("10/m"), (10, 60))
+        self.assertEqual(ratelimit.parse_rate("100/5m"), (100, 300))
+        with self.assertRaises(ValueError):
+            ratelimit.parse_rate("10/week")
+
+    @override_settings(CONCURRENCY_LIMITS={"payments": 1}, CONCURRENCY_LIMIT_WAIT_SECONDS=0.01)
+    def test_concurrency_cap_sheds_with_503(self):
+        semaphore = ratelimit._semaphore("payments")
+        semaphore.acquire()
+        try:
+            response = self.client.post(reverse("stripe_create_intent"), HTTP_X_CSRFTOKEN="x")
+        finally:
+            semaphore.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertIn("busy", response.json()["error"])
+
+    @override_settings(CONCURRENCY_LIMITS={"payments": 1}, CONCURRENCY_LIMIT_WAIT_SECONDS=0.05)
+    def test_async_views_wait_on_an_event_loop_semaphore(self):
+        release = None
+
+        @ratelimit.concurrency_limit("payments")
+        async def view(request):
+            await release.wait()
+            return HttpResponse("ok")
+
+        async def run():
+            nonlocal release
+            release = asyncio.Event()
+            request = AsyncRequestFactory().post("/")
+            first = asyncio.create_task(view(request))
+            await asyncio.sleep(0)
+            shed = await view(request)
+            release.set()
+            return shed, await first, await view(request)
+
+        shed, first, after = asyncio.run(run())
+        self.assertEqual((shed.status_code, first.status_code, after.status_code), (503, 200, 200))
+
+
+class PruneSessionsTests(TestCase):
+    def test_only_expired_sessions_are_deleted_in_batches(self):
+        now = timezone.now()
+        for index in range(5):
+            Session.objects.create(session_key=f"expired{index}", session_data="", expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key="live", session_data="", expire_date=now + timedelta(days=1))
+
+        call_command("prune_sessions", batch_size=2, stdout=io.StringIO())
+
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["live"])
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .benchmarks import latency_summary
+
+try:
+    import requests
+except Exception:
+    requests = None
+
+
+# Query parameters whose values are safe to keep. Everything else (PayPal tokens,
+# booking ids passed around by providers, free text) is dropped and only its name kept.
+SAFE_QUERY_PARAMS = {'check_in', 'check_out', 'room', 'status', 'page', 'reason'}
+
+
+def sanitize_request(request, response, duration_ms, user=None):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.url_name:
+        return None
+    if user is None:
+        # Async callers pass the user from request.auser(); request.user would query synchronously.
+        user = getattr(request, 'user', None)
+    query = {}
+    dropped = []
+    for key in request.GET:
+        if key in SAFE_QUERY_PARAMS:
+            query[key] = request.GET.get(key)
+        else:
+            dropped.append(key)
+    return {
+        'ts': round(time.time(), 6),
+        'route': match.url_name,
+        'method': request.method,
+        'path': request.path,
+        'query': query,
+        'dropped_params': sorted(dropped),
+        'status': response.status_code,
+        'duration_ms': round(duration_ms, 3),
+        'authenticated': bool(getattr(user, 'is_authenticated', False)),
+        # Body sizes before and after minification/compression, when the response had any.
+        'bytes': getattr(request, 'response_bytes', None),
+    }
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    records.sort(key=lambda record: record.get('ts', 0))
+    return records
+
+
+def capture_files(directory):
+    return sorted(str(path) for path in Path(directory).glob('traffic-*.jsonl*'))
+
+
+def replay(records, target, speed=1.0, concurrency=16, include_unsafe=False, timeout=30):
+    if requests is None:
+        raise RuntimeError("The requests package is required to replay traffic.")
+    if not include_unsafe:
+        records = [record for record in records if record.get('method') in ('GET', 'HEAD')]
+    if not records:
+        return {'speed': speed, 'requests': 0, 'routes': {}}
+
+    target = target.rstrip('/')
+    local = threading.local()
+    lock = threading.Lock()
+    samples = {}
+    lag_ms = []
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def send(record, scheduled_at):
+        started = time.perf_counter()
+        status = None
+        try:
+            response = session().request(
+                record['method'],
+                f"{target}{record['path']}",
+                params=record.get('query') or None,
+                allow_redirects=False,
+                timeout=timeout,
+            )
+            status = response.status_code
+        except Exception:
+            status = None
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            route = samples.setdefault(record['route'], {'latency': [], 'errors': 0, 'statuses': {}})
+            route['latency'].append(elapsed)
+            if status is None or status >= 500:
+                route['errors'] += 1
+            key = str(status) if status is not None else 'error'
+            route['statuses'][key] = route['statuses'].get(key, 0) + 1
+            lag_ms.append(max(0.0, (started - scheduled_at) * 1000))
+
+    first_ts = records[0].get('ts', 0)
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in records:
+            scheduled_at = began + (record.get('ts', first_ts) - first_ts) / speed
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, record, scheduled_at)
+    wall_seconds = time.perf_counter() - began
+
+    routes = {}
+    for name, data in sorted(samples.items()):
+        count = len(data['latency'])
+        routes[name] = {
+            'requests': count,
+            'errors': data['errors'],
+            'error_rate': round(data['errors'] / count, 4) if count else 0,
+            'statuses': data['statuses'],
+            'latency_ms': latency_summary(data['latency']),
+        }
+    return {
+        'speed': speed,
+        'concurrency': concurrency,
+        'requests': len(records),
+        'wall_seconds': round(wall_seconds, 3),
+        'achieved_rps': round(len(records) / wall_seconds, 2) if wall_seconds else None,
+        'schedule_lag_ms': latency_summary(lag_ms),
+        'routes': routes,
+    }
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Under ASGI the provider-facing payment views can run natively async.
+payment_views = async_views if settings.ASYNC_PAYMENT_VIEWS else views
 
 urlpatterns = [
     # Home
@@ -12,6 +16,7 @@ urlpatterns = [
     path('room/', views.room, name='room'),
     path('rooms/', views.room_list, name='room_list'),
     path('room/<int:room_id>/', views.room_detail, name='room_detail'),
+    path('room/<int:room_id>/images/<str:digest>/<int:width>.<str:fmt>', views.room_image, name='room_image'),
     
     # Amenities
     path('amenities/', views.amenities, name='amenities'),
@@ -25,14 +30,15 @@ urlpatterns = [
     path('payments/success/<int:booking_id>/', views.payment_success, name='payment_success'),
     path('payments/failed/<int:booking_id>/', views.payment_failed, name='payment_failed'),
     path('payments/invoice/<int:booking_id>/', views.invoice_pdf, name='invoice_pdf'),
-    path('payments/stripe/create-intent/', views.stripe_create_intent, name='stripe_create_intent'),
-    path('payments/stripe/confirm/', views.stripe_confirm, name='stripe_confirm'),
-    path('payments/stripe/webhook/', views.stripe_webhook, name='stripe_webhook'),
-    path('payments/paypal/create-order/', views.paypal_create_order, name='paypal_create_order'),
-    path('payments/paypal/return/', views.paypal_return, name='paypal_return'),
+    path('payments/status/<int:booking_id>/', payment_views.payment_status_view, name='payment_status'),
+    path('payments/stripe/create-intent/', payment_views.stripe_create_intent, name='stripe_create_intent'),
+    path('payments/stripe/confirm/', payment_views.stripe_confirm, name='stripe_confirm'),
+    path('payments/stripe/webhook/', payment_views.stripe_webhook, name='stripe_webhook'),
+    path('payments/paypal/create-order/', payment_views.paypal_create_order, name='paypal_create_order'),
+    path('payments/paypal/return/', payment_views.paypal_return, name='paypal_return'),
     path('payments/paypal/cancel/', views.paypal_cancel, name='paypal_cancel'),
-    path('payments/mpesa/stk-push/', views.mpesa_stk_push, name='mpesa_stk_push'),
-    path('payments/mpesa/callback/', views.mpesa_callback, name='mpesa_callback'),
+    path('payments/mpesa/stk-push/', payment_views.mpesa_stk_push, name='mpesa_stk_push'),
+    path('payments/mpesa/callback/', payment_views.mpesa_callback, name='mpesa_callback'),
     
     # Authentication
     path('login/', views.login_view, name='login'),
@@ -43,6 +49,8 @@ urlpatterns = [
     path('admin-users/', views.admin_users_view, name='admin_users'),
     path('admin-payments/', views.admin_payments_view, name='admin_payments'),
     path('admin-booked-rooms/', views.admin_booked_rooms_view, name='admin_booked_rooms'),
+    path('admin-stats/', views.admin_stats_view, name='admin_stats'),
+    path('admin-exports/<str:dataset>.<str:fmt>', views.admin_export_view, name='admin_export'),
     
     # Contact
     path('contact/', views.contact, name='contact'),
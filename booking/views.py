@@ -1,23 +1,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, send_mail
 from django.conf import settings
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse
+from django.http import FileResponse, Http404, JsonResponse, HttpResponseBadRequest, HttpResponse
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from django.db.models import Exists, OuterRef, Count, Q
+from django.db.models import Count, Q
+from django.core.cache import cache
 from django.db import connection
 from django.db.utils import ProgrammingError, OperationalError
 from decimal import Decimal, InvalidOperation
 import json
-import io
+import time
 import base64
 from urllib.parse import urlencode
 from django.contrib.auth.models import User
 from datetime import datetime
-from .models import Room, Booking, ContactMessage, Payment
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .models import ArchivedBooking, Room, Booking, ContactMessage, Payment
+from . import archive, exports, images, inventory, occupancy, rates, payment_status, status_changes
+from .invoices import invoice_digest, invoice_lines, open_invoice
+from .ratelimit import concurrency_limit
 
 try:
     import requests
@@ -37,16 +44,22 @@ def _booking_tables_ready():
 def _with_booking_status(queryset):
     if not _booking_tables_ready():
         return queryset.none()
-    today = datetime.today().date()
-    confirmed_bookings = Booking.objects.filter(
-        room=OuterRef('pk'),
-        status='CONFIRMED',
-        check_out__gt=today,
-    )
-    return queryset.annotate(is_booked=Exists(confirmed_bookings))
+    # A room type shows as booked once every one of its units is taken tonight.
+    return inventory.with_units_booked(queryset, datetime.today().date())
+
+
+_last_completion_sweep = None
 
 
 def _mark_completed_bookings():
+    # The transition only changes once a day, so running the UPDATE on every request
+    # just competes for the database write lock.
+    global _last_completion_sweep
+    now = time.monotonic()
+    interval = getattr(settings, 'BOOKING_COMPLETION_SWEEP_SECONDS', 0)
+    if _last_completion_sweep is not None and now - _last_completion_sweep < interval:
+        return
+
     today = datetime.today().date()
     try:
         Booking.objects.filter(
@@ -56,6 +69,8 @@ def _mark_completed_bookings():
     except (ProgrammingError, OperationalError):
         # Database tables may not exist yet during first deploy before migrations.
         return
+    # Only a sweep that ran counts; a failed one is retried on the next request.
+    _last_completion_sweep = now
 
 
 # Home page view
@@ -86,11 +101,13 @@ def room_list(request):
             if check_in >= check_out:
                 messages.error(request, "Check-out date must be after check-in date.")
             else:
-                rooms = rooms.exclude(
-                    booking__status='CONFIRMED',
-                    booking__check_in__lt=check_out,
-                    booking__check_out__gt=check_in,
-                )
+                rooms = list(rooms)
+                left = inventory.units_left(rooms, check_in, check_out)
+                rooms = [room for room in rooms if left[room.pk] > 0]
+                totals = rates.quote_many(rooms, check_in, check_out)
+                for room in rooms:
+                    room.units_left = left[room.pk]
+                    room.stay_total = totals[room.pk]
         except ValueError:
             messages.error(request, "Invalid date format. Please use YYYY-MM-DD.")
 
@@ -149,45 +166,42 @@ def contact(request):
 
 # Booking view
 def _room_is_available(room, check_in, check_out):
-    return not Booking.objects.filter(
-        room=room,
-        status='CONFIRMED',
-        check_in__lt=check_out,
-        check_out__gt=check_in,
-    ).exists()
+    return inventory.is_available(room, check_in, check_out)
 
 def _get_booking_amount(booking):
     if booking.total_price:
         return booking.total_price
     if booking.room:
-        nights = (booking.check_out - booking.check_in).days
-        return booking.room.price * nights
+        return rates.quote(booking.room, booking.check_in, booking.check_out)
     return Decimal('0.00')
 
-def _send_receipt_email(request, booking):
-    if not booking.email:
-        return
+def _receipt_message(request, booking, connection=None):
     amount = _get_booking_amount(booking)
     invoice_url = request.build_absolute_uri(reverse('invoice_pdf', args=[booking.id]))
     room_title = booking.room.title if booking.room else "N/A"
+    return EmailMessage(
+        subject=f"Royal Hotel Receipt #{booking.id}",
+        body=(
+            f"Hello {booking.first_name},\n\n"
+            f"Payment received for Booking #{booking.id}.\n"
+            f"Room: {room_title}\n"
+            f"Check-in: {booking.check_in}\n"
+            f"Check-out: {booking.check_out}\n"
+            f"Guests: {booking.guests}\n"
+            f"Total: {amount}\n\n"
+            f"Invoice: {invoice_url}\n\n"
+            "Thank you for choosing Royal Hotel."
+        ),
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None),
+        to=[booking.email],
+        connection=connection,
+    )
+
+def _send_receipt_email(request, booking):
+    if not booking.email:
+        return
     try:
-        send_mail(
-            subject=f"Royal Hotel Receipt #{booking.id}",
-            message=(
-                f"Hello {booking.first_name},\n\n"
-                f"Payment received for Booking #{booking.id}.\n"
-                f"Room: {room_title}\n"
-                f"Check-in: {booking.check_in}\n"
-                f"Check-out: {booking.check_out}\n"
-                f"Guests: {booking.guests}\n"
-                f"Total: {amount}\n\n"
-                f"Invoice: {invoice_url}\n\n"
-                "Thank you for choosing Royal Hotel."
-            ),
-            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', None),
-            recipient_list=[booking.email],
-            fail_silently=True,
-        )
+        _receipt_message(request, booking).send(fail_silently=True)
     except Exception:
         pass
 
@@ -258,9 +272,8 @@ def booking_view(request):
             if request.user.is_authenticated:
                 new_booking.user = request.user
 
-            # Calculate total price
-            nights = (check_out - check_in).days
-            new_booking.total_price = room.price * nights
+            # Price each night from the rate calendar
+            new_booking.total_price = rates.quote(room, check_in, check_out)
 
             new_booking.save()
 
@@ -310,7 +323,11 @@ def booking_view(request):
 # Booking confirmation
 def booking_confirmation(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
-    return render(request, 'booking_confirmation.html', {'booking': booking})
+    return render(request, 'booking_confirmation.html', {
+        'booking': booking,
+        'status_wait': int(payment_status.max_wait()),
+        'status_interval_ms': int(settings.PAYMENT_STATUS_CLIENT_POLL_SECONDS * 1000),
+    })
 
 
 def _redirect_to_booked_room(request, booking, message_text=None):
@@ -355,7 +372,152 @@ def payment_page(request, booking_id):
         },
     )
 
+# Provider payloads and result handling shared by these views and async_views.
+def _stripe_intent_payload(booking, amount_cents):
+    return {
+        'amount': amount_cents,
+        'currency': getattr(settings, 'DEFAULT_CURRENCY', 'KES').lower(),
+        'automatic_payment_methods[enabled]': 'true',
+        'metadata[booking_id]': str(booking.id),
+        'receipt_email': booking.email,
+    }
+
+
+def _apply_stripe_intent(payment, intent):
+    payment.raw_response = intent
+    payment.reference = intent.get('id')
+    if intent.get('status') == 'succeeded':
+        payment.status = 'SUCCEEDED'
+        payment.booking.status = 'CONFIRMED'
+    elif intent.get('status') in ['canceled', 'requires_payment_method']:
+        payment.status = 'FAILED'
+    return payment.status == 'SUCCEEDED'
+
+
+def _stripe_confirm_result(payment, intent):
+    if payment.status == 'SUCCEEDED':
+        redirect_url = reverse('payment_success', args=[payment.booking.id])
+    else:
+        reason = intent.get('last_payment_error', {}).get('message') or intent.get('status', 'payment_failed')
+        redirect_url = f"{reverse('payment_failed', args=[payment.booking.id])}?{urlencode({'reason': reason})}"
+    return {'status': payment.status, 'redirect_url': redirect_url}
+
+
+def _paypal_order_payload(amount, return_url, cancel_url):
+    return {
+        "intent": "CAPTURE",
+        "purchase_units": [
+            {
+                "amount": {
+                    "currency_code": getattr(settings, 'DEFAULT_CURRENCY', 'KES'),
+                    "value": str(amount),
+                }
+            }
+        ],
+        "application_context": {
+            "return_url": return_url,
+            "cancel_url": cancel_url,
+        },
+    }
+
+
+def _paypal_approve_url(order):
+    for link in order.get('links', []):
+        if link.get('rel') == 'approve':
+            return link.get('href')
+    return None
+
+
+def _paypal_failure_redirect(booking_id, reason):
+    if booking_id:
+        return redirect(f"{reverse('payment_failed', args=[booking_id])}?reason={reason}")
+    return redirect('index')
+
+
+def _mpesa_settings_complete():
+    required_values = [
+        settings.MPESA_CONSUMER_KEY,
+        settings.MPESA_CONSUMER_SECRET,
+        settings.MPESA_SHORTCODE,
+        settings.MPESA_PASSKEY,
+        settings.MPESA_STK_URL,
+        settings.MPESA_CALLBACK_URL,
+        getattr(settings, "MPESA_AUTH_URL", ""),
+    ]
+    return all(required_values)
+
+
+def _mpesa_password(timestamp):
+    return base64.b64encode(
+        f"{settings.MPESA_SHORTCODE}{settings.MPESA_PASSKEY}{timestamp}".encode("utf-8")
+    ).decode("utf-8")
+
+
+def _mpesa_stk_payload(booking, normalized_phone, amount_int, timestamp):
+    return {
+        "BusinessShortCode": settings.MPESA_SHORTCODE,
+        "Password": _mpesa_password(timestamp),
+        "Timestamp": timestamp,
+        "TransactionType": getattr(settings, "MPESA_TRANSACTION_TYPE", "CustomerPayBillOnline"),
+        "Amount": amount_int,
+        "PartyA": normalized_phone,
+        "PartyB": settings.MPESA_SHORTCODE,
+        "PhoneNumber": normalized_phone,
+        "CallBackURL": settings.MPESA_CALLBACK_URL,
+        "AccountReference": f"BOOKING-{booking.id}",
+        "TransactionDesc": getattr(settings, "MPESA_TRANSACTION_DESC", "Hotel Booking Payment"),
+    }
+
+
+def _mpesa_error_message(response_data, default):
+    return response_data.get("errorMessage") or response_data.get("ResponseDescription") or default
+
+
+def _parse_mpesa_callback(body):
+    try:
+        payload = json.loads(body or '{}')
+    except json.JSONDecodeError:
+        return None
+    return (payload.get("Body") or {}).get("stkCallback") or {}
+
+
+def _apply_mpesa_callback(payment, callback):
+    result_code = callback.get("ResultCode")
+    result_code_str = str(result_code) if result_code is not None else ""
+    result_desc = callback.get("ResultDesc")
+
+    metadata = {}
+    items = ((callback.get("CallbackMetadata") or {}).get("Item") or [])
+    for item in items:
+        name = item.get("Name")
+        value = item.get("Value")
+        if name:
+            metadata[name] = value
+
+    existing_raw = payment.raw_response if isinstance(payment.raw_response, dict) else {}
+    updated_raw = dict(existing_raw)
+    updated_raw["callback"] = callback
+    updated_raw["metadata"] = metadata
+    if result_desc:
+        updated_raw["callback_result_desc"] = result_desc
+    payment.raw_response = updated_raw
+
+    if result_code_str == "0":
+        payment.status = 'SUCCEEDED'
+        payment.booking.status = 'CONFIRMED'
+        return True
+    if result_code_str == "1032":
+        payment.status = 'CANCELLED'
+    else:
+        payment.status = 'FAILED'
+    return False
+
+
+MPESA_ACCEPTED = {"ResultCode": 0, "ResultDesc": "Accepted"}
+
+
 # Stripe: create payment intent
+@concurrency_limit('payments')
 def stripe_create_intent(request):
     if request.method != "POST":
         return HttpResponseBadRequest("Invalid method")
@@ -376,17 +538,11 @@ def stripe_create_intent(request):
     except (InvalidOperation, TypeError):
         return JsonResponse({'error': 'Invalid amount'}, status=400)
 
-    payload = {
-        'amount': amount_cents,
-        'currency': getattr(settings, 'DEFAULT_CURRENCY', 'KES').lower(),
-        'automatic_payment_methods[enabled]': 'true',
-        'metadata[booking_id]': str(booking.id),
-        'receipt_email': booking.email,
-    }
+    payload = _stripe_intent_payload(booking, amount_cents)
 
     try:
         response = requests.post(
-            'https://api.stripe.com/v1/payment_intents',
+            f"{settings.STRIPE_API_BASE}/v1/payment_intents",
             data=payload,
             auth=(settings.STRIPE_SECRET_KEY, ''),
             timeout=15,
@@ -411,6 +567,7 @@ def stripe_create_intent(request):
     return JsonResponse({'client_secret': intent.get('client_secret'), 'payment_id': payment.id})
 
 # Stripe: confirm intent server-side
+@concurrency_limit('payments')
 def stripe_confirm(request):
     if request.method != "POST":
         return HttpResponseBadRequest("Invalid method")
@@ -428,7 +585,7 @@ def stripe_confirm(request):
 
     try:
         response = requests.get(
-            f'https://api.stripe.com/v1/payment_intents/{intent_id}',
+            f"{settings.STRIPE_API_BASE}/v1/payment_intents/{intent_id}",
             auth=(settings.STRIPE_SECRET_KEY, ''),
             timeout=15,
         )
@@ -439,23 +596,11 @@ def stripe_confirm(request):
         return JsonResponse({'error': 'Stripe error', 'details': response.text}, status=400)
 
     intent = response.json()
-    payment.raw_response = intent
-    payment.reference = intent.get('id')
-    if intent.get('status') == 'succeeded':
-        payment.status = 'SUCCEEDED'
-        payment.booking.status = 'CONFIRMED'
+    if _apply_stripe_intent(payment, intent):
         payment.booking.save()
         _send_receipt_email(request, payment.booking)
-    elif intent.get('status') in ['canceled', 'requires_payment_method']:
-        payment.status = 'FAILED'
     payment.save()
-
-    if payment.status == 'SUCCEEDED':
-        redirect_url = reverse('payment_success', args=[payment.booking.id])
-    else:
-        reason = intent.get('last_payment_error', {}).get('message') or intent.get('status', 'payment_failed')
-        redirect_url = f"{reverse('payment_failed', args=[payment.booking.id])}?{urlencode({'reason': reason})}"
-    return JsonResponse({'status': payment.status, 'redirect_url': redirect_url})
+    return JsonResponse(_stripe_confirm_result(payment, intent))
 
 @csrf_exempt
 def stripe_webhook(request):
@@ -502,6 +647,7 @@ def _paypal_get_access_token():
         return None
     return response.json().get('access_token')
 
+@concurrency_limit('payments')
 def paypal_create_order(request):
     if request.method != "POST":
         return HttpResponseBadRequest("Invalid method")
@@ -522,21 +668,7 @@ def paypal_create_order(request):
     amount = _get_booking_amount(booking)
     return_url = request.build_absolute_uri(reverse('paypal_return')) + f"?booking_id={booking.id}"
     cancel_url = request.build_absolute_uri(reverse('paypal_cancel')) + f"?booking_id={booking.id}"
-    payload = {
-        "intent": "CAPTURE",
-        "purchase_units": [
-            {
-                "amount": {
-                    "currency_code": getattr(settings, 'DEFAULT_CURRENCY', 'KES'),
-                    "value": str(amount),
-                }
-            }
-        ],
-        "application_context": {
-            "return_url": return_url,
-            "cancel_url": cancel_url,
-        },
-    }
+    payload = _paypal_order_payload(amount, return_url, cancel_url)
 
     try:
         response = requests.post(
@@ -564,38 +696,28 @@ def paypal_create_order(request):
         raw_response=order,
     )
 
-    approve_url = None
-    for link in order.get('links', []):
-        if link.get('rel') == 'approve':
-            approve_url = link.get('href')
-            break
-
+    approve_url = _paypal_approve_url(order)
     if not approve_url:
         messages.error(request, "PayPal approval link not found.")
         return redirect('payment_page', booking_id=booking.id)
 
     return redirect(approve_url)
 
+@concurrency_limit('payments')
 def paypal_return(request):
     order_id = request.GET.get('token')
     booking_id = request.GET.get('booking_id')
     if not order_id:
         messages.error(request, "Missing PayPal token.")
-        if booking_id:
-            return redirect(f"{reverse('payment_failed', args=[booking_id])}?reason=missing_paypal_token")
-        return redirect('index')
+        return _paypal_failure_redirect(booking_id, 'missing_paypal_token')
 
     access_token = _paypal_get_access_token()
     if requests is None:
         messages.error(request, "Payment dependency is not installed.")
-        if booking_id:
-            return redirect(f"{reverse('payment_failed', args=[booking_id])}?reason=payment_dependency_missing")
-        return redirect('index')
+        return _paypal_failure_redirect(booking_id, 'payment_dependency_missing')
     if not access_token:
         messages.error(request, "PayPal is not configured.")
-        if booking_id:
-            return redirect(f"{reverse('payment_failed', args=[booking_id])}?reason=paypal_not_configured")
-        return redirect('index')
+        return _paypal_failure_redirect(booking_id, 'paypal_not_configured')
 
     try:
         response = requests.post(
@@ -605,9 +727,7 @@ def paypal_return(request):
         )
     except Exception:
         messages.error(request, "PayPal service is unavailable. Please try again.")
-        if booking_id:
-            return redirect(f"{reverse('payment_failed', args=[booking_id])}?reason=paypal_service_unavailable")
-        return redirect('index')
+        return _paypal_failure_redirect(booking_id, 'paypal_service_unavailable')
 
     payment = Payment.objects.filter(reference=order_id, provider='PAYPAL').first()
     if response.status_code >= 300:
@@ -616,11 +736,7 @@ def paypal_return(request):
             payment.raw_response = response.text
             payment.save()
         messages.error(request, "PayPal capture failed.")
-        if payment:
-            return redirect(f"{reverse('payment_failed', args=[payment.booking.id])}?reason=paypal_capture_failed")
-        if booking_id:
-            return redirect(f"{reverse('payment_failed', args=[booking_id])}?reason=paypal_capture_failed")
-        return redirect('index')
+        return _paypal_failure_redirect(payment.booking.id if payment else booking_id, 'paypal_capture_failed')
 
     capture = response.json()
     if payment:
@@ -643,40 +759,51 @@ def paypal_cancel(request):
     return redirect('index')
 
 def invoice_pdf(request, booking_id):
-    booking = get_object_or_404(Booking, id=booking_id)
-    amount = _get_booking_amount(booking)
+    booking = (
+        Booking.objects.select_related('room').filter(id=booking_id).first()
+        or get_object_or_404(ArchivedBooking.objects.select_related('room'), id=booking_id)
+    )
+    lines = invoice_lines(booking, _get_booking_amount(booking))
+    etag = f'"{invoice_digest(lines)}"'
+    last_modified = int(booking.updated_at.timestamp())
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        not_modified['Cache-Control'] = 'private, no-cache'
+        return not_modified
 
     try:
-        from reportlab.pdfgen import canvas
-    except Exception:
+        pdf = open_invoice(booking.id, lines, etag.strip('"'))
+    except ImportError:
         return HttpResponse("ReportLab not installed.", status=501)
 
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer)
-    p.setFont("Helvetica-Bold", 16)
-    p.drawString(40, 800, "Royal Hotel Booking Receipt")
-    p.setFont("Helvetica", 12)
-    y = 770
-    lines = [
-        f"Booking ID: {booking.id}",
-        f"Name: {booking.first_name} {booking.last_name}",
-        f"Email: {booking.email}",
-        f"Room: {booking.room.title if booking.room else 'N/A'}",
-        f"Check-in: {booking.check_in}",
-        f"Check-out: {booking.check_out}",
-        f"Guests: {booking.guests}",
-        f"Total: {amount}",
-    ]
-    for line in lines:
-        p.drawString(40, y, line)
-        y -= 20
-    p.showPage()
-    p.save()
-
-    pdf = buffer.getvalue()
-    buffer.close()
-    response = HttpResponse(pdf, content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="invoice_{booking.id}.pdf"'
+    response = FileResponse(
+        pdf,
+        as_attachment=True,
+        filename=f"invoice_{booking.id}.pdf",
+        content_type='application/pdf',
+    )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def room_image(request, room_id, digest, width, fmt):
+    """A resized room image; the URL names its content, so it is cacheable forever."""
+    if fmt not in images.FORMATS:
+        raise Http404("Unknown image format.")
+    storage = images.image_storage()
+    name = images.derivative_name(digest, width, fmt)
+    if not storage.exists(name):
+        room = get_object_or_404(
+            Room.objects.only('image', 'image_digest', 'image_width', 'image_height'), id=room_id,
+        )
+        if not room.image or room.image_digest != digest or not images.allowed_width(width, room.image_width):
+            raise Http404("No such image.")
+        name = images.ensure_derivative(room, width, fmt)
+    response = FileResponse(storage.open(name, 'rb'), content_type=images.FORMATS[fmt]['content_type'])
+    response['Cache-Control'] = images.IMMUTABLE
     return response
 
 # M-Pesa STK Push (stub until Daraja credentials are provided)
@@ -733,12 +860,9 @@ def _mpesa_query_stk_status(payment):
         return None, "Unable to authenticate with M-Pesa."
 
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    password = base64.b64encode(
-        f"{settings.MPESA_SHORTCODE}{settings.MPESA_PASSKEY}{timestamp}".encode("utf-8")
-    ).decode("utf-8")
     payload = {
         "BusinessShortCode": settings.MPESA_SHORTCODE,
-        "Password": password,
+        "Password": _mpesa_password(timestamp),
         "Timestamp": timestamp,
         "CheckoutRequestID": payment.reference,
     }
@@ -767,6 +891,31 @@ def _mpesa_query_stk_status(payment):
     return query_response, None
 
 
+def _apply_mpesa_stk_query(payment, query_response):
+    existing_raw = payment.raw_response if isinstance(payment.raw_response, dict) else {}
+    updated_raw = dict(existing_raw)
+    updated_raw["stk_query"] = query_response
+
+    result_code = query_response.get("ResultCode")
+    result_code_str = str(result_code) if result_code is not None else ""
+    if result_code_str == "0":
+        payment.status = 'SUCCEEDED'
+        if payment.booking.status == 'PENDING':
+            payment.booking.status = 'CONFIRMED'
+            payment.booking.save(update_fields=['status', 'updated_at'])
+    elif result_code_str == "1032":
+        payment.status = 'CANCELLED'
+        if payment.booking.status in ['PENDING', 'CONFIRMED']:
+            payment.booking.status = 'CANCELLED'
+            payment.booking.save(update_fields=['status', 'updated_at'])
+    elif result_code_str in ['1', '1037', '2001']:
+        payment.status = 'FAILED'
+
+    payment.raw_response = updated_raw
+    payment.save(update_fields=['status', 'raw_response', 'updated_at'])
+
+
+@concurrency_limit('payments')
 def mpesa_stk_push(request):
     if request.method != "POST":
         return HttpResponseBadRequest("Invalid method")
@@ -787,16 +936,7 @@ def mpesa_stk_push(request):
         messages.error(request, "Payment dependency is not installed.")
         return redirect('payment_page', booking_id=booking.id)
 
-    required_values = [
-        settings.MPESA_CONSUMER_KEY,
-        settings.MPESA_CONSUMER_SECRET,
-        settings.MPESA_SHORTCODE,
-        settings.MPESA_PASSKEY,
-        settings.MPESA_STK_URL,
-        settings.MPESA_CALLBACK_URL,
-        getattr(settings, "MPESA_AUTH_URL", ""),
-    ]
-    if any(not value for value in required_values):
+    if not _mpesa_settings_complete():
         messages.error(request, "M-Pesa is not configured.")
         return redirect('payment_page', booking_id=booking.id)
 
@@ -806,9 +946,6 @@ def mpesa_stk_push(request):
         return redirect('payment_page', booking_id=booking.id)
 
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    password = base64.b64encode(
-        f"{settings.MPESA_SHORTCODE}{settings.MPESA_PASSKEY}{timestamp}".encode("utf-8")
-    ).decode("utf-8")
     amount = _get_booking_amount(booking)
     try:
         amount_int = max(1, int(Decimal(amount)))
@@ -816,19 +953,7 @@ def mpesa_stk_push(request):
         messages.error(request, "Invalid booking amount for M-Pesa payment.")
         return redirect('payment_page', booking_id=booking.id)
 
-    payload = {
-        "BusinessShortCode": settings.MPESA_SHORTCODE,
-        "Password": password,
-        "Timestamp": timestamp,
-        "TransactionType": getattr(settings, "MPESA_TRANSACTION_TYPE", "CustomerPayBillOnline"),
-        "Amount": amount_int,
-        "PartyA": normalized_phone,
-        "PartyB": settings.MPESA_SHORTCODE,
-        "PhoneNumber": normalized_phone,
-        "CallBackURL": settings.MPESA_CALLBACK_URL,
-        "AccountReference": f"BOOKING-{booking.id}",
-        "TransactionDesc": getattr(settings, "MPESA_TRANSACTION_DESC", "Hotel Booking Payment"),
-    }
+    payload = _mpesa_stk_payload(booking, normalized_phone, amount_int, timestamp)
 
     try:
         response = requests.post(
@@ -860,12 +985,7 @@ def mpesa_stk_push(request):
             reference=response_data.get("CheckoutRequestID"),
             raw_response={"request": payload, "response": response_data},
         )
-        messages.error(
-            request,
-            response_data.get("errorMessage")
-            or response_data.get("ResponseDescription")
-            or "M-Pesa STK Push failed.",
-        )
+        messages.error(request, _mpesa_error_message(response_data, "M-Pesa STK Push failed."))
         return redirect('payment_page', booking_id=booking.id)
 
     payment = Payment.objects.create(
@@ -893,54 +1013,102 @@ def mpesa_stk_push(request):
 
 @csrf_exempt
 def mpesa_callback(request):
-    try:
-        payload = json.loads(request.body or '{}')
-    except json.JSONDecodeError:
-        return JsonResponse({"ResultCode": 0, "ResultDesc": "Accepted"})
-
-    callback = (payload.get("Body") or {}).get("stkCallback") or {}
-    checkout_request_id = callback.get("CheckoutRequestID")
-    result_code = callback.get("ResultCode")
-    result_code_str = str(result_code) if result_code is not None else ""
-    result_desc = callback.get("ResultDesc")
+    callback = _parse_mpesa_callback(request.body)
+    if callback is None:
+        return JsonResponse(MPESA_ACCEPTED)
 
     payment = Payment.objects.filter(
         provider='MPESA',
-        reference=checkout_request_id,
+        reference=callback.get("CheckoutRequestID"),
     ).order_by("-id").first()
 
     if not payment:
-        return JsonResponse({"ResultCode": 0, "ResultDesc": "Accepted"})
-
-    metadata = {}
-    items = ((callback.get("CallbackMetadata") or {}).get("Item") or [])
-    for item in items:
-        name = item.get("Name")
-        value = item.get("Value")
-        if name:
-            metadata[name] = value
-
-    existing_raw = payment.raw_response if isinstance(payment.raw_response, dict) else {}
-    updated_raw = dict(existing_raw)
-    updated_raw["callback"] = callback
-    updated_raw["metadata"] = metadata
-    if result_desc:
-        updated_raw["callback_result_desc"] = result_desc
-    payment.raw_response = updated_raw
+        return JsonResponse(MPESA_ACCEPTED)
 
-    if result_code_str == "0":
-        payment.status = 'SUCCEEDED'
-        payment.booking.status = 'CONFIRMED'
+    if _apply_mpesa_callback(payment, callback):
         payment.booking.save(update_fields=['status', 'updated_at'])
-    elif result_code_str == "1032":
-        payment.status = 'CANCELLED'
-    else:
-        payment.status = 'FAILED'
     payment.save(update_fields=['status', 'raw_response', 'updated_at'])
 
-    return JsonResponse({"ResultCode": 0, "ResultDesc": "Accepted"})
+    return JsonResponse(MPESA_ACCEPTED)
+
+# Payment status (polled by booking_confirmation after a payment is started)
+def _payment_status_wait(request):
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        wait = 0
+    return max(0.0, min(wait, payment_status.max_wait()))
+
+
+def _refresh_stale_mpesa_payment(payment):
+    # A lost Daraja callback would leave the guest waiting forever; after a grace period
+    # ask Daraja directly, at most once per period per payment across all workers.
+    grace = settings.PAYMENT_STATUS_MPESA_QUERY_AFTER_SECONDS
+    if grace <= 0 or payment.provider != 'MPESA' or payment.status != 'PENDING':
+        return
+    if (timezone.now() - payment.created_at).total_seconds() < grace:
+        return
+    if not cache.add(f"payment-status-query:{payment.id}", 1, grace):
+        return
+    query_response, query_error = _mpesa_query_stk_status(payment)
+    if not query_error:
+        _apply_mpesa_stk_query(payment, query_response)
+
+
+def _payment_status_data(booking_id, version):
+    payment = (
+        Payment.objects.select_related('booking').defer('raw_payload')
+        .filter(booking_id=booking_id).order_by('-id').first()
+    )
+    if payment is None:
+        booking = get_object_or_404(Booking.objects.only('id', 'status'), id=booking_id)
+        return {'booking_id': booking.id, 'booking_status': booking.status, 'payment': None, 'version': version}
+
+    _refresh_stale_mpesa_payment(payment)
+    return {
+        'booking_id': payment.booking_id,
+        'booking_status': payment.booking.status,
+        'payment': {
+            'id': payment.id,
+            'provider': payment.provider,
+            'status': payment.status,
+            'updated_at': payment.updated_at.isoformat(),
+        },
+        'version': version,
+    }
+
+
+def _payment_status_settled(data):
+    return data['payment'] is not None and data['payment']['status'] in payment_status.TERMINAL_STATUSES
+
+
+def _payment_status_response(data):
+    response = JsonResponse(data)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def payment_status_view(request, booking_id):
+    """Return the latest payment status for a booking.
+
+    With ``?since=<version>&wait=<seconds>`` the request is held (up to
+    payment_status.max_wait(), which is 0 under WSGI or with a per-process cache)
+    until that payment changes, so the confirmation page can long-poll instead of
+    reloading.
+    """
+    wait = _payment_status_wait(request)
+    since = request.GET.get('since')
+    version = payment_status.current_version(booking_id)
+    data = _payment_status_data(booking_id, version)
+    if wait and since == str(version) and not _payment_status_settled(data):
+        if payment_status.wait_for_change(booking_id, version, wait):
+            version = payment_status.current_version(booking_id)
+            data = _payment_status_data(booking_id, version)
+    return _payment_status_response(data)
+
 
 # Login view
+@concurrency_limit('auth')
 def login_view(request):
     if request.method == "POST":
         email = request.POST.get('login_email')
@@ -963,6 +1131,7 @@ def login_view(request):
     return render(request, 'login.html')
 
 # Register view
+@concurrency_limit('auth')
 def register_view(request):
     if request.method == "POST":
         name = request.POST.get('name')
@@ -1018,7 +1187,7 @@ def profile_view(request):
 @login_required(login_url='login')
 def my_bookings_view(request):
     _mark_completed_bookings()
-    bookings = Booking.objects.filter(user=request.user).select_related('room').order_by('-created_at')
+    bookings = archive.bookings_for_user(request.user)
     return render(request, 'my_bookings.html', {'bookings': bookings})
 
 
@@ -1047,6 +1216,17 @@ def admin_payments_view(request):
         new_status = request.POST.get('status')
         valid_statuses = {code for code, _ in Payment.STATUSES}
 
+        if action == "bulk_status":
+            payment_ids = [value for value in request.POST.getlist('payment_ids') if value.isdigit()]
+            if new_status not in valid_statuses or not payment_ids:
+                messages.error(request, "Select payments and a valid status.")
+                return redirect('admin_payments')
+            updated, moved = status_changes.set_payment_status(
+                Payment.objects.filter(id__in=payment_ids), new_status, request,
+            )
+            messages.success(request, f"{updated} payments updated to {new_status}; {moved} bookings changed.")
+            return redirect('admin_payments')
+
         payment = get_object_or_404(Payment, id=payment_id)
         if action == "query_mpesa":
             query_response, query_error = _mpesa_query_stk_status(payment)
@@ -1054,27 +1234,7 @@ def admin_payments_view(request):
                 messages.error(request, query_error)
                 return redirect('admin_payments')
 
-            existing_raw = payment.raw_response if isinstance(payment.raw_response, dict) else {}
-            updated_raw = dict(existing_raw)
-            updated_raw["stk_query"] = query_response
-
-            result_code = query_response.get("ResultCode")
-            result_code_str = str(result_code) if result_code is not None else ""
-            if result_code_str == "0":
-                payment.status = 'SUCCEEDED'
-                if payment.booking.status == 'PENDING':
-                    payment.booking.status = 'CONFIRMED'
-                    payment.booking.save(update_fields=['status', 'updated_at'])
-            elif result_code_str == "1032":
-                payment.status = 'CANCELLED'
-                if payment.booking.status in ['PENDING', 'CONFIRMED']:
-                    payment.booking.status = 'CANCELLED'
-                    payment.booking.save(update_fields=['status', 'updated_at'])
-            elif result_code_str in ['1', '1037', '2001']:
-                payment.status = 'FAILED'
-
-            payment.raw_response = updated_raw
-            payment.save(update_fields=['status', 'raw_response', 'updated_at'])
+            _apply_mpesa_stk_query(payment, query_response)
             messages.success(
                 request,
                 f"STK query complete for payment #{payment.id}. ResultCode: {query_response.get('ResultCode', 'N/A')}.",
@@ -1085,20 +1245,16 @@ def admin_payments_view(request):
             messages.error(request, "Invalid payment status selected.")
             return redirect('admin_payments')
 
-        payment.status = new_status
-        payment.save(update_fields=['status', 'updated_at'])
-
-        if new_status == 'SUCCEEDED' and payment.booking.status == 'PENDING':
-            payment.booking.status = 'CONFIRMED'
-            payment.booking.save(update_fields=['status', 'updated_at'])
-        elif new_status in ['CANCELLED', 'REFUNDED'] and payment.booking.status in ['PENDING', 'CONFIRMED']:
-            payment.booking.status = 'CANCELLED'
-            payment.booking.save(update_fields=['status', 'updated_at'])
-
+        # A staff correction of one payment; unlike the bulk actions it sends the guest no receipt.
+        status_changes.set_payment_status(Payment.objects.filter(id=payment.id), new_status)
         messages.success(request, f"Payment #{payment.id} updated to {new_status}.")
         return redirect('admin_payments')
 
-    payments = Payment.objects.select_related('booking', 'booking__room').order_by('-created_at')
+    payments = (
+        Payment.objects.select_related('booking', 'booking__room')
+        .defer('raw_response', 'raw_payload')
+        .order_by('-created_at')
+    )
     status_filter = request.GET.get('status')
     if status_filter:
         payments = payments.filter(status=status_filter)
@@ -1126,6 +1282,54 @@ def admin_booked_rooms_view(request):
 
     return render(request, 'admin_booked_rooms.html', {'bookings': bookings})
 
+@login_required(login_url='login')
+def admin_stats_view(request):
+    if not (request.user.is_staff or request.user.is_superuser):
+        messages.error(request, "You do not have permission to view this page.")
+        return redirect('index')
+
+    default_start, default_end = occupancy.trailing_months()
+    try:
+        start = exports.parse_date(request.GET.get('from')) or default_start
+        end = exports.parse_date(request.GET.get('to')) or default_end
+    except ValueError:
+        messages.error(request, "Dates must look like 2026-01-31.")
+        start, end = default_start, default_end
+    if end < start:
+        start, end = end, start
+    period = 'day' if request.GET.get('period') == 'day' else 'month'
+
+    rows, totals = occupancy.report(start, end, period)
+    return render(request, 'admin_stats.html', {
+        'rows': rows,
+        'totals': totals,
+        'start': start,
+        'end': end,
+        'period': period,
+    })
+
+@login_required(login_url='login')
+def admin_export_view(request, dataset, fmt):
+    if not (request.user.is_staff or request.user.is_superuser):
+        messages.error(request, "You do not have permission to view this page.")
+        return redirect('index')
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        return HttpResponseBadRequest("Unknown export.")
+
+    try:
+        columns = exports.resolve_columns(dataset, request.GET.getlist('column') or None)
+        queryset = exports.filter_queryset(
+            dataset,
+            date_from=exports.parse_date(request.GET.get('from')),
+            date_to=exports.parse_date(request.GET.get('to')),
+            statuses=request.GET.getlist('status') or None,
+            providers=request.GET.getlist('provider') or None,
+            include_archived=request.GET.get('archived') == '1',
+        )
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return exports.export_response(dataset, queryset, columns, fmt)
+
 # Room view (legacy, redirect to room_list)
 def room(request):
     return redirect('room_list')
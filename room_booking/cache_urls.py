@@ -0,0 +1,82 @@
+"""Django CACHES entries from CACHE_URL-style URLs.
+
+Shared by the settings and the benchmark_cache command, which measures extra URLs
+without configuring them.
+"""
+import os
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def cache_config_from_url(cache_url):
+    if not cache_url:
+        return {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+
+    parsed = urlparse(cache_url)
+    query = parse_qs(parsed.query)
+    scheme = parsed.scheme.lower()
+    if scheme == 'locmem':
+        config = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': parsed.netloc or parsed.path.lstrip('/'),
+        }
+    elif scheme == 'file':
+        # file:///absolute/dir or file://relative/dir
+        path = unquote(parsed.netloc + parsed.path)
+        config = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': path if os.path.isabs(path) else str(BASE_DIR / path),
+        }
+    elif scheme in ('memcached', 'pymemcache'):
+        config = {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': parsed.netloc.split(','),
+        }
+    elif scheme in ('redis', 'rediss'):
+        config = {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': cache_url.split('?', 1)[0],
+        }
+    elif scheme == 'db':
+        # db://table_name; create the table with `python manage.py createcachetable`.
+        config = {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': parsed.netloc or parsed.path.lstrip('/') or 'django_cache',
+        }
+    elif scheme == 'dummy':
+        config = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    else:
+        raise ValueError(f"Unsupported CACHE_URL scheme: {parsed.scheme!r}")
+
+    if query.get('timeout'):
+        timeout = query['timeout'][0]
+        config['TIMEOUT'] = None if timeout.lower() == 'none' else int(timeout)
+    if query.get('max_entries'):
+        config['OPTIONS'] = {'MAX_ENTRIES': int(query['max_entries'][0])}
+    if query.get('key_prefix'):
+        config['KEY_PREFIX'] = query['key_prefix'][0]
+    if query.get('version'):
+        config['VERSION'] = int(query['version'][0])
+    return config
+
+
+# Each named cache reads CACHE_URL_<NAME> and falls back to CACHE_URL. Caches that share
+# a server are kept apart by key prefix ("<CACHE_KEY_PREFIX>:<name>").
+CACHE_NAMES = ('default', 'sessions', 'ratelimit', 'pages')
+
+
+def caches_from_env(names=CACHE_NAMES):
+    shared_url = os.getenv('CACHE_URL', '')
+    deployment_prefix = os.getenv('CACHE_KEY_PREFIX', 'royal-hotel')
+    version = int(os.getenv('CACHE_VERSION', '1'))
+    caches = {}
+    for name in names:
+        config = cache_config_from_url(os.getenv(f'CACHE_URL_{name.upper()}', shared_url))
+        if config['BACKEND'].endswith('LocMemCache') and not config.get('LOCATION'):
+            config['LOCATION'] = name
+        config.setdefault('KEY_PREFIX', f'{deployment_prefix}:{name}')
+        config.setdefault('VERSION', version)
+        caches[name] = config
+    return caches
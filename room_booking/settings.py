@@ -11,10 +11,13 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 import importlib.util
 from urllib.parse import urlparse, parse_qs, unquote
 
+from room_booking.cache_urls import caches_from_env
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -35,13 +38,16 @@ def _load_dotenv(dotenv_path):
 
 _load_dotenv(BASE_DIR / ".env")
 
-def _env_bool(name, default=False):
-    value = os.getenv(name)
-    if value is None:
+def _parse_bool(value, default=False):
+    if value is None or value.strip() == '':
         return default
     return value.strip().lower() in ("1", "true", "yes", "on")
 
 
+def _env_bool(name, default=False):
+    return _parse_bool(os.getenv(name), default)
+
+
 def _env_csv(name, default=""):
     raw = os.getenv(name, default)
     return [part.strip() for part in raw.split(",") if part.strip()]
@@ -94,8 +100,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'booking.middleware.TrafficCaptureMiddleware',
+    'booking.middleware.ResponseCompressionMiddleware',
+    'booking.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'booking.middleware.RateLimitMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -123,19 +133,85 @@ WSGI_APPLICATION = 'room_booking.wsgi.application'
 
 
 # Database
+def _query_or_env(query, key, env_name, default=None):
+    if query.get(key):
+        return query[key][0]
+    return os.getenv(env_name, default)
+
+
+def _postgres_pool_options(query):
+    # psycopg3 connection pool (Django 5.1+). Keys map to psycopg_pool.ConnectionPool kwargs.
+    if not _parse_bool(_query_or_env(query, 'pool', 'DATABASE_POOL')):
+        return None
+    pool = {}
+    for key, cast in (
+        ('min_size', int),
+        ('max_size', int),
+        ('timeout', float),
+        ('max_idle', float),
+        ('max_lifetime', float),
+    ):
+        value = _query_or_env(query, f'pool_{key}', f'DATABASE_POOL_{key.upper()}')
+        if value not in (None, ''):
+            pool[key] = cast(value)
+    return pool or True
+
+
+# Applied on every new SQLite connection by the "production" profile. WAL lets readers
+# run alongside the single writer, and busy_timeout makes writers queue instead of failing.
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 134217728,
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+}
+
+
+def _sqlite_config(parsed=None):
+    query = parse_qs(parsed.query) if parsed else {}
+    name = BASE_DIR / 'db.sqlite3'
+    if parsed and parsed.path not in ('', '/'):
+        # sqlite:///relative/path.db or sqlite:////absolute/path.db
+        path = unquote(parsed.path[1:])
+        name = Path(path) if os.path.isabs(path) else BASE_DIR / path
+
+    config = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+    }
+    profile = _query_or_env(query, 'profile', 'SQLITE_PROFILE', 'default').strip().lower()
+    if profile != 'production':
+        return config
+
+    pragmas = dict(SQLITE_PRODUCTION_PRAGMAS)
+    for key in pragmas:
+        value = _query_or_env(query, key, f'SQLITE_{key.upper()}')
+        if value not in (None, ''):
+            pragmas[key] = value
+    config['OPTIONS'] = {
+        'timeout': int(pragmas['busy_timeout']) / 1000,
+        'init_command': ';'.join(f'PRAGMA {key}={value}' for key, value in pragmas.items()),
+        # Take the write lock up front so a read-then-write transaction can wait on
+        # busy_timeout instead of failing with "database is locked" on upgrade.
+        'transaction_mode': 'IMMEDIATE',
+    }
+    # Keep connections (and their pragmas / page cache) across requests.
+    config['CONN_MAX_AGE'] = int(_query_or_env(query, 'conn_max_age', 'DATABASE_CONN_MAX_AGE', '60'))
+    config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
 def _database_config_from_url(database_url):
     if not database_url:
-        return {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
-        }
+        return _sqlite_config()
 
     parsed = urlparse(database_url)
+    if parsed.scheme == 'sqlite':
+        return _sqlite_config(parsed)
     if parsed.scheme not in ('postgres', 'postgresql'):
-        return {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
-        }
+        return _sqlite_config()
 
     query = parse_qs(parsed.query)
     options = {}
@@ -144,6 +220,25 @@ def _database_config_from_url(database_url):
     if query.get('channel_binding'):
         options['channel_binding'] = query['channel_binding'][0]
 
+    connect_timeout = _query_or_env(query, 'connect_timeout', 'DATABASE_CONNECT_TIMEOUT')
+    if connect_timeout:
+        options['connect_timeout'] = int(connect_timeout)
+    application_name = _query_or_env(query, 'application_name', 'DATABASE_APPLICATION_NAME', 'royal-hotel')
+    if application_name:
+        options['application_name'] = application_name
+    statement_timeout = _query_or_env(query, 'statement_timeout', 'DATABASE_STATEMENT_TIMEOUT')
+    if statement_timeout:
+        options['options'] = f"-c statement_timeout={int(statement_timeout)}"
+
+    # Pooled connections are handed back to the pool at the end of each request,
+    # so Django refuses to combine them with persistent connections.
+    pool = _postgres_pool_options(query)
+    if pool:
+        options['pool'] = pool
+        conn_max_age = 0
+    else:
+        conn_max_age = int(_query_or_env(query, 'conn_max_age', 'DATABASE_CONN_MAX_AGE', '60'))
+
     config = {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': unquote(parsed.path.lstrip('/')),
@@ -151,15 +246,84 @@ def _database_config_from_url(database_url):
         'PASSWORD': unquote(parsed.password or ''),
         'HOST': parsed.hostname or '',
         'PORT': str(parsed.port or '5432'),
+        'CONN_MAX_AGE': conn_max_age,
+        'CONN_HEALTH_CHECKS': _parse_bool(
+            _query_or_env(query, 'conn_health_checks', 'DATABASE_CONN_HEALTH_CHECKS'), default=True
+        ),
+        # Transaction-mode poolers such as PgBouncer (Neon "-pooler" hosts) break server-side cursors.
+        'DISABLE_SERVER_SIDE_CURSORS': _parse_bool(
+            _query_or_env(query, 'disable_server_side_cursors', 'DATABASE_DISABLE_SERVER_SIDE_CURSORS'),
+            default='-pooler' in (parsed.hostname or ''),
+        ),
     }
     if options:
         config['OPTIONS'] = options
     return config
 
 
+def _replica_databases(replica_urls):
+    replicas = {}
+    for index, url in enumerate(replica_urls, start=1):
+        config = _database_config_from_url(url)
+        if config['ENGINE'] != 'django.db.backends.postgresql':
+            continue
+        # Tests run against the primary; replicas only mirror it.
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica_{index}'] = config
+    return replicas
+
+
 DATABASES = {
     'default': _database_config_from_url(os.getenv('DATABASE_URL')),
 }
+DATABASES.update(_replica_databases(_env_csv('DATABASE_REPLICA_URLS')))
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['booking.db_routers.ReplicaRouter'] if DATABASE_REPLICAS else []
+
+# Read-only views whose queries may be served by a replica, and how long a client
+# stays pinned to the primary after it has written something.
+REPLICA_READ_URL_NAMES = _env_csv('REPLICA_READ_URL_NAMES', default='index,room_list,room_detail')
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '15'))
+
+# Minimum seconds between the CONFIRMED -> COMPLETED sweeps the public views trigger.
+BOOKING_COMPLETION_SWEEP_SECONDS = int(os.getenv('BOOKING_COMPLETION_SWEEP_SECONDS', '60'))
+
+# archive_history moves completed/cancelled bookings this many days past check-out.
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '365'))
+# compact_payment_payloads summarizes and compresses settled payment payloads after this many days.
+PAYMENT_RAW_RETENTION_DAYS = int(os.getenv('PAYMENT_RAW_RETENTION_DAYS', '90'))
+# Nights ahead that NightlyRate is materialized for; later nights are priced from the rules directly.
+RATE_CALENDAR_DAYS = int(os.getenv('RATE_CALENDAR_DAYS', '365'))
+
+
+# Cache: CACHE_URL and CACHE_URL_<NAME>, see room_booking/cache_urls.py.
+CACHES = caches_from_env()
+CACHE_MIDDLEWARE_ALIAS = 'pages'
+
+
+# Sessions and messages
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES.get(
+    os.getenv('SESSION_BACKEND', 'db').strip().lower(),
+    'django.contrib.sessions.backends.db',
+)
+
+SESSION_CACHE_ALIAS = 'sessions'
+
+MESSAGE_STORAGES = {
+    'fallback': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    'cookie': 'django.contrib.messages.storage.cookie.CookieStorage',
+    'session': 'django.contrib.messages.storage.session.SessionStorage',
+}
+MESSAGE_STORAGE = MESSAGE_STORAGES.get(
+    os.getenv('MESSAGE_STORAGE', 'fallback').strip().lower(),
+    'django.contrib.messages.storage.fallback.FallbackStorage',
+)
 
 
 # Password validation
@@ -202,9 +366,20 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'), 
 ]
 
+STATICFILES_FINDERS = [
+    'django.contrib.staticfiles.finders.FileSystemFinder',
+    'django.contrib.staticfiles.finders.AppDirectoriesFinder',
+    'booking.assets.BundleFinder',
+]
+
+# base.html links the CSS/JS bundles of booking/assets.py instead of the individual files.
+ASSET_BUNDLES = _env_bool('ASSET_BUNDLES', default=not DEBUG)
+ASSET_BUILD_DIR = os.getenv('ASSET_BUILD_DIR', str(BASE_DIR / 'assets_build'))
+
 WHITENOISE_AVAILABLE = importlib.util.find_spec("whitenoise") is not None
 if WHITENOISE_AVAILABLE:
-    MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+    # WhiteNoiseMiddleware that does not push async requests through a thread.
+    MIDDLEWARE.insert(1, 'booking.middleware.StaticFilesMiddleware')
 
 if not DEBUG:
     SECURE_SSL_REDIRECT = _env_bool("SECURE_SSL_REDIRECT", default=True)
@@ -216,18 +391,48 @@ if not DEBUG:
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-if WHITENOISE_AVAILABLE:
-    STORAGES = {
-        "default": {
-            "BACKEND": "django.core.files.storage.FileSystemStorage",
-        },
-        "staticfiles": {
-            "BACKEND": "whitenoise.storage.CompressedStaticFilesStorage",
-        },
-    }
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Generated invoice PDFs, content-addressed by booking fields (see booking/invoices.py).
+INVOICE_CACHE_DIR = os.getenv('INVOICE_CACHE_DIR', str(BASE_DIR / 'invoice_cache'))
+
+# Resized room images, content-addressed by the upload (see booking/images.py).
+ROOM_IMAGE_CACHE_DIR = os.getenv('ROOM_IMAGE_CACHE_DIR', str(BASE_DIR / 'room_image_cache'))
+
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    "invoices": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": INVOICE_CACHE_DIR},
+    },
+    "room_images": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": ROOM_IMAGE_CACHE_DIR},
+    },
+}
+if not DEBUG:
+    # Content-hashed names (served immutable by WhiteNoise); needs collectstatic before starting.
+    STORAGES["staticfiles"]["BACKEND"] = "booking.assets.ManifestStorage"
+elif WHITENOISE_AVAILABLE:
+    STORAGES["staticfiles"]["BACKEND"] = "whitenoise.storage.CompressedStaticFilesStorage"
+
+# HTML minification and gzip/brotli for dynamic responses (booking/compression.py)
+HTML_MINIFY = _env_bool("HTML_MINIFY", default=True)
+RESPONSE_COMPRESSION = _env_bool("RESPONSE_COMPRESSION", default=True)
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "500"))
+
+# Traffic capture (sanitized request metadata for load-test replay)
+TRAFFIC_CAPTURE_ENABLED = _env_bool("TRAFFIC_CAPTURE_ENABLED", default=False)
+TRAFFIC_CAPTURE_DIR = os.getenv("TRAFFIC_CAPTURE_DIR", str(BASE_DIR / "traffic"))
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv("TRAFFIC_CAPTURE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRAFFIC_CAPTURE_BACKUPS = int(os.getenv("TRAFFIC_CAPTURE_BACKUPS", "5"))
+
 # Email (console backend for development)
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'royal-hotel@example.com')
@@ -235,6 +440,44 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'royal-hotel@example.com')
 # Payments (use environment variables for real credentials)
 DEFAULT_CURRENCY = os.getenv('DEFAULT_CURRENCY', 'KES')
 
+# Serve the provider-facing payment views from booking.async_views. Only worth enabling
+# when running under ASGI (uvicorn); under WSGI each async view runs in its own loop.
+ASYNC_PAYMENT_VIEWS = _env_bool('ASYNC_PAYMENT_VIEWS', default=False)
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', '200'))
+
+# Long-poll payment status endpoint used by the booking confirmation page.
+PAYMENT_STATUS_MAX_WAIT_SECONDS = float(os.getenv('PAYMENT_STATUS_MAX_WAIT_SECONDS', '25'))
+PAYMENT_STATUS_POLL_SECONDS = float(os.getenv('PAYMENT_STATUS_POLL_SECONDS', '1'))
+# How often the page asks again when requests are not held (WSGI, or a per-process cache).
+PAYMENT_STATUS_CLIENT_POLL_SECONDS = float(os.getenv('PAYMENT_STATUS_CLIENT_POLL_SECONDS', '3'))
+PAYMENT_STATUS_VERSION_TTL = int(os.getenv('PAYMENT_STATUS_VERSION_TTL', str(24 * 60 * 60)))
+PAYMENT_STATUS_MPESA_QUERY_AFTER_SECONDS = int(os.getenv('PAYMENT_STATUS_MPESA_QUERY_AFTER_SECONDS', '90'))
+
+# Rate limits for unsafe requests, per URL name: {key: 'count/period'} with keys ip,
+# session and email. RATE_LIMITS in the environment (JSON) replaces entries by URL name.
+RATE_LIMIT_ENABLED = _env_bool('RATE_LIMIT_ENABLED', default=True)
+RATE_LIMIT_CACHE_ALIAS = 'ratelimit'
+RATE_LIMIT_PROXY_COUNT = int(os.getenv('RATE_LIMIT_PROXY_COUNT', '0'))
+RATE_LIMITS = {
+    'booking': {'ip': '20/h', 'session': '10/h', 'email': '5/h'},
+    'login': {'ip': '30/10m', 'email': '10/10m'},
+    'register': {'ip': '10/h'},
+    'contact': {'ip': '10/h'},
+    'mpesa_stk_push': {'ip': '10/10m', 'session': '5/10m'},
+    'stripe_create_intent': {'ip': '20/10m', 'session': '10/10m'},
+    'paypal_create_order': {'ip': '20/10m', 'session': '10/10m'},
+}
+RATE_LIMITS.update(json.loads(os.getenv('RATE_LIMITS') or '{}'))
+
+# Per-process caps on views that block on providers or password hashing. Requests over
+# the cap wait CONCURRENCY_LIMIT_WAIT_SECONDS for a slot and then get a 503.
+CONCURRENCY_LIMITS = {
+    'payments': int(os.getenv('CONCURRENCY_LIMIT_PAYMENTS', '16')),
+    'auth': int(os.getenv('CONCURRENCY_LIMIT_AUTH', '4')),
+}
+CONCURRENCY_LIMIT_WAIT_SECONDS = float(os.getenv('CONCURRENCY_LIMIT_WAIT_SECONDS', '2'))
+
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com').rstrip('/')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
@@ -0,0 +1,18 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Reload the changelist when an autocomplete list filter is picked or cleared.
+    $(function() {
+        $('.autocomplete-list-filter select').on('change', function() {
+            const container = this.closest('.autocomplete-list-filter');
+            const params = new URLSearchParams(container.dataset.queryString);
+            if (this.value) {
+                params.set(container.dataset.parameter, this.value);
+            } else {
+                params.delete(container.dataset.parameter);
+            }
+            window.location.search = params.toString();
+        });
+    });
+}